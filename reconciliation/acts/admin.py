@@ -1,5 +1,58 @@
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Act, Store, Summary, Supply, Transaction
+from .forms import ActBatchForm
+from .jobs import enqueue
+from .models import Act, Job, Store, Summary, Supply, Transaction
 
-admin.site.register((Supply, Transaction, Store, Summary, Act))
+admin.site.register((Supply, Transaction, Summary, Act))
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("pk", "kind", "status", "attempts", "created", "finished")
+    list_filter = ("kind", "status")
+
+
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    actions = ["generate_acts"]
+
+    @admin.action(description="Сформировать акты сверки за период (ZIP в фоне)")
+    def generate_acts(self, request, queryset):
+        form = ActBatchForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            job = enqueue(
+                "generate_acts",
+                {
+                    "period_start": form.cleaned_data["period_start"].isoformat(),
+                    "period_end": form.cleaned_data["period_end"].isoformat(),
+                    "store_ids": list(queryset.values_list("pk", flat=True)),
+                },
+                user=request.user,
+            )
+            self.message_user(
+                request,
+                format_html(
+                    'Акты формируются в фоне: <a href="{}">задача {}</a>',
+                    reverse("job_detail", kwargs={"pk": job.pk}),
+                    job.pk,
+                ),
+            )
+            return
+
+        return TemplateResponse(
+            request,
+            "admin/acts/store/generate_acts.html",
+            {
+                **self.admin_site.each_context(request),
+                "title": "Акты сверки за период",
+                "opts": self.model._meta,
+                "form": form,
+                "stores": queryset,
+                "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            },
+        )
@@ -0,0 +1,417 @@
+import heapq
+from bisect import bisect_left
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import DateField, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .balances import closing_dates, to_decimal
+from .models import (
+    ArchivedSupply,
+    ArchivedTransaction,
+    PaymentAllocation,
+    Store,
+    Supply,
+    Transaction,
+)
+
+# Название корзины и верхняя граница возраста долга в днях.
+AGING_BUCKETS = (
+    ("0–30", 30),
+    ("31–60", 60),
+    ("61–90", 90),
+    ("90+", None),
+)
+_BUCKET_LIMITS = [limit for _, limit in AGING_BUCKETS if limit is not None]
+
+
+class SupplyDebt:
+    __slots__ = ("pk", "date", "price", "outstanding", "paid_date")
+
+    def __init__(self, pk, date, price):
+        self.pk = pk
+        self.date = date
+        self.price = price
+        self.outstanding = price
+        self.paid_date = None
+
+
+class FifoAllocation:
+    __slots__ = ("lines", "allocations", "credit")
+
+    def __init__(self, lines, allocations, credit):
+        self.lines = lines
+        self.allocations = allocations
+        self.credit = credit
+
+
+def allocate_fifo(supplies, payments, unpaid=(), advances=()):
+    """
+    FIFO-разнесение поступлений магазина по его поставкам.
+
+    ``supplies`` и ``payments`` — последовательности ``(pk, date, amount)``,
+    упорядоченные по дате и pk. Потоки сливаются за один проход: поставки
+    дня идут раньше поступлений того же дня, поступление гасит самые старые
+    непогашенные поставки, а излишек остается авансом и гасит следующие.
+    Разнесения — кортежи ``(supply_pk, transaction_pk, amount)``.
+
+    ``unpaid`` (``SupplyDebt``) и ``advances`` (``(transaction_pk, amount)``)
+    задают состояние на начало потоков, когда разносится только хвост.
+    """
+    lines = list(unpaid)
+    allocations = []
+    unpaid = deque(unpaid)
+    advances = deque([pk, amount] for pk, amount in advances)
+    supplies = iter(supplies)
+    payments = iter(payments)
+    supply = next(supplies, None)
+    payment = next(payments, None)
+
+    while supply is not None or payment is not None:
+        if payment is None or (supply is not None and supply[1] <= payment[1]):
+            line = SupplyDebt(*supply)
+            lines.append(line)
+            while line.outstanding > 0 and advances:
+                advance = advances[0]
+                amount = min(advance[1], line.outstanding)
+                line.outstanding -= amount
+                advance[1] -= amount
+                allocations.append((line.pk, advance[0], amount))
+                if not advance[1]:
+                    advances.popleft()
+            if line.outstanding > 0:
+                unpaid.append(line)
+            else:
+                line.paid_date = line.date
+            supply = next(supplies, None)
+        else:
+            transaction_pk, day, remaining = payment
+            while remaining > 0 and unpaid:
+                line = unpaid[0]
+                amount = min(remaining, line.outstanding)
+                line.outstanding -= amount
+                remaining -= amount
+                allocations.append((line.pk, transaction_pk, amount))
+                if not line.outstanding:
+                    line.paid_date = day
+                    unpaid.popleft()
+            if remaining > 0:
+                advances.append([transaction_pk, remaining])
+            payment = next(payments, None)
+
+    credit = sum(advance[1] for advance in advances)
+    return FifoAllocation(lines, allocations, credit)
+
+
+LEDGER_STREAM_SQL = """
+SELECT store_id, {pk}, date, CAST(ROUND(price * 100) AS BIGINT)
+FROM {table}
+WHERE {where}
+ORDER BY store_id, date, {pk}
+"""
+
+_date_field = DateField()
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _store_groups(model, archive, as_of, store_ids, chunk_size):
+    quote = connection.ops.quote_name
+    where, params = ["1 = 1"], []
+    if as_of is not None:
+        where.append("date <= %s")
+        params.append(connection.ops.adapt_datefield_value(as_of))
+    if store_ids is not None:
+        store_ids = list(store_ids) or [None]
+        where.append(f"store_id IN ({', '.join(['%s'] * len(store_ids))})")
+        params.extend(store_ids)
+    # Дат в леджере немного, разбор каждой кэшируется.
+    days = {}
+
+    def rows(table):
+        sql = LEDGER_STREAM_SQL.format(
+            pk=quote(table._meta.pk.column),
+            table=quote(table._meta.db_table),
+            where=" AND ".join(where),
+        )
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while chunk := cursor.fetchmany(chunk_size):
+                for store_id, pk, day, cents in chunk:
+                    if day not in days:
+                        days[day] = _date_field.to_python(day)
+                    yield store_id, pk, days[day], cents
+
+    # Архив закрытых периодов читается отдельным потоком по своему индексу
+    # и сливается с основным в том же порядке (магазин, дата, id).
+    merged = heapq.merge(
+        rows(model), rows(archive), key=lambda row: (row[0], row[2], row[1])
+    )
+    for store_id, group in groupby(merged, key=itemgetter(0)):
+        yield store_id, [row[1:] for row in group]
+
+
+def iter_store_allocations(as_of=None, store_ids=None, chunk_size=5000):
+    """
+    FIFO-разнесение для всех магазинов одним пакетом, суммы в копейках.
+
+    Поставки и поступления читаются двумя потоками в порядке
+    (магазин, дата, id) по индексам ``*_store_date_id_idx`` и сливаются по
+    магазинам, без запросов на каждый магазин. Выдает пары
+    ``(store_id, FifoAllocation)``.
+    """
+    supply_groups = _store_groups(Supply, ArchivedSupply, as_of, store_ids, chunk_size)
+    payment_groups = _store_groups(
+        Transaction, ArchivedTransaction, as_of, store_ids, chunk_size
+    )
+    supply = next(supply_groups, None)
+    payment = next(payment_groups, None)
+    while supply is not None or payment is not None:
+        store_id = min(group[0] for group in (supply, payment) if group is not None)
+        store_supplies = store_payments = ()
+        if supply is not None and supply[0] == store_id:
+            store_supplies = supply[1]
+            supply = next(supply_groups, None)
+        if payment is not None and payment[0] == store_id:
+            store_payments = payment[1]
+            payment = next(payment_groups, None)
+        yield store_id, allocate_fifo(store_supplies, store_payments)
+
+
+OPEN_ITEM_UPDATE_SQL = """
+UPDATE {table}
+SET {outstanding} = %s, {paid_date} = %s
+WHERE {id} = %s
+"""
+
+RELEASE_SQL = """
+UPDATE {table}
+SET {outstanding} = {outstanding} + %s, {paid_date} = NULL
+WHERE {id} = %s
+"""
+
+ALLOCATION_INSERT_SQL = """
+INSERT INTO {table} ({supply}, {transaction}, {amount})
+VALUES (%s, %s, %s)
+"""
+
+
+def _format_sql(template, model, *fields):
+    quote = connection.ops.quote_name
+    opts = model._meta
+    return template.format(
+        table=quote(opts.db_table),
+        **{name: quote(opts.get_field(name).column) for name in fields},
+    )
+
+
+def _save_open_items(lines, allocations, stored=None, batch_size=2000):
+    # bulk_update строит CASE по всем pk пачки, а bulk_create собирает
+    # экземпляры моделей; построчные UPDATE и INSERT через executemany на
+    # хвостах в десятки тысяч строк в разы быстрее.
+    stored = stored or {}
+    adapt_date = connection.ops.adapt_datefield_value
+    update = _format_sql(OPEN_ITEM_UPDATE_SQL, Supply, "outstanding", "paid_date", "id")
+    insert = _format_sql(
+        ALLOCATION_INSERT_SQL, PaymentAllocation, "supply", "transaction", "amount"
+    )
+    changed = [
+        (line.outstanding, adapt_date(line.paid_date), line.pk)
+        for line in lines
+        if stored.get(line.pk) != (line.outstanding, line.paid_date)
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(changed), batch_size):
+            cursor.executemany(update, changed[start : start + batch_size])
+        for start in range(0, len(allocations), batch_size):
+            cursor.executemany(insert, allocations[start : start + batch_size])
+
+
+def reallocate_stores(store_ids=None):
+    """
+    Полный пересчет открытых позиций: остатков поставок, дат оплаты и
+    разнесений платежей. Нужен после bulk_create, который не шлет сигналы.
+
+    У магазинов с закрытым периодом пересчитывается только открытый
+    период: разнесения на архивные строки не хранятся.
+    """
+    closed = closing_dates(store_ids)
+    open_ids = store_ids
+    if store_ids is not None:
+        open_ids = [store_id for store_id in store_ids if store_id not in closed]
+    allocations = PaymentAllocation.objects.exclude(
+        Q(supply__store_id__in=closed) | Q(transaction__store_id__in=closed)
+    )
+    if open_ids is not None:
+        allocations = allocations.filter(
+            Q(supply__store_id__in=open_ids) | Q(transaction__store_id__in=open_ids)
+        )
+    with transaction.atomic():
+        allocations.delete()
+        for store_id, result in iter_store_allocations(store_ids=open_ids):
+            if store_id in closed:
+                continue
+            for line in result.lines:
+                line.outstanding = from_cents(line.outstanding)
+            _save_open_items(
+                result.lines,
+                [
+                    (supply_pk, transaction_pk, from_cents(amount))
+                    for supply_pk, transaction_pk, amount in result.allocations
+                ],
+            )
+        for store_id, closed_through in closed.items():
+            reallocate_store(store_id, closed_through + timedelta(days=1))
+
+
+def release_allocations(allocations):
+    """
+    Удаление разнесений с возвратом их сумм в остатки поставок.
+
+    Поставка снова считается открытой, поэтому сохраненные остатки всегда
+    равны сумме поставки за вычетом оставшихся разнесений.
+    """
+    sql = _format_sql(RELEASE_SQL, Supply, "outstanding", "paid_date", "id")
+    returned = list(
+        allocations.values("supply")
+        .annotate(total=Sum("amount"))
+        .values_list("total", "supply")
+    )
+    if not returned:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, returned)
+    allocations.delete()
+
+
+def reallocate_store(store_id, since):
+    """
+    Переразнесение хвоста леджера магазина начиная с даты ``since``.
+
+    Разнесения, где поставка или платеж не раньше ``since``, снимаются.
+    Очередь открытых поставок до ``since`` читается по частичному индексу и
+    только пока ее хватает на платежи хвоста, авансы берутся с конца
+    платежей до ``since``. Более ранняя история не читается.
+    """
+    supplies = Supply.objects.filter(store_id=store_id)
+    payments = Transaction.objects.filter(store_id=store_id)
+    tail_supplies = supplies.filter(date__gte=since)
+    tail_payments = payments.filter(date__gte=since)
+    with transaction.atomic():
+        release_allocations(
+            PaymentAllocation.objects.filter(transaction__in=tail_payments)
+        )
+        PaymentAllocation.objects.filter(supply__in=tail_supplies).delete()
+
+        supply_rows = list(
+            tail_supplies.order_by("date", "pk").values_list(
+                "pk", "date", "price", "outstanding", "paid_date"
+            )
+        )
+        payment_rows = list(
+            tail_payments.order_by("date", "pk").values_list("pk", "date", "price")
+        )
+        unpaid = _open_supplies(
+            supplies.filter(date__lt=since),
+            sum(price for _, _, price in payment_rows if price > 0),
+        )
+        # Переписываются только поставки, у которых изменилось состояние.
+        stored = {line.pk: (line.outstanding, None) for line in unpaid}
+        stored.update((row[0], row[3:]) for row in supply_rows)
+        result = allocate_fifo(
+            [row[:3] for row in supply_rows],
+            payment_rows,
+            unpaid=unpaid,
+            advances=_open_advances(payments.filter(date__lt=since)),
+        )
+        _save_open_items(result.lines, result.allocations, stored)
+
+
+def _open_supplies(supplies, budget):
+    # Платежи хвоста гасят только начало очереди, дальше остатки не меняются.
+    rows = (
+        supplies.filter(outstanding__gt=0)
+        .order_by("date", "pk")
+        .values_list("pk", "date", "price", "outstanding")
+    )
+    unpaid = []
+    queued = 0
+    for pk, day, price, outstanding in rows.iterator(chunk_size=100):
+        if queued >= budget:
+            break
+        line = SupplyDebt(pk, day, price)
+        line.outstanding = outstanding
+        unpaid.append(line)
+        queued += outstanding
+    return unpaid
+
+
+def _open_advances(payments):
+    # Аванс — хвост очереди платежей: идем от последнего платежа назад,
+    # пока не встретится полностью разнесенный.
+    allocated = PaymentAllocation.objects.filter(transaction=OuterRef("pk"))
+    rows = (
+        payments.order_by("-date", "-pk")
+        .annotate(
+            allocated=Coalesce(
+                Subquery(
+                    allocated.values("transaction")
+                    .annotate(total=Sum("amount"))
+                    .values("total")
+                ),
+                Value(0, output_field=DecimalField()),
+            )
+        )
+        .values_list("pk", "price", "allocated")
+    )
+    advances = []
+    for pk, price, allocated in rows.iterator(chunk_size=100):
+        if price <= 0:
+            continue
+        remaining = price - to_decimal(allocated)
+        if remaining <= 0:
+            break
+        advances.append((pk, remaining))
+    advances.reverse()
+    return advances
+
+
+class AgingRow:
+    __slots__ = ("store_id", "name", "buckets", "total", "credit")
+
+    def __init__(self, store_id, name, buckets, credit):
+        self.store_id = store_id
+        self.name = name
+        self.buckets = [from_cents(amount) for amount in buckets]
+        self.total = from_cents(sum(buckets))
+        self.credit = from_cents(credit)
+
+
+def aging_bucket(days):
+    return bisect_left(_BUCKET_LIMITS, days)
+
+
+def aging_report(as_of, store_ids=None):
+    """
+    Непогашенные поставки магазинов на дату ``as_of`` по корзинам возраста
+    ``AGING_BUCKETS``. Магазины без долга и аванса в отчет не попадают.
+    """
+    names = dict(Store.objects.values_list("pk", "name"))
+    rows = []
+    for store_id, allocation in iter_store_allocations(as_of, store_ids):
+        buckets = [0] * len(AGING_BUCKETS)
+        for line in allocation.lines:
+            if line.outstanding > 0:
+                buckets[aging_bucket((as_of - line.date).days)] += line.outstanding
+        row = AgingRow(store_id, names.get(store_id, ""), buckets, allocation.credit)
+        if row.total or row.credit:
+            rows.append(row)
+    rows.sort(key=lambda row: (-row.total, row.name))
+    return rows
@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .balances import balance_annotations, refresh_summary_lines
+from .closing import ClosedPeriodError
+from .engine import ActStatement
+from .forms import LedgerFilterForm, SupplyFilterForm
+from .importers import LedgerImporter, LedgerImportError
+from .models import Act, Store, Summary, SummaryLine, Supply, Transaction
+from .serializers import (
+    ActSerializer,
+    ActStatementSerializer,
+    StoreSerializer,
+    SummarySerializer,
+    SupplySerializer,
+    TransactionSerializer,
+)
+
+
+class LedgerViewSet(viewsets.ModelViewSet):
+    keyset = ("date", "pk")
+    importer_kind = None
+    filter_form_class = LedgerFilterForm
+
+    def get_queryset(self):
+        form = self.filter_form_class(self.request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        return form.filter(self.model.objects.select_related("store"))
+
+    def handle_exception(self, exc):
+        # Запрет на изменение закрытого периода приходит из сигналов модели.
+        if isinstance(exc, ClosedPeriodError):
+            exc = ValidationError(exc.messages)
+        return super().handle_exception(exc)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Пакетная загрузка: массив объектов с полями как в файле импорта.
+
+        Строки проверяются и пишутся тем же ``LedgerImporter``, что и при
+        загрузке файла: пачками, с дедупликацией и одним пересчетом
+        балансов в конце.
+        """
+        rows = request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError("Ожидается массив объектов")
+        if len(rows) > settings.API_BULK_MAX_ROWS:
+            raise ValidationError(
+                f"Не больше {settings.API_BULK_MAX_ROWS} строк за один запрос"
+            )
+        if not rows:
+            return Response({"rows": 0, "imported": 0, "skipped": 0, "errors": []})
+
+        columns = sorted({key for row in rows for key in row})
+        try:
+            report = LedgerImporter(self.importer_kind).run(
+                [columns, *([row.get(name) for name in columns] for row in rows)]
+            )
+        except LedgerImportError as error:
+            raise ValidationError(str(error))
+
+        return Response(
+            {
+                "rows": report.rows,
+                "imported": report.imported,
+                "skipped": report.skipped,
+                "error_count": report.error_count,
+                # Номер строки в отчете импорта считает заголовок первой.
+                "errors": [
+                    {"index": line - 2, "message": message}
+                    for line, message in report.errors
+                ],
+            },
+            status=(
+                status.HTTP_400_BAD_REQUEST
+                if report.error_count and not report.imported
+                else status.HTTP_200_OK
+            ),
+        )
+
+
+class SupplyViewSet(LedgerViewSet):
+    model = Supply
+    serializer_class = SupplySerializer
+    importer_kind = "supply"
+    filter_form_class = SupplyFilterForm
+
+
+class TransactionViewSet(LedgerViewSet):
+    model = Transaction
+    serializer_class = TransactionSerializer
+    importer_kind = "transaction"
+
+
+class StoreViewSet(viewsets.ModelViewSet):
+    serializer_class = StoreSerializer
+
+    def get_queryset(self):
+        return Store.objects.annotate(**balance_annotations())
+
+
+class ActViewSet(viewsets.ModelViewSet):
+    serializer_class = ActSerializer
+    queryset = Act.objects.select_related("store")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        store = self.request.query_params.get("store")
+        if store and store.isdigit():
+            queryset = queryset.filter(store_id=store)
+        return queryset
+
+    @action(detail=True)
+    def statement(self, request, pk=None):
+        act = self.get_object()
+        statement = ActStatement(act.store, act.period_start, act.period_end)
+        return Response(
+            {"act": ActSerializer(act).data, **ActStatementSerializer(statement).data}
+        )
+
+
+class SummaryViewSet(viewsets.ModelViewSet):
+    serializer_class = SummarySerializer
+    queryset = Summary.objects.prefetch_related(
+        "stores",
+        Prefetch(
+            "lines",
+            queryset=SummaryLine.objects.select_related("store").order_by(
+                "-closing_balance"
+            ),
+        ),
+    )
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            refresh_summary_lines(serializer.save())
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            refresh_summary_lines(serializer.save())
@@ -0,0 +1,24 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .api import (
+    ActViewSet,
+    StoreViewSet,
+    SummaryViewSet,
+    SupplyViewSet,
+    TransactionViewSet,
+)
+
+router = DefaultRouter()
+router.register("stores", StoreViewSet, basename="api-store")
+router.register("supplies", SupplyViewSet, basename="api-supply")
+router.register("transactions", TransactionViewSet, basename="api-transaction")
+router.register("acts", ActViewSet, basename="api-act")
+router.register("summaries", SummaryViewSet, basename="api-summary")
+
+urlpatterns = [
+    path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("", include(router.urls)),
+]
@@ -0,0 +1,370 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import (
+    OpeningBalance,
+    Store,
+    StoreBalance,
+    StoreDailyBalance,
+    Summary,
+    SummaryLine,
+    Supply,
+    Transaction,
+)
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+BALANCE_FIELDS = (
+    "supply_total",
+    "transaction_total",
+    "debt",
+    "supply_count",
+    "transaction_count",
+)
+
+
+def to_decimal(value):
+    if value is None:
+        return ZERO
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT)
+
+
+def closing_dates(store_ids=None):
+    """Дата закрытия периода по магазинам, у которых период закрывался."""
+    rows = OpeningBalance.objects.order_by("store", "date")
+    if store_ids is not None:
+        rows = rows.filter(store_id__in=store_ids)
+    return dict(rows.values_list("store", "date"))
+
+
+def latest_openings(store_ids=None):
+    rows = OpeningBalance.objects.order_by("store", "date")
+    if store_ids is not None:
+        rows = rows.filter(store_id__in=store_ids)
+    return {opening.store_id: opening for opening in rows}
+
+
+def _closing_date():
+    return Subquery(
+        OpeningBalance.objects.filter(store=OuterRef("store"))
+        .order_by("-date")
+        .values("date")[:1]
+    )
+
+
+def open_period(queryset):
+    """Строки ``queryset`` после даты закрытия периода своего магазина."""
+    return queryset.alias(closed_through=_closing_date()).filter(
+        Q(closed_through__isnull=True) | Q(date__gt=F("closed_through"))
+    )
+
+
+def _ledger_state(model, aggregate, end):
+    rows = model.objects.filter(store=OuterRef("store"), date__lte=OuterRef(end))
+    return Subquery(
+        rows.order_by().values("store").annotate(value=aggregate).values("value")
+    )
+
+
+def ledger_state(end="period_end"):
+    """
+    Аннотации с отпечатком леджера магазина ``store`` по дату из поля ``end``.
+
+    Вставка или правка строки меняет последний ``updated_at``, удаление —
+    число строк, перенос закрытого периода в архив — дату закрытия.
+    Подзапросы читают только индексы (store, date, updated_at).
+    """
+    return {
+        "supply_count": _ledger_state(Supply, Count("pk"), end),
+        "supply_updated": _ledger_state(Supply, Max("updated_at"), end),
+        "transaction_count": _ledger_state(Transaction, Count("pk"), end),
+        "transaction_updated": _ledger_state(Transaction, Max("updated_at"), end),
+        "closed_through": _closing_date(),
+    }
+
+
+def balance_annotations():
+    zero = Value(0, output_field=DecimalField())
+    return {
+        "supply_total": Coalesce(F("balance__supply_total"), zero),
+        "transaction_total": Coalesce(F("balance__transaction_total"), zero),
+        "debt": Coalesce(F("balance__debt"), zero),
+    }
+
+
+def apply_ledger_delta(model, store_id, day, amount, count):
+    if model is Supply:
+        total_field, count_field, sign = "supply_total", "supply_count", 1
+    else:
+        total_field, count_field, sign = "transaction_total", "transaction_count", -1
+
+    with transaction.atomic():
+        _apply_daily_delta(total_field, store_id, day, amount)
+        updated = StoreBalance.objects.filter(store_id=store_id).update(
+            **{
+                total_field: F(total_field) + amount,
+                count_field: F(count_field) + count,
+            },
+            debt=F("debt") + sign * amount,
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            recompute_store_balances([store_id])
+
+
+def _apply_daily_delta(total_field, store_id, day, amount):
+    rows = StoreDailyBalance.objects.filter(store_id=store_id)
+    rows.filter(date__gte=day).update(**{total_field: F(total_field) + amount})
+    if rows.filter(date=day).exists():
+        return
+
+    previous = (
+        rows.filter(date__lt=day)
+        .order_by("-date")
+        .values("supply_total", "transaction_total")
+        .first()
+    ) or {"supply_total": ZERO, "transaction_total": ZERO}
+    previous[total_field] += amount
+    StoreDailyBalance.objects.create(store_id=store_id, date=day, **previous)
+
+
+def balance_as_of(store, day):
+    """Сальдо магазина (поставки минус поступления) на конец дня ``day``."""
+    row = (
+        StoreDailyBalance.objects.filter(store=store, date__lte=day)
+        .order_by("-date")
+        .values_list("supply_total", "transaction_total")
+        .first()
+    )
+    if row is None:
+        return ZERO
+    supply_total, transaction_total = row
+    return supply_total - transaction_total
+
+
+def _daily_total(field, day):
+    return Subquery(
+        StoreDailyBalance.objects.filter(store=OuterRef("pk"), date__lte=day)
+        .order_by("-date")
+        .values(field)[:1]
+    )
+
+
+def balances_as_of(store_ids, day):
+    rows = (
+        Store.objects.filter(pk__in=store_ids)
+        .annotate(
+            supply_total=_daily_total("supply_total", day),
+            transaction_total=_daily_total("transaction_total", day),
+        )
+        .values_list("pk", "supply_total", "transaction_total")
+    )
+    return {
+        pk: to_decimal(supply_total) - to_decimal(transaction_total)
+        for pk, supply_total, transaction_total in rows
+    }
+
+
+def compute_summary_lines(summary):
+    """
+    Строки сводки за ее период по ее магазинам.
+
+    Обороты и сальдо берутся разностью накопленных дневных балансов на
+    границах периода, поэтому леджер не агрегируется вовсе.
+    """
+    before = summary.period_start - timedelta(days=1)
+    rows = summary.stores.annotate(
+        supply_before=_daily_total("supply_total", before),
+        transaction_before=_daily_total("transaction_total", before),
+        supply_after=_daily_total("supply_total", summary.period_end),
+        transaction_after=_daily_total("transaction_total", summary.period_end),
+    ).values_list(
+        "pk",
+        "supply_before",
+        "transaction_before",
+        "supply_after",
+        "transaction_after",
+    )
+
+    lines = []
+    for store_id, *totals in rows:
+        supply_before, transaction_before, supply_after, transaction_after = map(
+            to_decimal, totals
+        )
+        opening = supply_before - transaction_before
+        supply_total = supply_after - supply_before
+        transaction_total = transaction_after - transaction_before
+        lines.append(
+            SummaryLine(
+                summary=summary,
+                store_id=store_id,
+                opening_balance=opening,
+                supply_total=supply_total,
+                transaction_total=transaction_total,
+                closing_balance=opening + supply_total - transaction_total,
+            )
+        )
+    return lines
+
+
+def refresh_summary_lines(summary):
+    lines = compute_summary_lines(summary)
+    with transaction.atomic():
+        summary.lines.all().delete()
+        SummaryLine.objects.bulk_create(lines, batch_size=500)
+        # Пересчет строк меняет страницу сводки, как и правка самой сводки.
+        Summary.objects.filter(pk=summary.pk).update(updated_at=timezone.now())
+    return lines
+
+
+def ledger_version(store):
+    """Номер версии леджера магазина, растет при любом изменении его строк."""
+    return (
+        StoreBalance.objects.filter(store=store)
+        .values_list("version", flat=True)
+        .first()
+    ) or 0
+
+
+def compute_store_balances(store_ids=None):
+    """
+    Балансы магазинов: входящее сальдо последнего закрытия плюс строки
+    открытого периода. Закрытые строки, в том числе архивные, не читаются.
+    """
+    stores = Store.objects.all()
+    supplies = open_period(Supply.objects.all())
+    transactions = open_period(Transaction.objects.all())
+    openings = latest_openings(store_ids)
+    if store_ids is not None:
+        stores = stores.filter(pk__in=store_ids)
+        supplies = supplies.filter(store_id__in=store_ids)
+        transactions = transactions.filter(store_id__in=store_ids)
+
+    supply_totals = {
+        row["store"]: row
+        for row in supplies.values("store").annotate(
+            total=Sum("price"), count=Count("pk")
+        )
+    }
+    transaction_totals = {
+        row["store"]: row
+        for row in transactions.values("store").annotate(
+            total=Sum("price"), count=Count("pk")
+        )
+    }
+
+    balances = []
+    for store_id in stores.values_list("pk", flat=True):
+        supply = supply_totals.get(store_id, {})
+        payment = transaction_totals.get(store_id, {})
+        opening = openings.get(store_id) or OpeningBalance()
+        supply_total = to_decimal(opening.supply_total) + to_decimal(
+            supply.get("total")
+        )
+        transaction_total = to_decimal(opening.transaction_total) + to_decimal(
+            payment.get("total")
+        )
+        balances.append(
+            StoreBalance(
+                store_id=store_id,
+                supply_total=supply_total,
+                transaction_total=transaction_total,
+                debt=supply_total - transaction_total,
+                supply_count=opening.supply_count + supply.get("count", 0),
+                transaction_count=opening.transaction_count + payment.get("count", 0),
+            )
+        )
+    return balances
+
+
+def recompute_store_balances(store_ids=None):
+    balances = compute_store_balances(store_ids)
+    with transaction.atomic():
+        StoreBalance.objects.bulk_create(
+            balances,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["store"],
+            update_fields=BALANCE_FIELDS,
+        )
+        rows = StoreBalance.objects.all()
+        if store_ids is not None:
+            rows = rows.filter(store_id__in=store_ids)
+        rows.update(version=F("version") + 1, updated_at=timezone.now())
+    invalidate(balance.store_id for balance in balances)
+    return balances
+
+
+def compute_daily_balances(store_ids=None):
+    """
+    Дневные балансы открытого периода, накопленные от входящего сальдо.
+    Балансы закрытых дней не пересчитываются.
+    """
+    supplies = open_period(Supply.objects.all())
+    transactions = open_period(Transaction.objects.all())
+    openings = latest_openings(store_ids)
+    if store_ids is not None:
+        supplies = supplies.filter(store_id__in=store_ids)
+        transactions = transactions.filter(store_id__in=store_ids)
+
+    days = defaultdict(lambda: [ZERO, ZERO])
+    for index, queryset in enumerate((supplies, transactions)):
+        for row in queryset.values("store", "date").annotate(total=Sum("price")):
+            days[row["store"], row["date"]][index] += to_decimal(row["total"])
+
+    balances = []
+    running = {}
+    for store_id, day in sorted(days):
+        if store_id not in running:
+            opening = openings.get(store_id) or OpeningBalance()
+            running[store_id] = (
+                to_decimal(opening.supply_total),
+                to_decimal(opening.transaction_total),
+            )
+        supply_total, transaction_total = running[store_id]
+        supply_day, transaction_day = days[store_id, day]
+        running[store_id] = (
+            supply_total + supply_day,
+            transaction_total + transaction_day,
+        )
+        balances.append(
+            StoreDailyBalance(
+                store_id=store_id,
+                date=day,
+                supply_total=running[store_id][0],
+                transaction_total=running[store_id][1],
+            )
+        )
+    return balances
+
+
+def recompute_daily_balances(store_ids=None):
+    balances = compute_daily_balances(store_ids)
+    with transaction.atomic():
+        rows = open_period(StoreDailyBalance.objects.all())
+        if store_ids is not None:
+            rows = rows.filter(store_id__in=store_ids)
+        rows.delete()
+        StoreDailyBalance.objects.bulk_create(balances, batch_size=500)
+    return balances
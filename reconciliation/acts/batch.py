@@ -0,0 +1,164 @@
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import django
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.text import slugify
+
+from .engine import iter_period_statements
+from .models import Act, Store
+
+STORE_CHUNK_SIZE = 500
+RENDER_CHUNK_SIZE = 25
+ACT_TEMPLATE = "acts/act_print.html"
+ACT_FRAGMENT_TEMPLATE = "partials/act_print_statement.html"
+
+
+class BatchReport:
+    def __init__(self, workers):
+        self.workers = workers
+        self.stores = 0
+        self.acts = 0
+        self.lines = 0
+        self.query_time = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def render_time(self):
+        return self.elapsed - self.query_time
+
+    @property
+    def acts_per_second(self):
+        return self.acts / self.elapsed if self.elapsed else 0.0
+
+
+def render_act(context):
+    # Печатная форма выводит таблицу акта готовым фрагментом, как и
+    # ActPrintView; для новых актов пачки кэш фрагментов не нужен.
+    fragment = render_to_string(ACT_FRAGMENT_TEMPLATE, context)
+    return render_to_string(ACT_TEMPLATE, {**context, "fragment": fragment})
+
+
+def render_acts(tasks):
+    return [(filename, render_act(context)) for filename, context in tasks]
+
+
+def act_filename(act, store):
+    name = slugify(store.name, allow_unicode=True) or "store"
+    return f"act_{act.pk}_{store.pk}_{name}.html"
+
+
+def act_context(act, store, statement):
+    return {
+        "act": act,
+        "store": store,
+        "events": statement.lines,
+        "total_supply": statement.total_supply,
+        "total_transaction": statement.total_transaction,
+        "balance_before": statement.balance_before,
+        "balance_after": statement.balance_after,
+        "debt": statement.debt,
+        "overpayment": statement.overpayment,
+    }
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ActBatch:
+    """
+    Массовое формирование актов сверки за период.
+
+    Акты создаются пачками через bulk_create, строки всех магазинов пачки
+    вычисляются одним оконным запросом, а печатные формы рендерятся в пуле
+    процессов и складываются в один ZIP-архив.
+    """
+
+    def __init__(self, period_start, period_end, workers=None):
+        self.period_start = period_start
+        self.period_end = period_end
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, stores, output, progress=None):
+        report = BatchReport(self.workers)
+        started = time.perf_counter()
+        stores = list(stores.order_by("pk"))
+
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+            if self.workers > 1:
+                with ProcessPoolExecutor(
+                    self.workers, initializer=django.setup
+                ) as executor:
+                    self._render(stores, archive, report, executor, progress)
+            else:
+                self._render(stores, archive, report, None, progress)
+
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _render(self, stores, archive, report, executor, progress):
+        pending = set()
+        limit = self.workers * 2
+
+        for chunk in _chunks(stores, STORE_CHUNK_SIZE):
+            query_started = time.perf_counter()
+            by_id = {store.pk: store for store in chunk}
+            with transaction.atomic():
+                acts = Act.objects.bulk_create(
+                    Act(
+                        store=store,
+                        period_start=self.period_start,
+                        period_end=self.period_end,
+                    )
+                    for store in chunk
+                )
+            acts = {act.store_id: act for act in acts}
+            statements = list(
+                iter_period_statements(by_id, self.period_start, self.period_end)
+            )
+            report.query_time += time.perf_counter() - query_started
+            report.stores += len(chunk)
+            if progress is not None:
+                progress(report.stores, len(stores))
+
+            tasks = []
+            for statement in statements:
+                act, store = acts[statement.store_id], by_id[statement.store_id]
+                report.lines += len(statement.lines)
+                tasks.append(
+                    (act_filename(act, store), act_context(act, store, statement))
+                )
+
+            for batch in _chunks(tasks, RENDER_CHUNK_SIZE):
+                if executor is None:
+                    self._write(archive, report, render_acts(batch))
+                    continue
+                pending.add(executor.submit(render_acts, batch))
+                if len(pending) >= limit:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._write(archive, report, future.result())
+
+        for future in pending:
+            self._write(archive, report, future.result())
+
+    def _write(self, archive, report, rendered):
+        for filename, html in rendered:
+            archive.writestr(filename, html)
+            report.acts += 1
+
+
+def generate_acts(
+    period_start, period_end, output, store_ids=None, workers=None, progress=None
+):
+    stores = Store.objects.all()
+    if store_ids is not None:
+        stores = stores.filter(pk__in=store_ids)
+    return ActBatch(period_start, period_end, workers).run(stores, output, progress)
@@ -0,0 +1,429 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from multiprocessing import get_context
+from uuid import uuid4
+
+# Модели и представления импортируются внутри функций: в дочернем процессе
+# профиль БД должен попасть в окружение до загрузки настроек Django.
+
+BENCH_START = date(2024, 1, 1)
+BENCH_DAYS = 365
+ROLES = ("writer", "reader")
+BENCH_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "bench",
+    }
+}
+
+# Максимум SQL-запросов на страницу, включая сессию и пользователя.
+# Число не должно зависеть от объема леджера.
+VIEW_BUDGETS = {
+    "home": 4,
+    "store_detail": 7,
+    "act_detail": 5,
+    "summary_detail": 4,
+    "store_list": 3,
+    "supply_list": 3,
+    "transaction_list": 3,
+    "act_list": 3,
+    "summary_list": 3,
+}
+
+
+def view_urls(store_id, act_id, summary_id):
+    from django.urls import reverse
+
+    return {
+        "home": reverse("home"),
+        "store_detail": reverse("store_detail", kwargs={"pk": store_id}),
+        "act_detail": reverse("act_detail", kwargs={"pk": act_id}),
+        "summary_detail": reverse("summary_detail", kwargs={"pk": summary_id}),
+        "store_list": reverse("stores"),
+        "supply_list": reverse("supply_list"),
+        "transaction_list": reverse("transaction_list"),
+        "act_list": reverse("act_list"),
+        "summary_list": reverse("summary_list"),
+    }
+
+
+def _money(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def seed_ledger(
+    stores=100,
+    supplies=0,
+    transactions=0,
+    skew=1.0,
+    start=BENCH_START,
+    days=BENCH_DAYS,
+    seed=0,
+    batch_size=5000,
+):
+    """
+    Синтетический леджер для замеров.
+
+    Берутся первые ``stores`` магазинов, недостающие создаются. Строки
+    делятся между магазинами по закону Ципфа с показателем ``skew``:
+    несколько крупных магазинов и длинный хвост мелких. Строки пишутся
+    через bulk_create, балансы и открытые позиции пересчитываются один раз
+    в конце.
+    """
+    from django.db import transaction
+
+    from .aging import reallocate_stores
+    from .balances import recompute_daily_balances, recompute_store_balances
+    from .models import Store, Supply, Transaction
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with transaction.atomic():
+        store_ids = list(
+            Store.objects.order_by("pk").values_list("pk", flat=True)[:stores]
+        )
+        created = Store.objects.bulk_create(
+            Store(name=f"Магазин {number}")
+            for number in range(len(store_ids) + 1, stores + 1)
+        )
+        store_ids += [store.pk for store in created]
+        cum_weights = list(
+            accumulate(1 / rank**skew for rank in range(1, len(store_ids) + 1))
+        )
+
+        def fill(model, count, build):
+            for offset in range(0, count, batch_size):
+                picked = rng.choices(
+                    store_ids,
+                    cum_weights=cum_weights,
+                    k=min(batch_size, count - offset),
+                )
+                model.objects.bulk_create(
+                    [
+                        build(
+                            store_id=store_id,
+                            date=start + timedelta(days=rng.randrange(days)),
+                        )
+                        for store_id in picked
+                    ]
+                )
+
+        fill(
+            Supply,
+            supplies,
+            lambda **fields: Supply(
+                # Не от rng: повторный запуск с тем же seed не должен
+                # совпасть по ID с уже засеянными поставками.
+                id=str(uuid4().int),
+                price=_money(rng, 10, 5000),
+                **fields,
+            ),
+        )
+        fill(
+            Transaction,
+            transactions,
+            lambda **fields: Transaction(price=_money(rng, 10, 4500), **fields),
+        )
+        recompute_store_balances(store_ids)
+        recompute_daily_balances(store_ids)
+        reallocate_stores(store_ids)
+    return {
+        "stores": len(store_ids),
+        "created_stores": len(created),
+        "supplies": supplies,
+        "transactions": transactions,
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def _setup(profile, db_name):
+    os.environ["DB_PROFILE"] = profile
+    if db_name:
+        os.environ["DB_NAME"] = db_name
+
+    import django
+
+    django.setup()
+
+
+def _is_sqlite(profile):
+    return profile.startswith("sqlite")
+
+
+def _prepare(profile, db_name, stores):
+    _setup(profile, db_name)
+    from django.core.management import call_command
+    from django.db import connection
+
+    if connection.vendor == "sqlite":
+        call_command("migrate", verbosity=0)
+    else:
+        db_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+    seed_ledger(stores)
+    return db_name
+
+
+def _destroy(profile, db_name):
+    _setup(profile, db_name)
+    from django.db import connection
+
+    connection.creation.destroy_test_db(verbosity=0)
+
+
+def _write(rng, store_ids):
+    from .models import Supply, Transaction
+
+    fields = {
+        "store_id": rng.choice(store_ids),
+        "date": BENCH_START + timedelta(days=rng.randrange(BENCH_DAYS)),
+        "price": rng.randint(100, 100000),
+    }
+    if rng.random() < 0.5:
+        Supply.objects.create(id=str(uuid4().int >> 66), **fields)
+    else:
+        Transaction.objects.create(**fields)
+
+
+def _read(rng, store_ids):
+    from .engine import ActStatement
+    from .views import (
+        STORE_HISTORY,
+        dashboard_stores,
+        dashboard_total_debt,
+        store_balance,
+        store_history_page,
+    )
+
+    store_id = rng.choice(store_ids)
+    page = rng.randrange(3)
+    if page == 0:
+        dashboard_stores()
+        dashboard_total_debt()
+    elif page == 1:
+        store_balance(store_id)
+        for kind in STORE_HISTORY:
+            store_history_page(store_id, kind)
+    else:
+        start = BENCH_START + timedelta(days=rng.randrange(BENCH_DAYS - 30))
+        list(ActStatement(store_id, start, start + timedelta(days=30)))
+
+
+def _work(profile, db_name, role, duration, seed, barrier, results):
+    _setup(profile, db_name)
+    from django.db import OperationalError, close_old_connections
+
+    from .models import Store
+
+    store_ids = list(Store.objects.values_list("pk", flat=True))
+    close_old_connections()
+    operation = _write if role == "writer" else _read
+    rng = random.Random(seed)
+    report = {"role": role, "ops": 0, "locked": 0, "errors": 0, "latencies": []}
+
+    barrier.wait(timeout=120)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(rng, store_ids)
+        except OperationalError as error:
+            report["locked" if "locked" in str(error) else "errors"] += 1
+        else:
+            report["ops"] += 1
+            report["latencies"].append(time.perf_counter() - started)
+        finally:
+            # Граница запроса: соединение закрывается или переиспользуется
+            # по CONN_MAX_AGE так же, как после ответа представления.
+            close_old_connections()
+    results.put(report)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _summarize(profile, reports, duration):
+    summary = {"profile": profile, "duration": duration}
+    for role in ROLES:
+        own = [report for report in reports if report["role"] == role]
+        latencies = sorted(value for report in own for value in report["latencies"])
+        ops = sum(report["ops"] for report in own)
+        summary[role] = {
+            "workers": len(own),
+            "ops": ops,
+            "per_second": ops / duration,
+            "locked": sum(report["locked"] for report in own),
+            "errors": sum(report["errors"] for report in own),
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p95_ms": _percentile(latencies, 95) * 1000,
+        }
+    return summary
+
+
+def run_concurrency_benchmark(profiles, writers=4, readers=4, duration=10, stores=50):
+    """
+    Нагрузка на каждый профиль БД: ``writers`` процессов добавляют поставки
+    и поступления, ``readers`` читают главную, карточку магазина и акт.
+
+    Каждый профиль получает отдельную временную базу, процессы стартуют
+    одновременно. Возвращает пропускную способность, задержки и число
+    ошибок блокировки по каждой роли.
+    """
+    context = get_context("spawn")
+    roles = ["writer"] * writers + ["reader"] * readers
+    summaries = []
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in profiles:
+            db_name = (
+                os.path.join(directory, f"{profile}.sqlite3")
+                if _is_sqlite(profile)
+                else None
+            )
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                db_name = executor.submit(_prepare, profile, db_name, stores).result()
+
+            barrier = context.Barrier(len(roles))
+            results = context.Queue()
+            processes = [
+                context.Process(
+                    target=_work,
+                    args=(profile, db_name, role, duration, seed, barrier, results),
+                )
+                for seed, role in enumerate(roles)
+            ]
+            for process in processes:
+                process.start()
+            try:
+                reports = [
+                    results.get(timeout=duration + 180) for _ in processes
+                ]
+            finally:
+                for process in processes:
+                    process.join()
+                if not _is_sqlite(profile):
+                    with ProcessPoolExecutor(1, mp_context=context) as executor:
+                        executor.submit(_destroy, profile, db_name).result()
+            summaries.append(_summarize(profile, reports, duration))
+    return summaries
+
+
+def measure_views(client, urls, repeat=5):
+    """
+    Время и число запросов каждой страницы ``urls``.
+
+    Кэш очищается перед каждым запросом, поэтому замеряется холодная
+    страница со всеми агрегатами. Замер идет на своем кэше в памяти,
+    общий кэш страниц не трогается.
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    results = {}
+    with override_settings(CACHES=BENCH_CACHES):
+        for name, url in urls.items():
+            timings = []
+            for _ in range(repeat):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url}: ответ {response.status_code}")
+            results[name] = {
+                "url": url,
+                "queries": len(queries.captured_queries),
+                "budget": VIEW_BUDGETS[name],
+                "median_ms": statistics.median(timings) * 1000,
+                "max_ms": max(timings) * 1000,
+                "bytes": len(response.content),
+            }
+    return results
+
+
+def run_view_benchmark(sizes, repeat=5, stores=100, skew=1.0, seed=0):
+    """
+    Замер страниц на леджерах из ``sizes`` строк во временной тестовой БД.
+
+    Леджер растет от меньшего объема к большему, на каждом шаге
+    досеиваются только новые строки.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from .balances import refresh_summary_lines
+    from .models import Act, Store, StoreBalance, Summary
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                directory, "bench.sqlite3"
+            )
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        setup_test_environment()
+        try:
+            client = Client()
+            client.force_login(get_user_model().objects.create_user("bench"))
+            seeded = 0
+            for rows in sorted(sizes):
+                added = rows - seeded
+                seeding = seed_ledger(
+                    stores,
+                    supplies=added // 2,
+                    transactions=added - added // 2,
+                    skew=skew,
+                    seed=seed + rows,
+                )
+                seeded = rows
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+                store_id = (
+                    StoreBalance.objects.order_by("-supply_count")
+                    .values_list("store_id", flat=True)
+                    .first()
+                )
+                act, _ = Act.objects.get_or_create(
+                    store_id=store_id,
+                    period_start=BENCH_START,
+                    period_end=BENCH_START + timedelta(days=30),
+                )
+                summary = Summary.objects.first() or Summary.objects.create(
+                    period_start=BENCH_START,
+                    period_end=BENCH_START + timedelta(days=BENCH_DAYS - 1),
+                )
+                summary.stores.set(Store.objects.all())
+                refresh_summary_lines(summary)
+
+                results.append(
+                    {
+                        "rows": rows,
+                        "stores": seeding["stores"],
+                        "seed_seconds": seeding["elapsed"],
+                        "views": measure_views(
+                            client, view_urls(store_id, act.pk, summary.pk), repeat
+                        ),
+                    }
+                )
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
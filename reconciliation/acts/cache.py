@@ -0,0 +1,131 @@
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+PREFIX = "acts"
+SECTIONS = ("home", "store", "page")
+STATS = ("hits", "misses")
+
+
+def _version_key(store_id=None):
+    return f"{PREFIX}:version:{'all' if store_id is None else store_id}"
+
+
+def _stats_key(section, stat):
+    return f"{PREFIX}:stats:{section}:{stat}"
+
+
+def get_version(store_id=None):
+    key = _version_key(store_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(store_ids):
+    """
+    Сменить версии магазинов ``store_ids`` и общую версию после коммита.
+
+    Версия — случайный токен, а не счетчик, поэтому одновременные сбросы
+    из разных процессов не теряются на бэкендах без атомарного incr.
+    """
+    keys = [_version_key()] + [_version_key(pk) for pk in set(store_ids)]
+
+    def bump():
+        cache.set_many({key: uuid4().hex for key in keys}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def _count(section, stat):
+    key = _stats_key(section, stat)
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счетчик вытеснили между add и incr, одно обращение не в счет.
+        pass
+
+
+def _cache_key(section, store_id=None):
+    return f"{PREFIX}:{section}:{store_id or 'all'}:{get_version(store_id)}"
+
+
+def cached(section, compute, store_id=None):
+    """
+    Результат ``compute()`` из кэша под версией магазина ``store_id``
+    или общей версией, если магазин не указан.
+    """
+    key = _cache_key(section, store_id)
+    value = cache.get(key)
+    if value is not None:
+        _count(section, "hits")
+        return value
+    _count(section, "misses")
+    value = compute()
+    cache.set(key, value, timeout=settings.ACTS_CACHE_TIMEOUT)
+    return value
+
+
+async def acached(section, compute, store_id=None):
+    """То же, что ``cached``, но ``compute()`` возвращает корутину."""
+    key = await sync_to_async(_cache_key)(section, store_id)
+    value = await cache.aget(key)
+    if value is not None:
+        await sync_to_async(_count)(section, "hits")
+        return value
+    await sync_to_async(_count)(section, "misses")
+    value = await compute()
+    await cache.aset(key, value, timeout=settings.ACTS_CACHE_TIMEOUT)
+    return value
+
+
+def cached_html(key, render):
+    """
+    HTML фрагмента страницы из кэша. ``key`` уже включает версию данных,
+    поэтому фрагменты не сбрасываются, а устаревают и вытесняются.
+    """
+    key = f"{PREFIX}:html:{key}"
+    html = cache.get(key)
+    if html is not None:
+        _count("page", "hits")
+        return mark_safe(html)
+    _count("page", "misses")
+    html = render()
+    cache.set(key, html, timeout=settings.ACTS_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+async def acached_html(key, render):
+    """То же, что ``cached_html``, но ``render()`` возвращает корутину."""
+    key = f"{PREFIX}:html:{key}"
+    html = await cache.aget(key)
+    if html is not None:
+        await sync_to_async(_count)("page", "hits")
+        return mark_safe(html)
+    await sync_to_async(_count)("page", "misses")
+    html = await render()
+    await cache.aset(key, html, timeout=settings.ACTS_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def stats():
+    keys = [_stats_key(section, stat) for section in SECTIONS for stat in STATS]
+    values = cache.get_many(keys)
+    return {
+        section: {stat: values.get(_stats_key(section, stat), 0) for stat in STATS}
+        for section in SECTIONS
+    }
+
+
+def reset_stats():
+    cache.delete_many(
+        [_stats_key(section, stat) for section in SECTIONS for stat in STATS]
+    )
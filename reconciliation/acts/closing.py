@@ -0,0 +1,194 @@
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .balances import closing_dates, latest_openings, open_period, to_decimal
+from .cache import invalidate
+from .models import (
+    ArchivedSupply,
+    ArchivedTransaction,
+    OpeningBalance,
+    PaymentAllocation,
+    Store,
+    StoreBalance,
+    Supply,
+    Transaction,
+)
+
+ARCHIVE_SQL = """
+INSERT INTO {archive} ({columns})
+SELECT {columns} FROM {table} WHERE {pk} IN ({ids})
+"""
+
+DELETE_SQL = "DELETE FROM {table} WHERE {pk} IN ({ids})"
+
+DETACH_SQL = "UPDATE {table} SET {column} = NULL WHERE {column} IN ({ids})"
+
+
+class ClosedPeriodError(ValidationError):
+    pass
+
+
+def check_open_period(*rows):
+    """
+    Отказ, если строка леджера ``(store_id, date, ...)`` лежит в закрытом
+    периоде своего магазина. ``None`` среди строк пропускается.
+    """
+    rows = [row for row in rows if row is not None]
+    if not rows:
+        return
+    closed = closing_dates({row[0] for row in rows})
+    for store_id, day, *_ in rows:
+        if store_id in closed and day <= closed[store_id]:
+            raise ClosedPeriodError(
+                f"Период по {closed[store_id]:%d.%m.%Y} закрыт, строки за "
+                f"{day:%d.%m.%Y} не изменяются",
+                code="closed_period",
+            )
+
+
+def _period_totals(model, closing_date, store_ids):
+    rows = open_period(model.objects.filter(date__lte=closing_date))
+    rows = rows.filter(store_id__in=store_ids)
+    return {
+        row["store"]: row
+        for row in rows.values("store").annotate(total=Sum("price"), count=Count("pk"))
+    }
+
+
+def _settled_payments(store_ids, closing_date):
+    # Платеж уходит в архив, только если целиком разнесен на поставки
+    # закрытого периода: переразнесение открытого периода его не тронет.
+    settled = PaymentAllocation.objects.filter(
+        Q(supply__isnull=True) | Q(supply__date__lte=closing_date),
+        transaction=OuterRef("pk"),
+    )
+    return (
+        Transaction.objects.filter(store_id__in=store_ids, date__lte=closing_date)
+        .annotate(
+            settled=Coalesce(
+                Subquery(
+                    settled.values("transaction")
+                    .annotate(total=Sum("amount"))
+                    .values("total")
+                ),
+                Value(0, output_field=DecimalField()),
+            )
+        )
+        .values_list("pk", "price", "settled")
+    )
+
+
+def _run(sql, model, ids, batch_size=500, **fields):
+    quote = connection.ops.quote_name
+    opts = model._meta
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start : start + batch_size]
+            cursor.execute(
+                sql.format(
+                    table=quote(opts.db_table),
+                    pk=quote(opts.pk.column),
+                    ids=", ".join(["%s"] * len(batch)),
+                    **fields,
+                ),
+                batch,
+            )
+
+
+def _archive(model, archive, ids):
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in archive._meta.concrete_fields)
+    _run(
+        ARCHIVE_SQL, model, ids, archive=quote(archive._meta.db_table), columns=columns
+    )
+    _run(DELETE_SQL, model, ids)
+
+
+def _detach(field, ids):
+    column = connection.ops.quote_name(PaymentAllocation._meta.get_field(field).column)
+    _run(DETACH_SQL, PaymentAllocation, ids, column=column)
+
+
+def close_period(closing_date, store_ids=None):
+    """
+    Закрытие периода по ``closing_date`` включительно.
+
+    Сальдо магазина на дату закрытия фиксируется в ``OpeningBalance``,
+    дальше балансы считаются от него. Погашенные поставки и целиком
+    разнесенные платежи закрытого периода переносятся в архив, открытые
+    позиции остаются в рабочих таблицах, чтобы FIFO-разнесение не менялось.
+    Строки закрытого периода больше не изменяются и не удаляются.
+
+    Магазины, закрытые той же или более поздней датой, пропускаются.
+    Возвращает созданные ``OpeningBalance``.
+    """
+    stores = Store.objects.order_by("pk")
+    if store_ids is not None:
+        stores = stores.filter(pk__in=store_ids)
+    with transaction.atomic():
+        store_ids = list(stores.select_for_update().values_list("pk", flat=True))
+        previous = latest_openings(store_ids)
+        store_ids = [
+            store_id
+            for store_id in store_ids
+            if store_id not in previous or previous[store_id].date < closing_date
+        ]
+        supplies = _period_totals(Supply, closing_date, store_ids)
+        payments = _period_totals(Transaction, closing_date, store_ids)
+        openings = []
+        for store_id in store_ids:
+            opening = previous.get(store_id) or OpeningBalance()
+            supply = supplies.get(store_id, {})
+            payment = payments.get(store_id, {})
+            openings.append(
+                OpeningBalance(
+                    store_id=store_id,
+                    date=closing_date,
+                    supply_total=to_decimal(opening.supply_total)
+                    + to_decimal(supply.get("total")),
+                    transaction_total=to_decimal(opening.transaction_total)
+                    + to_decimal(payment.get("total")),
+                    supply_count=opening.supply_count + supply.get("count", 0),
+                    transaction_count=opening.transaction_count
+                    + payment.get("count", 0),
+                )
+            )
+        OpeningBalance.objects.bulk_create(openings, batch_size=500)
+
+        supply_ids = list(
+            Supply.objects.filter(
+                store_id__in=store_ids,
+                date__lte=closing_date,
+                paid_date__lte=closing_date,
+            ).values_list("pk", flat=True)
+        )
+        payment_ids = [
+            pk
+            for pk, price, settled in _settled_payments(store_ids, closing_date)
+            if price <= to_decimal(settled)
+        ]
+        _detach("supply", supply_ids)
+        _detach("transaction", payment_ids)
+        PaymentAllocation.objects.filter(
+            supply__isnull=True, transaction__isnull=True
+        ).delete()
+        _archive(Supply, ArchivedSupply, supply_ids)
+        _archive(Transaction, ArchivedTransaction, payment_ids)
+        # Архивные строки пропадают из истории магазина, как при правке леджера.
+        StoreBalance.objects.filter(store_id__in=store_ids).update(
+            version=F("version") + 1, updated_at=timezone.now()
+        )
+        invalidate(store_ids)
+    return openings
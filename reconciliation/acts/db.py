@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+# Наблюдатели запросов текущего контекста. Контекст копируется в потоки
+# sync_to_async, поэтому запросы из run_query и async-методов ORM тоже
+# доходят до наблюдателей запроса, который их вызвал.
+_observers = ContextVar("query_observers", default=())
+
+
+def _run_closing(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_query(func, *args, **kwargs):
+    """
+    Выполнить синхронную функцию с запросами в отдельном потоке со своим
+    соединением с БД.
+
+    Async-методы ORM выполняются по очереди в одном общем потоке, поэтому
+    независимые запросы, собранные через ``asyncio.gather``, идут
+    параллельно только через эту обертку.
+    """
+    return await sync_to_async(_run_closing, thread_sensitive=False)(
+        func, *args, **kwargs
+    )
+
+
+def observe(execute, sql, params, many, context):
+    """Обертка ``execute_wrapper`` каждого соединения, см. ``observe_queries``."""
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for observer in observers:
+            observer.record(duration, sql)
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Передает ``observer.record(duration, sql)`` каждый запрос к БД в этом
+    контексте, из какого бы потока и соединения он ни шел.
+    """
+    token = _observers.set((*_observers.get(), observer))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
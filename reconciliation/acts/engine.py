@@ -0,0 +1,365 @@
+import asyncio
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import DateField
+
+from .balances import ZERO, balance_as_of, balances_as_of, to_decimal
+from .db import run_query
+from .models import ArchivedSupply, ArchivedTransaction, Supply, Transaction
+
+ACT_LINES_SQL = """
+SELECT
+    ledger.kind,
+    ledger.supply_id,
+    ledger.transaction_id,
+    ledger.date,
+    ledger.supply_amount,
+    ledger.transaction_amount,
+    SUM(ledger.supply_amount - ledger.transaction_amount) OVER (
+        ORDER BY ledger.date, ledger.kind, ledger.supply_id, ledger.transaction_id
+        ROWS UNBOUNDED PRECEDING
+    ) AS balance,
+    SUM(ledger.supply_amount) OVER () AS total_supply,
+    SUM(ledger.transaction_amount) OVER () AS total_transaction
+FROM (
+    SELECT
+        0 AS kind,
+        {supply}.{supply_pk} AS supply_id,
+        NULL AS transaction_id,
+        {supply}.date AS date,
+        {supply}.price AS supply_amount,
+        0 AS transaction_amount
+    FROM {supply_from}
+    WHERE {supply}.store_id = %s AND {supply}.date BETWEEN %s AND %s
+    UNION ALL
+    SELECT
+        1 AS kind,
+        NULL AS supply_id,
+        {transaction}.{transaction_pk} AS transaction_id,
+        {transaction}.date AS date,
+        0 AS supply_amount,
+        {transaction}.price AS transaction_amount
+    FROM {transaction_from}
+    WHERE {transaction}.store_id = %s AND {transaction}.date BETWEEN %s AND %s
+) ledger
+ORDER BY ledger.date, ledger.kind, ledger.supply_id, ledger.transaction_id
+"""
+
+PERIOD_LINES_SQL = """
+SELECT
+    ledger.store_id,
+    ledger.kind,
+    ledger.supply_id,
+    ledger.transaction_id,
+    ledger.date,
+    ledger.supply_amount,
+    ledger.transaction_amount,
+    SUM(ledger.supply_amount - ledger.transaction_amount) OVER (
+        PARTITION BY ledger.store_id
+        ORDER BY ledger.date, ledger.kind, ledger.supply_id, ledger.transaction_id
+        ROWS UNBOUNDED PRECEDING
+    ) AS balance,
+    SUM(ledger.supply_amount) OVER (PARTITION BY ledger.store_id) AS total_supply,
+    SUM(ledger.transaction_amount) OVER (
+        PARTITION BY ledger.store_id
+    ) AS total_transaction
+FROM (
+    SELECT
+        {supply}.store_id AS store_id,
+        0 AS kind,
+        {supply}.{supply_pk} AS supply_id,
+        NULL AS transaction_id,
+        {supply}.date AS date,
+        {supply}.price AS supply_amount,
+        0 AS transaction_amount
+    FROM {supply_from}
+    WHERE {supply}.date BETWEEN %s AND %s {supply_stores}
+    UNION ALL
+    SELECT
+        {transaction}.store_id AS store_id,
+        1 AS kind,
+        NULL AS supply_id,
+        {transaction}.{transaction_pk} AS transaction_id,
+        {transaction}.date AS date,
+        0 AS supply_amount,
+        {transaction}.price AS transaction_amount
+    FROM {transaction_from}
+    WHERE {transaction}.date BETWEEN %s AND %s {transaction_stores}
+) ledger
+ORDER BY
+    ledger.store_id, ledger.date, ledger.kind, ledger.supply_id, ledger.transaction_id
+"""
+
+# Строки закрытых периодов лежат в архивных таблицах с теми же столбцами.
+# Подзапрос получает имя основной таблицы, поэтому условия запросов акта
+# не меняются, а SQLite и PostgreSQL спускают их в обе ветви UNION ALL.
+ARCHIVE_UNION_SQL = """(
+    SELECT {pk}, store_id, date, price FROM {table}
+    UNION ALL
+    SELECT {archive_pk}, store_id, date, price FROM {archive}
+) {table}"""
+
+_date_field = DateField()
+
+
+def _with_archive(model, archive):
+    quote = connection.ops.quote_name
+    return ARCHIVE_UNION_SQL.format(
+        table=quote(model._meta.db_table),
+        pk=quote(model._meta.pk.column),
+        archive=quote(archive._meta.db_table),
+        archive_pk=quote(archive._meta.pk.column),
+    )
+
+
+def _ledger_sql(template, **extra):
+    quote = connection.ops.quote_name
+    return template.format(
+        supply=quote(Supply._meta.db_table),
+        supply_pk=quote(Supply._meta.pk.column),
+        supply_from=_with_archive(Supply, ArchivedSupply),
+        transaction=quote(Transaction._meta.db_table),
+        transaction_pk=quote(Transaction._meta.pk.column),
+        transaction_from=_with_archive(Transaction, ArchivedTransaction),
+        **extra,
+    )
+
+
+def _make_line(row, opening=ZERO):
+    kind, supply_id, transaction_id, day, supply_amount, transaction_amount = row[:6]
+    day = _date_field.to_python(day)
+    balance = opening + to_decimal(row[6])
+    if kind == 0:
+        return ActLine(
+            "supply", supply_id, day, to_decimal(supply_amount), None, balance
+        )
+    return ActLine(
+        "transaction",
+        transaction_id,
+        day,
+        None,
+        to_decimal(transaction_amount),
+        balance,
+    )
+
+
+def _act_params(store, period_start, period_end):
+    store_id = getattr(store, "pk", store)
+    period = [
+        connection.ops.adapt_datefield_value(period_start),
+        connection.ops.adapt_datefield_value(period_end),
+    ]
+    return [store_id, *period, store_id, *period]
+
+
+def _fetch_act_rows(store, period_start, period_end):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _ledger_sql(ACT_LINES_SQL), _act_params(store, period_start, period_end)
+        )
+        return cursor.fetchall()
+
+
+class ActLine:
+    __slots__ = (
+        "type",
+        "pk",
+        "date",
+        "supply_amount",
+        "transaction_amount",
+        "balance",
+    )
+
+    def __init__(self, type, pk, date, supply_amount, transaction_amount, balance):
+        self.type = type
+        self.pk = pk
+        self.date = date
+        self.supply_amount = supply_amount
+        self.transaction_amount = transaction_amount
+        self.balance = balance
+
+
+class ActStatement:
+    """
+    Акт сверки за период, вычисляемый одним запросом.
+
+    Строки отдаются ленивым итератором поверх курсора, итоги за период
+    берутся из первой строки того же запроса.
+    """
+
+    def __init__(
+        self,
+        store,
+        period_start,
+        period_end,
+        chunk_size=2000,
+        balance_before=None,
+        rows=None,
+    ):
+        self.store = store
+        self.period_start = period_start
+        self.period_end = period_end
+        self.chunk_size = chunk_size
+        if balance_before is None:
+            balance_before = balance_as_of(store, period_start - timedelta(days=1))
+        self.balance_before = balance_before
+        self._loaded = rows
+        self._rows = None
+        self._head = None
+        self._totals = None
+
+    @property
+    def total_supply(self):
+        return self._get_totals()[0]
+
+    @property
+    def total_transaction(self):
+        return self._get_totals()[1]
+
+    @property
+    def balance_after(self):
+        return self.balance_before + self.total_supply - self.total_transaction
+
+    @property
+    def debt(self):
+        return max(self.balance_after, ZERO)
+
+    @property
+    def overpayment(self):
+        return abs(min(self.balance_after, ZERO))
+
+    def __iter__(self):
+        head = self._peek()
+        rows = self._rows
+        self._rows = self._head = None
+        if head is None:
+            return
+        yield _make_line(head, self.balance_before)
+        for row in rows:
+            yield _make_line(row, self.balance_before)
+
+    def _get_totals(self):
+        if self._totals is None:
+            self._peek()
+        return self._totals
+
+    def _peek(self):
+        if self._rows is None:
+            self._rows = (
+                iter(self._loaded) if self._loaded is not None else self._fetch()
+            )
+            self._head = next(self._rows, None)
+            if self._totals is None:
+                self._totals = (
+                    (to_decimal(self._head[7]), to_decimal(self._head[8]))
+                    if self._head is not None
+                    else (ZERO, ZERO)
+                )
+        return self._head
+
+    @classmethod
+    async def aload(cls, store, period_start, period_end):
+        """
+        Акт с заранее прочитанными строками для async-представлений.
+
+        Сальдо на начало и строки периода не зависят друг от друга и
+        читаются одновременно в разных соединениях.
+        """
+        balance_before, rows = await asyncio.gather(
+            run_query(balance_as_of, store, period_start - timedelta(days=1)),
+            run_query(_fetch_act_rows, store, period_start, period_end),
+        )
+        return cls(
+            store, period_start, period_end, balance_before=balance_before, rows=rows
+        )
+
+    def _fetch(self):
+        params = _act_params(self.store, self.period_start, self.period_end)
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(_ledger_sql(ACT_LINES_SQL), params)
+            while rows := cursor.fetchmany(self.chunk_size):
+                yield from rows
+
+
+class PeriodStatement:
+    __slots__ = (
+        "store_id",
+        "balance_before",
+        "lines",
+        "total_supply",
+        "total_transaction",
+    )
+
+    def __init__(
+        self, store_id, balance_before, lines, total_supply, total_transaction
+    ):
+        self.store_id = store_id
+        self.balance_before = balance_before
+        self.lines = lines
+        self.total_supply = total_supply
+        self.total_transaction = total_transaction
+
+    @property
+    def balance_after(self):
+        return self.balance_before + self.total_supply - self.total_transaction
+
+    @property
+    def debt(self):
+        return max(self.balance_after, ZERO)
+
+    @property
+    def overpayment(self):
+        return abs(min(self.balance_after, ZERO))
+
+
+def iter_period_statements(store_ids, period_start, period_end, chunk_size=2000):
+    """
+    Акты сверки сразу для многих магазинов: один запрос за начальными
+    сальдо и один оконный запрос за строками всех магазинов периода.
+
+    Отдает ``PeriodStatement`` по магазинам в порядке возрастания ID,
+    включая магазины без операций за период.
+    """
+    store_ids = sorted(store_ids)
+    openings = balances_as_of(store_ids, period_start - timedelta(days=1))
+    period = [
+        connection.ops.adapt_datefield_value(period_start),
+        connection.ops.adapt_datefield_value(period_end),
+    ]
+    placeholders = ", ".join(["%s"] * len(store_ids))
+    sql = _ledger_sql(
+        PERIOD_LINES_SQL,
+        supply_stores=f"AND store_id IN ({placeholders})",
+        transaction_stores=f"AND store_id IN ({placeholders})",
+    )
+    params = [*period, *store_ids, *period, *store_ids]
+
+    pending = iter(store_ids)
+    current = None
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            for row in rows:
+                store_id = row[0]
+                if current is None or current.store_id != store_id:
+                    if current is not None:
+                        yield current
+                    for empty_id in pending:
+                        if empty_id == store_id:
+                            break
+                        yield PeriodStatement(
+                            empty_id, openings[empty_id], [], ZERO, ZERO
+                        )
+                    current = PeriodStatement(
+                        store_id,
+                        openings[store_id],
+                        [],
+                        to_decimal(row[8]),
+                        to_decimal(row[9]),
+                    )
+                current.lines.append(_make_line(row[1:], current.balance_before))
+    if current is not None:
+        yield current
+    for empty_id in pending:
+        yield PeriodStatement(empty_id, openings[empty_id], [], ZERO, ZERO)
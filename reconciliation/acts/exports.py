@@ -0,0 +1,264 @@
+import csv
+import io
+import zipfile
+from datetime import date
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+CSV_CHUNK_ROWS = 500
+ITERATOR_CHUNK_SIZE = 2000
+
+ACT_HEADER = ["Дата", "Тип операции", "Номер", "Поставка", "Оплата", "Баланс"]
+SUMMARY_HEADER = [
+    "ID",
+    "Магазин",
+    "Сальдо на начало",
+    "Поставки",
+    "Поступления",
+    "Сальдо на конец",
+]
+SUPPLY_HEADER = ["ID", "Дата", "Сумма", "Магазин"]
+TRANSACTION_HEADER = ["ID", "Дата", "Сумма", "Магазин"]
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_EPOCH = date(1899, 12, 30)
+XLSX_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+XLSX_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_RELATIONSHIPS = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+XLSX_PACKAGE = "http://schemas.openxmlformats.org/package/2006"
+XLSX_OFFICE = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+# Книга из одного листа и стиля даты (numFmtId 14), строки листа пишутся
+# потоком, остальные части неизменны.
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        f'<Types xmlns="{XLSX_PACKAGE}/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        f'ContentType="{XLSX_OFFICE}.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        f'ContentType="{XLSX_OFFICE}.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        f'ContentType="{XLSX_OFFICE}.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        f'<Relationships xmlns="{XLSX_PACKAGE}/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_RELATIONSHIPS}/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        f'<workbook xmlns="{XLSX_MAIN}" xmlns:r="{XLSX_RELATIONSHIPS}">'
+        '<sheets><sheet name="Лист1" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        f'<Relationships xmlns="{XLSX_PACKAGE}/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_RELATIONSHIPS}/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{XLSX_RELATIONSHIPS}/styles" '
+        'Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/styles.xml": (
+        f'<styleSheet xmlns="{XLSX_MAIN}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/>'
+        "</border></borders>"
+        '<cellStyleXfs count="1">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" '
+        'applyNumberFormat="1"/>'
+        "</cellXfs>"
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/>'
+        "</cellStyles></styleSheet>"
+    ),
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        return value.strftime("%d.%m.%Y")
+    if isinstance(value, Decimal):
+        return f"{value:.2f}".replace(".", ",")
+    return value
+
+
+def iter_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for number, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(value) for value in row])
+        if number % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(filename, header, rows):
+    response = StreamingHttpResponse(
+        iter_csv(header, rows), content_type="text/csv; charset=utf-8"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+class _ZipStream:
+    """Файл только для записи: ZipFile пишет в него, генератор забирает байты."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _xlsx_column(index):
+    letters = ""
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+def _xlsx_cell(ref, value):
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="1"><v>{(value - XLSX_EPOCH).days}</v></c>'
+    if isinstance(value, int):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, Decimal):
+        return f'<c r="{ref}"><v>{value:f}</v></c>'
+    text = escape(str(value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(number, row):
+    cells = "".join(
+        _xlsx_cell(f"{_xlsx_column(column)}{number}", value)
+        for column, value in enumerate(row, 1)
+    )
+    return f'<row r="{number}">{cells}</row>'.encode()
+
+
+def iter_xlsx(header, rows):
+    """
+    XLSX-файл кусками: ZIP пишется в поток без перемотки, лист собирается
+    из строк по мере чтения ``rows``, как и в ``iter_csv``.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, XLSX_XML + content)
+        yield stream.pop()
+
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                f'{XLSX_XML}<worksheet xmlns="{XLSX_MAIN}"><sheetData>'.encode()
+            )
+            for number, row in enumerate(chain([header], rows), 1):
+                sheet.write(_xlsx_row(number, row))
+                if number % CSV_CHUNK_ROWS == 0 and stream.chunks:
+                    yield stream.pop()
+            sheet.write(b"</sheetData></worksheet>")
+    yield stream.pop()
+
+
+def xlsx_response(filename, header, rows):
+    response = StreamingHttpResponse(
+        iter_xlsx(header, rows), content_type=XLSX_CONTENT_TYPE
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.xlsx"'
+    return response
+
+
+def export_response(request, filename, header, rows):
+    if request.GET.get("format") == "xlsx":
+        return xlsx_response(filename, header, rows)
+    return csv_response(filename, header, rows)
+
+
+def act_rows(statement):
+    yield [
+        statement.period_start,
+        "Начальный баланс",
+        None,
+        None,
+        None,
+        statement.balance_before,
+    ]
+    for line in statement:
+        yield [
+            line.date,
+            "Поставка" if line.type == "supply" else "Оплата",
+            line.pk,
+            line.supply_amount,
+            line.transaction_amount,
+            line.balance,
+        ]
+    yield [
+        statement.period_end,
+        "Итого за период",
+        None,
+        statement.total_supply,
+        statement.total_transaction,
+        statement.balance_after,
+    ]
+
+
+def ledger_rows(queryset):
+    return (
+        list(row)
+        for row in queryset.values_list("pk", "date", "price", "store__name")
+        .order_by("date", "pk")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+
+
+def summary_rows(lines):
+    totals = [Decimal("0.00")] * 4
+    for line in lines:
+        amounts = [
+            line.opening_balance,
+            line.supply_total,
+            line.transaction_total,
+            line.closing_balance,
+        ]
+        totals = [total + amount for total, amount in zip(totals, amounts)]
+        yield [line.store_id, line.store.name, *amounts]
+    yield [None, "ИТОГО", *totals]
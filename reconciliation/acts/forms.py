@@ -1,11 +1,51 @@
 from django import forms
 from django.contrib.auth import get_user_model
+from django.urls import reverse_lazy
 
-from .models import Act, Store, Summary, Supply, Transaction
+from .closing import check_open_period
+from .models import Act, ArchivedSupply, Store, Summary, Supply, Transaction
 
 User = get_user_model()
 
 
+class StoreAutocompleteMixin:
+    """
+    Выбор магазина поиском: в разметку попадают только выбранные магазины,
+    остальные подгружает скрипт ``partials/store_autocomplete.html``.
+    """
+
+    def __init__(self, attrs=None):
+        super().__init__(
+            {
+                "class": "form-control form-select",
+                "data-autocomplete": reverse_lazy("store_search"),
+                **(attrs or {}),
+            }
+        )
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        stores = choices.queryset.filter(pk__in=[pk for pk in value if pk.isdigit()])
+        selected = [choices.choice(store) for store in stores]
+        if not self.allow_multiple_selected:
+            selected = [("", choices.field.empty_label or ""), *selected]
+        options = [
+            self.create_option(
+                name, option_value, label, bool(option_value), index, attrs=attrs
+            )
+            for index, (option_value, label) in enumerate(selected)
+        ]
+        return [(None, options, 0)]
+
+
+class StoreSelect(StoreAutocompleteMixin, forms.Select):
+    pass
+
+
+class StoreSelectMultiple(StoreAutocompleteMixin, forms.SelectMultiple):
+    pass
+
+
 class StoreForm(forms.ModelForm):
     class Meta:
         model = Store
@@ -33,7 +73,23 @@ class StoreForm(forms.ModelForm):
         }
 
 
-class TransactionForm(forms.ModelForm):
+class OpenPeriodFormMixin:
+    """Отказ в изменении строки, старая или новая дата которой закрыта."""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        rows = []
+        # До _post_clean экземпляр еще хранит исходные значения.
+        if not self.instance._state.adding:
+            rows.append((self.instance.store_id, self.instance.date))
+        store, day = cleaned_data.get("store"), cleaned_data.get("date")
+        if store is not None and day is not None:
+            rows.append((store.pk, day))
+        check_open_period(*rows)
+        return cleaned_data
+
+
+class TransactionForm(OpenPeriodFormMixin, forms.ModelForm):
     class Meta:
         model = Transaction
         fields = ["date", "price", "store"]
@@ -51,15 +107,11 @@ class TransactionForm(forms.ModelForm):
                     "step": "0.01",
                 }
             ),
-            "store": forms.Select(
-                attrs={
-                    "class": "form-control form-select",
-                }
-            ),
+            "store": StoreSelect(),
         }
 
 
-class SupplyForm(forms.ModelForm):
+class SupplyForm(OpenPeriodFormMixin, forms.ModelForm):
     class Meta:
         model = Supply
         fields = ["id", "date", "price", "store"]
@@ -80,19 +132,22 @@ class SupplyForm(forms.ModelForm):
                     "step": "0.01",
                 }
             ),
-            "store": forms.Select(
-                attrs={
-                    "class": "form-control form-select",
-                }
-            ),
+            "store": StoreSelect(),
         }
 
+    def clean_id(self):
+        pk = self.cleaned_data["id"]
+        if ArchivedSupply.objects.filter(pk=pk).exists():
+            raise forms.ValidationError("Поставка с таким ID уже в архиве")
+        return pk
+
 
 class SummaryForm(forms.ModelForm):
     class Meta:
         model = Summary
         fields = ["stores", "period_start", "period_end"]
         widgets = {
+            "stores": StoreSelectMultiple(),
             "period_start": forms.DateInput(
                 attrs={
                     "type": "date",
@@ -125,9 +180,83 @@ class ActForm(forms.ModelForm):
                     "class": "form-control",
                 }
             ),
-            "store": forms.Select(
-                attrs={
-                    "class": "form-control form-select",
-                }
-            ),
+            "store": StoreSelect(),
         }
+
+
+class LedgerImportForm(forms.Form):
+    kind = forms.ChoiceField(
+        label="Тип данных",
+        choices=[("supply", "Поставки"), ("transaction", "Поступления")],
+        widget=forms.Select(attrs={"class": "form-control form-select"}),
+    )
+    file = forms.FileField(
+        label="Файл CSV или XLSX",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control", "accept": ".csv,.xlsx"}
+        ),
+    )
+
+
+class LedgerFilterForm(forms.Form):
+    store = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    date_from = forms.DateField(
+        label="С",
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    date_to = forms.DateField(
+        label="По",
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+    def filter(self, queryset):
+        if self.cleaned_data["store"]:
+            queryset = queryset.filter(store_id=self.cleaned_data["store"])
+        if self.cleaned_data["date_from"]:
+            queryset = queryset.filter(date__gte=self.cleaned_data["date_from"])
+        if self.cleaned_data["date_to"]:
+            queryset = queryset.filter(date__lte=self.cleaned_data["date_to"])
+        return queryset
+
+
+class SupplyFilterForm(LedgerFilterForm):
+    unpaid = forms.BooleanField(
+        label="Только неоплаченные",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
+
+    def filter(self, queryset):
+        queryset = super().filter(queryset)
+        if self.cleaned_data["unpaid"]:
+            queryset = queryset.filter(outstanding__gt=0)
+        return queryset
+
+
+class AgingReportForm(forms.Form):
+    as_of = forms.DateField(
+        label="На дату",
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+
+class ActBatchForm(forms.Form):
+    period_start = forms.DateField(
+        label="Дата начала промежутка",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    period_end = forms.DateField(
+        label="Дата конца промежутка",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("period_start")
+        end = cleaned_data.get("period_end")
+        if start and end and start > end:
+            raise forms.ValidationError("Дата начала позже даты конца периода")
+        return cleaned_data
@@ -0,0 +1,333 @@
+import csv
+import io
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from .aging import reallocate_store
+from .balances import (
+    closing_dates,
+    recompute_daily_balances,
+    recompute_store_balances,
+)
+from .exports import SUPPLY_HEADER, TRANSACTION_HEADER
+from .models import (
+    ArchivedSupply,
+    PaymentAllocation,
+    Store,
+    Supply,
+    Transaction,
+    transaction_fingerprint,
+)
+
+CENT = Decimal("0.01")
+MAX_PRICE = Decimal("9999999999.99")
+MAX_REPORTED_ERRORS = 1000
+
+KINDS = {
+    "supply": Supply,
+    "transaction": Transaction,
+}
+
+# Заголовки выгрузок поставок и поступлений, чтобы выгрузку можно было
+# загрузить обратно. ID выгруженного поступления при загрузке не читается.
+COLUMN_ALIASES = {
+    header.lower(): column
+    for headers in (SUPPLY_HEADER, TRANSACTION_HEADER)
+    for header, column in zip(headers, ("id", "date", "price", "store"))
+}
+
+
+class LedgerImportError(Exception):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+class StoreLookup:
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+        ambiguous = set()
+        for pk, name in Store.objects.values_list("pk", "name").iterator():
+            self.by_id[str(pk)] = pk
+            key = name.strip().casefold()
+            if key in self.by_name:
+                ambiguous.add(key)
+            self.by_name[key] = pk
+        for key in ambiguous:
+            self.by_name[key] = None
+
+    def resolve(self, value):
+        value = str(value).strip()
+        if value in self.by_id:
+            return self.by_id[value]
+        key = value.casefold()
+        if key not in self.by_name:
+            raise ValueError(f"магазин «{value}» не найден")
+        if self.by_name[key] is None:
+            raise ValueError(f"несколько магазинов с названием «{value}», укажите ID")
+        return self.by_name[key]
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"некорректная дата «{value}»")
+
+
+def parse_price(value):
+    if isinstance(value, float):
+        value = str(value)
+    if not isinstance(value, (int, Decimal)):
+        value = str(value or "").strip().replace("\xa0", "").replace(" ", "")
+        value = value.replace(",", ".")
+    try:
+        price = Decimal(value).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"некорректная сумма «{value}»")
+    if price <= 0 or price > MAX_PRICE:
+        raise ValueError(f"сумма вне допустимого диапазона: {price}")
+    return price
+
+
+def read_csv(stream):
+    reader = csv.reader(stream, delimiter=_sniff_delimiter(stream))
+    header = next(reader, None)
+    if header is None:
+        return
+    yield [column.strip().lower() for column in header]
+    yield from reader
+
+
+def _sniff_delimiter(stream):
+    sample = stream.readline()
+    stream.seek(0)
+    return ";" if sample.count(";") > sample.count(",") else ","
+
+
+def read_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise LedgerImportError("Для импорта XLSX установите пакет openpyxl")
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield [str(column or "").strip().lower() for column in header]
+        yield from rows
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    if filename.lower().endswith(".xlsx"):
+        return read_xlsx(fileobj)
+    if isinstance(fileobj, io.TextIOBase):
+        return read_csv(fileobj)
+    return read_csv(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+
+
+class LedgerImporter:
+    """
+    Потоковый импорт поставок или поступлений.
+
+    Строки читаются по одной, проверяются без ModelForm и пишутся пачками
+    через bulk_create, каждая пачка в своей транзакции. Балансы затронутых
+    магазинов пересчитываются в конце, так как bulk_create не шлет сигналы,
+    а открытые позиции переразносятся с самой ранней затронутой даты.
+
+    Поступления получают отпечаток из номера документа (колонка
+    ``source_id``) или из магазина, даты, суммы и порядкового номера
+    одинаковых платежей в выписке, поэтому повторная загрузка
+    пересекающейся выписки не создает дублей.
+    """
+
+    required_columns = {
+        "supply": ("id", "date", "price", "store"),
+        "transaction": ("date", "price", "store"),
+    }
+
+    def __init__(self, kind, batch_size=2000):
+        if kind not in KINDS:
+            raise LedgerImportError(f"Неизвестный тип данных: {kind}")
+        self.kind = kind
+        self.model = KINDS[kind]
+        self.batch_size = batch_size
+        self.stores = StoreLookup()
+        self.closed = closing_dates()
+        # Магазин -> самая ранняя дата затронутых строк.
+        self.touched_stores = {}
+        self.sequences = {}
+
+    def run(self, rows, progress=None):
+        report = ImportReport()
+        started = time.perf_counter()
+        rows = iter(rows)
+        try:
+            header = next(rows, None)
+            if header is None:
+                raise LedgerImportError("Файл пуст")
+            columns = self._columns(header)
+
+            line = 1
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                batch = []
+                for values in chunk:
+                    line += 1
+                    if not any(value not in (None, "") for value in values):
+                        continue
+                    report.rows += 1
+                    try:
+                        batch.append(self.build(values, columns))
+                    except (ValueError, IndexError) as error:
+                        report.add_error(line, str(error))
+                imported, skipped = self.write(batch)
+                report.imported += imported
+                report.skipped += skipped
+                if progress is not None:
+                    progress(report.rows)
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise LedgerImportError(f"Не удалось прочитать файл: {error}")
+        finally:
+            if self.touched_stores:
+                self.refresh_balances()
+            report.elapsed = time.perf_counter() - started
+        return report
+
+    def _columns(self, header):
+        columns = {
+            COLUMN_ALIASES.get(name, name): position
+            for position, name in enumerate(header)
+        }
+        missing = [
+            name for name in self.required_columns[self.kind] if name not in columns
+        ]
+        if missing:
+            raise LedgerImportError(f"Нет обязательных колонок: {', '.join(missing)}")
+        return columns
+
+    def build(self, values, columns):
+        fields = {
+            "date": parse_date(values[columns["date"]]),
+            "price": parse_price(values[columns["price"]]),
+            "store_id": self.stores.resolve(values[columns["store"]]),
+        }
+        closed = self.closed.get(fields["store_id"])
+        if closed is not None and fields["date"] <= closed:
+            raise ValueError(f"период по {closed:%d.%m.%Y} закрыт")
+        if self.kind == "supply":
+            supply_id = values[columns["id"]]
+            if isinstance(supply_id, float) and supply_id.is_integer():
+                supply_id = int(supply_id)
+            supply_id = str(supply_id or "").strip()
+            if not supply_id or len(supply_id) > 64:
+                raise ValueError(f"некорректный ID поставки «{supply_id}»")
+            fields["id"] = supply_id
+        else:
+            source_id = None
+            if "source_id" in columns:
+                source_id = str(values[columns["source_id"]] or "").strip()
+            key = (fields["store_id"], fields["date"], fields["price"])
+            sequence = self.sequences.get(key, 0)
+            self.sequences[key] = sequence + 1
+            fields["fingerprint"] = transaction_fingerprint(
+                *key, sequence=sequence, source_id=source_id
+            )
+        return self.model(**fields)
+
+    def write(self, batch):
+        if not batch:
+            return 0, 0
+        with transaction.atomic():
+            if self.kind == "supply":
+                unique = {supply.id: supply for supply in batch}
+                existing = Supply.objects.filter(pk__in=list(unique))
+                # Поставки закрытого периода, в том числе архивные, не
+                # перезаписываются.
+                locked = set(
+                    ArchivedSupply.objects.filter(pk__in=list(unique)).values_list(
+                        "pk", flat=True
+                    )
+                )
+                for pk, store_id, day in existing.values_list("pk", "store_id", "date"):
+                    if store_id in self.closed and day <= self.closed[store_id]:
+                        locked.add(pk)
+                entries = [supply for pk, supply in unique.items() if pk not in locked]
+                existing = existing.exclude(pk__in=locked)
+                self.touch(existing.values_list("store_id", "date"))
+                # Поставка может перейти в другой магазин, ее разнесения
+                # не попадут в хвост ни одного из них.
+                PaymentAllocation.objects.filter(supply__in=existing).delete()
+                Supply.objects.bulk_create(
+                    entries,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=["price", "date", "store", "updated_at"],
+                )
+                skipped = len(batch) - len(entries)
+            else:
+                unique = {entry.fingerprint: entry for entry in batch}
+                existing = set(
+                    Transaction.objects.filter(
+                        fingerprint__in=list(unique)
+                    ).values_list("fingerprint", flat=True)
+                )
+                entries = [
+                    entry
+                    for fingerprint, entry in unique.items()
+                    if fingerprint not in existing
+                ]
+                Transaction.objects.bulk_create(entries, ignore_conflicts=True)
+                skipped = len(batch) - len(entries)
+        self.touch((entry.store_id, entry.date) for entry in entries)
+        return len(entries), skipped
+
+    def touch(self, rows):
+        for store_id, day in rows:
+            earliest = self.touched_stores.get(store_id)
+            if earliest is None or day < earliest:
+                self.touched_stores[store_id] = day
+
+    def refresh_balances(self):
+        store_ids = sorted(self.touched_stores)
+        with transaction.atomic():
+            recompute_store_balances(store_ids)
+            recompute_daily_balances(store_ids)
+            for store_id in store_ids:
+                reallocate_store(store_id, self.touched_stores[store_id])
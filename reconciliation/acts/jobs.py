@@ -0,0 +1,374 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import date, timedelta
+from multiprocessing import get_context
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .balances import refresh_summary_lines
+from .batch import generate_acts
+from .importers import LedgerImporter, LedgerImportError, read_rows
+from .models import Job, Store, Summary
+
+logger = logging.getLogger("acts.jobs")
+
+# Прогресс пишется в строку задачи не чаще, чем раз в столько секунд.
+PROGRESS_INTERVAL = 1.0
+# Сколько задач из начала очереди пробует захватить воркер за один заход.
+CLAIM_CANDIDATES = 5
+
+JOB_HANDLERS = {}
+
+
+class JobError(Exception):
+    """Ошибка в данных задачи: повтор не поможет, задача сразу падает."""
+
+
+def job_handler(kind, max_attempts=3):
+    def register(function):
+        function.max_attempts = max_attempts
+        JOB_HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def owned(job):
+    """Строка задачи, пока ее выполняет захвативший ее воркер."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+
+
+class JobRun:
+    """
+    Выполнение захваченной задачи: параметры, прогресс и файл результата.
+
+    Каждая запись прогресса заодно служит сигналом, что воркер жив.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.params = job.params
+        self.output = ""
+        self._written = 0.0
+
+    def progress(self, done, total=None, message=None):
+        now = time.monotonic()
+        if now - self._written < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._written = now
+        fields = {"progress": done, "heartbeat": timezone.now()}
+        if total is not None:
+            fields["total"] = total
+        if message is not None:
+            fields["message"] = message
+        owned(self.job).update(**fields)
+
+    def output_path(self, filename):
+        directory = Path(settings.JOBS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.output = filename
+        return directory / filename
+
+
+class Heartbeat(threading.Thread):
+    """
+    Отметки воркера в захваченной задаче раз в ``JOB_HEARTBEAT_SECONDS``.
+
+    Обработчик может подолгу не писать прогресс (удаление магазина,
+    пересчет остатков после загрузки), а задачу без отметок
+    ``requeue_stale`` отдал бы другому воркеру.
+    """
+
+    def __init__(self, job):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_SECONDS):
+                try:
+                    owned(self.job).update(heartbeat=timezone.now())
+                except DatabaseError:
+                    logger.warning("Задача %s: отметка не записана", self.job.pk)
+        finally:
+            # У потока свои соединения, после него они не нужны.
+            connections.close_all()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+
+
+def job_file(job):
+    return Path(settings.JOBS_DIR) / job.output
+
+
+def save_upload(upload):
+    """Сохраняет загруженный файл для задачи и возвращает путь к нему."""
+    directory = Path(settings.JOBS_DIR) / "uploads"
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{uuid4().hex}{Path(upload.name).suffix.lower()}"
+    with open(path, "wb") as stream:
+        for chunk in upload.chunks():
+            stream.write(chunk)
+    return str(path)
+
+
+def enqueue(kind, params=None, user=None):
+    return Job.objects.create(
+        kind=kind,
+        params=params or {},
+        user=user,
+        max_attempts=JOB_HANDLERS[kind].max_attempts,
+    )
+
+
+def requeue_stale():
+    """
+    Задачи, воркер которых пропал без сигнала дольше ``JOB_STALE_SECONDS``,
+    возвращаются в очередь или падают, если попытки кончились.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        heartbeat__lt=now - timedelta(seconds=settings.JOB_STALE_SECONDS),
+    )
+    stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.PENDING, worker="", run_after=now
+    )
+    stale.update(status=Job.FAILED, finished=now, error="Воркер перестал отвечать")
+
+
+def claim_job(worker):
+    """
+    Захват следующей задачи очереди.
+
+    Захват — условный UPDATE по статусу: из воркеров, выбравших одну
+    строку, ее получает тот, чей UPDATE изменил одну строку. Так очередь
+    работает и в SQLite, где нет SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+        .order_by("run_after", "pk")
+        .values_list("pk", flat=True)
+    )
+    for pk in list(candidates[:CLAIM_CANDIDATES]):
+        claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            worker=worker,
+            attempts=F("attempts") + 1,
+            started=now,
+            heartbeat=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """
+    Выполняет захваченную задачу и записывает итог.
+
+    Итог пишется, только пока задача числится за этим воркером: если ее
+    уже вернули в очередь и отдали другому, чужую строку не трогаем.
+    """
+    run = JobRun(job)
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise JobError(f"Неизвестный тип задачи: {job.kind}")
+        with Heartbeat(job):
+            result = handler(run)
+    except JobError as error:
+        logger.warning("Задача %s (%s): %s", job.pk, job.kind, error)
+        now = timezone.now()
+        finish(job, status=Job.FAILED, error=str(error), worker="", finished=now)
+        return False
+    except Exception:
+        logger.exception("Задача %s (%s) завершилась ошибкой", job.pk, job.kind)
+        now = timezone.now()
+        fields = {"error": traceback.format_exc(), "worker": ""}
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            fields.update(status=Job.PENDING, run_after=now + timedelta(seconds=delay))
+        else:
+            fields.update(status=Job.FAILED, finished=now)
+        finish(job, **fields)
+        return False
+
+    now = timezone.now()
+    if not finish(
+        job,
+        status=Job.DONE,
+        result=result,
+        output=run.output,
+        error="",
+        finished=now,
+        heartbeat=now,
+    ):
+        return False
+    logger.info("Задача %s (%s) выполнена", job.pk, job.kind)
+    return True
+
+
+def finish(job, **fields):
+    """Записывает итог задачи, если она все еще за этим воркером."""
+    if owned(job).update(**fields):
+        return True
+    logger.warning("Задача %s (%s) уже не за этим воркером", job.pk, job.kind)
+    return False
+
+
+def work(worker=None, poll=None, burst=False, stop=None):
+    """
+    Цикл воркера: берет задачи по одной, пока не будет установлен ``stop``.
+
+    С ``burst`` выходит, когда очередь пуста. Возвращает число
+    выполненных задач.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    poll = settings.JOB_POLL_SECONDS if poll is None else poll
+    stop = stop or threading.Event()
+    processed = 0
+    while not stop.is_set():
+        # Граница задачи: соединение закрывается или переиспользуется по
+        # CONN_MAX_AGE так же, как после ответа представления.
+        close_old_connections()
+        requeue_stale()
+        job = claim_job(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll)
+            continue
+        run_job(job)
+        processed += 1
+    close_old_connections()
+    return processed
+
+
+def _worker_main(poll, burst):
+    stop = threading.Event()
+    # Текущая задача доделывается, новая уже не берется.
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    return work(poll=poll, burst=burst, stop=stop)
+
+
+def run_workers(count=1, poll=None, burst=False):
+    """
+    Запускает ``count`` процессов-воркеров и ждет их завершения.
+
+    Один воркер работает в текущем процессе. SIGTERM пересылается
+    дочерним процессам, каждый доделывает свою задачу и выходит.
+    """
+    if count == 1:
+        _worker_main(poll, burst)
+        return
+    # Дочерние процессы наследуют настроенный Django, но не соединения с БД.
+    connections.close_all()
+    context = get_context("fork")
+    processes = [
+        context.Process(target=_worker_main, args=(poll, burst)) for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    previous = signal.signal(signal.SIGTERM, forward)
+    try:
+        for process in processes:
+            while process.is_alive():
+                try:
+                    process.join()
+                except KeyboardInterrupt:
+                    # SIGINT из терминала уже получила вся группа процессов.
+                    continue
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+@job_handler("import_ledger")
+def run_import(run):
+    path = run.params["path"]
+    try:
+        with open(path, "rb") as stream:
+            report = LedgerImporter(run.params["kind"]).run(
+                read_rows(stream, run.params["filename"]),
+                progress=lambda rows: run.progress(
+                    rows, message=f"Обработано строк: {rows}"
+                ),
+            )
+    except LedgerImportError as error:
+        os.remove(path)
+        raise JobError(str(error))
+    os.remove(path)
+    return {
+        "rows": report.rows,
+        "imported": report.imported,
+        "skipped": report.skipped,
+        "error_count": report.error_count,
+        "errors": report.errors,
+        "elapsed": report.elapsed,
+    }
+
+
+@job_handler("generate_acts", max_attempts=1)
+def run_act_batch(run):
+    # Акты создаются по ходу работы, повтор после сбоя задвоил бы их.
+    start = date.fromisoformat(run.params["period_start"])
+    end = date.fromisoformat(run.params["period_end"])
+    output = run.output_path(f"acts_{start:%Y%m%d}_{end:%Y%m%d}_{run.job.pk}.zip")
+    report = generate_acts(
+        start,
+        end,
+        output,
+        store_ids=run.params.get("store_ids"),
+        progress=lambda done, total: run.progress(
+            done, total, message=f"Магазинов: {done} из {total}"
+        ),
+    )
+    return {
+        "stores": report.stores,
+        "acts": report.acts,
+        "lines": report.lines,
+        "elapsed": report.elapsed,
+    }
+
+
+@job_handler("refresh_summary")
+def run_summary_refresh(run):
+    summary = Summary.objects.filter(pk=run.params["summary_id"]).first()
+    if summary is None:
+        raise JobError("Сводка удалена")
+    return {"lines": len(refresh_summary_lines(summary))}
+
+
+@job_handler("delete_store")
+def run_store_delete(run):
+    store = Store.objects.filter(pk=run.params["store_id"]).first()
+    if store is None:
+        return {"deleted": 0}
+    run.progress(0, 1, message=f"Удаление магазина «{store}»")
+    deleted, _ = store.delete()
+    return {"deleted": deleted}
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from acts.bench import ROLES, run_concurrency_benchmark
+
+ROLE_TITLES = {"writer": "запись", "reader": "чтение"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает профили БД параллельными записью и чтением и сравнивает "
+        "пропускную способность и ошибки блокировки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="append",
+            dest="profiles",
+            help="Профиль DB_PROFILE (можно указать несколько раз, "
+            "по умолчанию sqlite-plain и sqlite)",
+        )
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Длительность, секунд"
+        )
+        parser.add_argument("--stores", type=int, default=50)
+        parser.add_argument("--json", help="Сохранить результаты в JSON-файл")
+
+    def handle(self, *args, profiles=None, **options):
+        summaries = run_concurrency_benchmark(
+            profiles or ["sqlite-plain", "sqlite"],
+            writers=options["writers"],
+            readers=options["readers"],
+            duration=options["duration"],
+            stores=options["stores"],
+        )
+        for summary in summaries:
+            self.stdout.write(self.style.MIGRATE_HEADING(summary["profile"]))
+            for role in ROLES:
+                result = summary[role]
+                self.stdout.write(
+                    f"  {ROLE_TITLES[role]}: {result['workers']} процессов, "
+                    f"{result['per_second']:.1f} оп/с, "
+                    f"p50 {result['p50_ms']:.1f} мс, p95 {result['p95_ms']:.1f} мс, "
+                    f"блокировок {result['locked']}, других ошибок {result['errors']}"
+                )
+        if options["json"]:
+            with open(options["json"], "w") as stream:
+                json.dump(summaries, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты: {options['json']}"))
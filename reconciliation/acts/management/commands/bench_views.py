@@ -0,0 +1,76 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.bench import run_view_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время и число запросов основных страниц на синтетическом "
+        "леджере разного объема во временной БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10_000, 100_000, 1_000_000],
+            help="Объемы леджера, строк",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--stores", type=int, default=100)
+        parser.add_argument("--skew", type=float, default=1.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", default="bench_views.json", help="Файл с результатами"
+        )
+
+    def handle(self, *args, **options):
+        results = run_view_benchmark(
+            options["sizes"],
+            repeat=options["repeat"],
+            stores=options["stores"],
+            skew=options["skew"],
+            seed=options["seed"],
+        )
+
+        over_budget = []
+        for result in results:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{result['rows']} строк, {result['stores']} магазинов"
+                )
+            )
+            for name, view in result["views"].items():
+                line = (
+                    f"  {name}: {view['median_ms']:.1f} мс "
+                    f"(макс. {view['max_ms']:.1f}), "
+                    f"запросов {view['queries']} из {view['budget']}"
+                )
+                if view["queries"] > view["budget"]:
+                    over_budget.append(f"{name} на {result['rows']} строк")
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+
+        with open(options["output"], "w") as stream:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "django": django.get_version(),
+                    "db_profile": settings.DB_PROFILE,
+                    "repeat": options["repeat"],
+                    "results": results,
+                },
+                stream,
+                ensure_ascii=False,
+                indent=2,
+            )
+        self.stdout.write(f"Результаты: {options['output']}")
+
+        if over_budget:
+            raise CommandError("Превышен лимит запросов: " + ", ".join(over_budget))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from acts.cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Показывает попадания и промахи кэша главной страницы, карточек "
+        "магазинов и HTML страниц"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Обнулить счетчики после вывода"
+        )
+
+    def handle(self, *args, reset=False, **options):
+        for section, counters in stats().items():
+            total = counters["hits"] + counters["misses"]
+            ratio = counters["hits"] / total if total else 0.0
+            self.stdout.write(
+                f"{section}: попаданий {counters['hits']}, "
+                f"промахов {counters['misses']} ({ratio:.0%})"
+            )
+        if reset:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Счетчики обнулены"))
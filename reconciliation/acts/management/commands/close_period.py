@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.closing import close_period
+from acts.importers import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        "Закрывает период: фиксирует входящее сальдо магазинов на дату и "
+        "переносит погашенные строки закрытого периода в архив"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            type=parse_date,
+            required=True,
+            help="Последний день закрываемого периода",
+        )
+        parser.add_argument(
+            "--store",
+            type=int,
+            action="append",
+            dest="stores",
+            help="ID магазина (можно указать несколько раз, по умолчанию все)",
+        )
+
+    def handle(self, *args, stores=None, **options):
+        if options["date"] >= date.today():
+            raise CommandError("Закрыть можно только прошедший период")
+        openings = close_period(options["date"], stores)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Период по {options['date']:%d.%m.%Y} закрыт "
+                f"для магазинов: {len(openings)}"
+            )
+        )
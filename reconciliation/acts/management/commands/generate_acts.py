@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.batch import generate_acts
+from acts.importers import parse_date
+
+
+class Command(BaseCommand):
+    help = "Формирует акты сверки за период для всех магазинов и упаковывает их в ZIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=parse_date, required=True)
+        parser.add_argument("--end", type=parse_date, required=True)
+        parser.add_argument(
+            "--store",
+            type=int,
+            action="append",
+            dest="stores",
+            help="ID магазина (можно указать несколько раз)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Число процессов рендеринга (по умолчанию по числу ядер)",
+        )
+        parser.add_argument("--output", help="Путь к ZIP-архиву")
+
+    def handle(self, *args, start, end, stores=None, workers=None, **options):
+        if start > end:
+            raise CommandError("Дата начала позже даты конца периода")
+        output = options["output"] or f"acts_{start:%Y%m%d}_{end:%Y%m%d}.zip"
+
+        report = generate_acts(start, end, output, store_ids=stores, workers=workers)
+        self.stdout.write(
+            f"Магазинов: {report.stores}, актов: {report.acts}, "
+            f"строк: {report.lines}, процессов: {report.workers}"
+        )
+        self.stdout.write(
+            f"Запросы: {report.query_time:.2f} с, "
+            f"рендеринг и архив: {report.render_time:.2f} с, "
+            f"всего: {report.elapsed:.2f} с ({report.acts_per_second:.0f} актов/с)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Архив: {output}"))
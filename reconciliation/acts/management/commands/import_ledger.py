@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.importers import KINDS, LedgerImporter, LedgerImportError, read_rows
+
+
+class Command(BaseCommand):
+    help = "Импортирует поставки или поступления из CSV/XLSX файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(KINDS))
+        parser.add_argument("path", help="Путь к CSV или XLSX файлу")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, kind, path, batch_size, **options):
+        if path.lower().endswith(".xlsx"):
+            fileobj = open(path, "rb")
+        else:
+            fileobj = open(path, encoding="utf-8-sig", newline="")
+
+        try:
+            with fileobj:
+                importer = LedgerImporter(kind, batch_size=batch_size)
+                report = importer.run(read_rows(fileobj, path))
+        except (OSError, LedgerImportError) as error:
+            raise CommandError(error)
+
+        for line, message in report.errors:
+            self.stderr.write(f"Строка {line}: {message}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(
+                f"... и еще {report.error_count - len(report.errors)} ошибок"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано строк: {report.rows}, импортировано: {report.imported}, "
+                f"пропущено дублей: {report.skipped}, "
+                f"ошибок: {report.error_count}, {report.elapsed:.1f} с "
+                f"({report.rows_per_second:.0f} строк/с)"
+            )
+        )
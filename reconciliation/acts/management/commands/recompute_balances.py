@@ -0,0 +1,108 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.balances import (
+    BALANCE_FIELDS,
+    compute_daily_balances,
+    compute_store_balances,
+    open_period,
+    recompute_daily_balances,
+    recompute_store_balances,
+)
+from acts.models import StoreBalance, StoreDailyBalance
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает или проверяет материализованные балансы магазинов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить сохраненные балансы с леджером, ничего не меняя",
+        )
+        parser.add_argument(
+            "--store",
+            type=int,
+            action="append",
+            dest="stores",
+            help="ID магазина (можно указать несколько раз)",
+        )
+
+    def handle(self, *args, verify=False, stores=None, **options):
+        if not verify:
+            balances = recompute_store_balances(stores)
+            daily = recompute_daily_balances(stores)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Пересчитано балансов: {len(balances)}, "
+                    f"дневных балансов: {len(daily)}"
+                )
+            )
+            return
+
+        mismatches = self.verify_store_balances(stores)
+        mismatches += self.verify_daily_balances(stores)
+        if mismatches:
+            raise CommandError(f"Балансов с расхождениями: {mismatches}")
+        self.stdout.write(self.style.SUCCESS("Балансы совпадают с леджером"))
+
+    def verify_store_balances(self, stores):
+        queryset = StoreBalance.objects.all()
+        if stores is not None:
+            queryset = queryset.filter(store_id__in=stores)
+        stored = {balance.store_id: balance for balance in queryset}
+
+        mismatches = 0
+        for expected in compute_store_balances(stores):
+            actual = stored.get(expected.store_id)
+            diff = [
+                field
+                for field in BALANCE_FIELDS
+                if actual is None or getattr(actual, field) != getattr(expected, field)
+            ]
+            if diff:
+                mismatches += 1
+                self.stdout.write(
+                    f"Магазин {expected.store_id}: расхождение в {', '.join(diff)}"
+                )
+        return mismatches
+
+    def verify_daily_balances(self, stores):
+        expected = defaultdict(dict)
+        for balance in compute_daily_balances(stores):
+            expected[balance.store_id][balance.date] = (
+                balance.supply_total,
+                balance.transaction_total,
+            )
+        expected_days = {store_id: sorted(days) for store_id, days in expected.items()}
+
+        # Дневные балансы закрытых периодов не пересчитываются.
+        queryset = open_period(StoreDailyBalance.objects.order_by("store", "date"))
+        if stores is not None:
+            queryset = queryset.filter(store_id__in=stores)
+
+        mismatches = 0
+        seen = set()
+        for row in queryset.iterator():
+            days = expected_days.get(row.store_id, [])
+            position = bisect_right(days, row.date)
+            totals = expected[row.store_id][days[position - 1]] if position else (0, 0)
+            seen.add((row.store_id, row.date))
+            if (row.supply_total, row.transaction_total) != totals:
+                mismatches += 1
+                self.stdout.write(
+                    f"Магазин {row.store_id}: расхождение на {row.date:%d.%m.%Y}"
+                )
+
+        for store_id, days in expected.items():
+            for day in days:
+                if (store_id, day) not in seen:
+                    mismatches += 1
+                    self.stdout.write(
+                        f"Магазин {store_id}: нет дневного баланса "
+                        f"на {day:%d.%m.%Y}"
+                    )
+        return mismatches
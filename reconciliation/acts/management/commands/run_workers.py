@@ -0,0 +1,43 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает воркеры фоновых задач: импорт, формирование актов, пересчет "
+        "сводок и удаление магазинов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Число процессов-воркеров"
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=None,
+            help="Пауза между опросами пустой очереди, секунд "
+            "(по умолчанию JOB_POLL_SECONDS)",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Выйти, когда очередь опустеет",
+        )
+
+    def handle(self, *args, workers=1, poll=None, burst=False, **options):
+        if workers < 1:
+            raise CommandError("Нужен хотя бы один воркер")
+        if isinstance(caches["default"], LocMemCache):
+            # Задачи сбрасывают кэш страниц, а кэш в памяти воркера до
+            # веб-процессов не доходит.
+            raise CommandError(
+                "Воркерам нужен общий с веб-процессами кэш: задайте "
+                "CACHE_BACKEND=file и общий CACHE_LOCATION"
+            )
+        self.stdout.write(f"Воркеров: {workers}, остановка по Ctrl+C или SIGTERM")
+        run_workers(workers, poll=poll, burst=burst)
+        self.stdout.write(self.style.SUCCESS("Воркеры остановлены"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from acts.bench import BENCH_DAYS, BENCH_START, seed_ledger
+from acts.importers import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими поставками и поступлениями "
+        "с неравномерным распределением по магазинам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stores", type=int, default=100)
+        parser.add_argument("--supplies", type=int, default=0)
+        parser.add_argument("--transactions", type=int, default=0)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Показатель закона Ципфа: 0 — поровну, больше — крупнее лидеры",
+        )
+        parser.add_argument("--start", type=parse_date, default=BENCH_START)
+        parser.add_argument("--days", type=int, default=BENCH_DAYS)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["stores"] < 1 or options["days"] < 1:
+            raise CommandError("Нужен хотя бы один магазин и один день")
+        report = seed_ledger(
+            options["stores"],
+            supplies=options["supplies"],
+            transactions=options["transactions"],
+            skew=options["skew"],
+            start=options["start"],
+            days=options["days"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            f"Магазинов: {report['stores']} (новых {report['created_stores']}), "
+            f"поставок: {report['supplies']}, поступлений: {report['transactions']}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Готово за {report['elapsed']:.1f} с"))
@@ -0,0 +1,71 @@
+import os
+
+from django.db.models import Sum
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .models import Store, StoreBalance
+
+REQUEST_LATENCY = Histogram(
+    "acts_request_latency_seconds",
+    "Время ответа по имени маршрута",
+    ["view"],
+)
+REQUEST_QUERIES = Histogram(
+    "acts_request_queries",
+    "Число SQL-запросов на ответ по имени маршрута",
+    ["view"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float("inf")),
+)
+
+
+class LedgerCollector:
+    """
+    Размер леджера на момент опроса.
+
+    Поставки и поступления берутся из счетчиков ``StoreBalance``, а не
+    COUNT(*) по таблицам, поэтому опрос стоит двух коротких запросов.
+    """
+
+    def _family(self):
+        return GaugeMetricFamily(
+            "acts_ledger_rows", "Число строк в таблицах леджера", labels=["model"]
+        )
+
+    def describe(self):
+        yield self._family()
+
+    def collect(self):
+        totals = StoreBalance.objects.aggregate(
+            supply=Sum("supply_count"), transaction=Sum("transaction_count")
+        )
+        family = self._family()
+        family.add_metric(["supply"], totals["supply"] or 0)
+        family.add_metric(["transaction"], totals["transaction"] or 0)
+        family.add_metric(["store"], Store.objects.count())
+        yield family
+
+
+LEDGER_REGISTRY = CollectorRegistry()
+LEDGER_REGISTRY.register(LedgerCollector())
+
+
+def render_metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+
+    При заданном ``PROMETHEUS_MULTIPROC_DIR`` гистограммы собираются из
+    файлов всех воркеров gunicorn, иначе из памяти текущего процесса.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(LEDGER_REGISTRY)
@@ -0,0 +1,155 @@
+import heapq
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .db import observe_queries
+from .metrics import REQUEST_LATENCY, REQUEST_QUERIES
+
+logger = logging.getLogger("acts.sql")
+
+
+class QueryStats:
+    """
+    Наблюдатель ``observe_queries``: число и время запросов, самые медленные.
+
+    Запросы одного ответа могут идти из нескольких потоков ``run_query``.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+        self.render_started = None
+        self.render_db_started = 0.0
+        self.render_duration = 0.0
+
+    def record(self, duration, sql):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+            entry = (duration, self.count, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        self.render_db_started = self.duration
+        response.add_post_render_callback(self.finish_render)
+
+    def finish_render(self, response):
+        # Ленивые запросы из шаблона уже учтены во времени БД.
+        elapsed = time.perf_counter() - self.render_started
+        self.render_duration = elapsed - (self.duration - self.render_db_started)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Число и время SQL-запросов, рендеринг шаблона и общее время запроса
+    в заголовке ``Server-Timing`` и в логе ``acts.sql`` строкой JSON.
+
+    Запросы дольше ``SQL_SLOW_REQUEST_MS`` пишутся с уровнем WARNING вместе
+    с текстом самых медленных запросов. При выключенном
+    ``SQL_INSTRUMENTATION`` middleware убирается из цепочки при старте.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats(settings.SQL_SLOWEST_COUNT)
+        request.sql_stats = stats
+        started = time.perf_counter()
+        with observe_queries(stats):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={_ms(stats.duration)};desc="SQL: {stats.count}"',
+                f"render;dur={_ms(stats.render_duration)}",
+                f"total;dur={_ms(total)}",
+            ]
+        )
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": stats.count,
+            "db_ms": _ms(stats.duration),
+            "render_ms": _ms(stats.render_duration),
+            "total_ms": _ms(total),
+        }
+        if total * 1000 >= settings.SQL_SLOW_REQUEST_MS:
+            record["slowest"] = [
+                {"ms": _ms(duration), "sql": sql}
+                for duration, _, sql in sorted(stats.slowest, reverse=True)
+            ]
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        request.sql_stats.start_render(response)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Гистограммы времени ответа и числа SQL-запросов по имени маршрута
+    для ``/metrics``. Выключается настройкой ``METRICS_ENABLED``.
+
+    Работает и в синхронной, и в асинхронной цепочке, чтобы под ASGI
+    async-представления не переводились в синхронный режим.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats(0)
+        started = time.perf_counter()
+        with observe_queries(stats):
+            response = self.get_response(request)
+        self.observe(request, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats(0)
+        started = time.perf_counter()
+        with observe_queries(stats):
+            response = await self.get_response(request)
+        self.observe(request, started, stats)
+        return response
+
+    def observe(self, request, started, stats):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        REQUEST_LATENCY.labels(view).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(view).observe(stats.count)
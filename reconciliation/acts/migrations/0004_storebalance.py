@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_balances(apps, schema_editor):
+    Store = apps.get_model("acts", "Store")
+    StoreBalance = apps.get_model("acts", "StoreBalance")
+    Supply = apps.get_model("acts", "Supply")
+    Transaction = apps.get_model("acts", "Transaction")
+
+    supplies = {
+        row["store"]: row
+        for row in Supply.objects.values("store").annotate(
+            total=Sum("price"), count=Count("pk")
+        )
+    }
+    transactions = {
+        row["store"]: row
+        for row in Transaction.objects.values("store").annotate(
+            total=Sum("price"), count=Count("pk")
+        )
+    }
+    balances = []
+    for store_id in Store.objects.values_list("pk", flat=True):
+        supply = supplies.get(store_id, {})
+        payment = transactions.get(store_id, {})
+        supply_total = supply.get("total") or 0
+        transaction_total = payment.get("total") or 0
+        balances.append(
+            StoreBalance(
+                store_id=store_id,
+                supply_total=supply_total,
+                transaction_total=transaction_total,
+                debt=supply_total - transaction_total,
+                supply_count=supply.get("count", 0),
+                transaction_count=payment.get("count", 0),
+            )
+        )
+    StoreBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0003_store_notes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supply_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поставок')),
+                ('transaction_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поступлений')),
+                ('debt', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Долг')),
+                ('supply_count', models.PositiveIntegerField(default=0, verbose_name='Количество поставок')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='Количество поступлений')),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='acts.store', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'баланс магазина',
+                'verbose_name_plural': 'Балансы магазинов',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-18 08:55
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_daily_balances(apps, schema_editor):
+    StoreDailyBalance = apps.get_model("acts", "StoreDailyBalance")
+    Supply = apps.get_model("acts", "Supply")
+    Transaction = apps.get_model("acts", "Transaction")
+
+    zero = Decimal("0.00")
+    days = defaultdict(lambda: [zero, zero])
+    for index, model in enumerate((Supply, Transaction)):
+        for row in model.objects.values("store", "date").annotate(total=Sum("price")):
+            days[row["store"], row["date"]][index] += row["total"]
+
+    running = {}
+    balances = []
+    for store_id, day in sorted(days):
+        supply_total, transaction_total = running.get(store_id, (zero, zero))
+        supply_day, transaction_day = days[store_id, day]
+        running[store_id] = (
+            supply_total + supply_day,
+            transaction_total + transaction_day,
+        )
+        balances.append(
+            StoreDailyBalance(
+                store_id=store_id,
+                date=day,
+                supply_total=running[store_id][0],
+                transaction_total=running[store_id][1],
+            )
+        )
+    StoreDailyBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0004_storebalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('supply_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поставок на конец дня')),
+                ('transaction_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поступлений на конец дня')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='acts.store', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'дневной баланс магазина',
+                'verbose_name_plural': 'Дневные балансы магазинов',
+                'constraints': [models.UniqueConstraint(fields=('store', 'date'), name='unique_store_daily_balance')],
+            },
+        ),
+        migrations.RunPython(populate_daily_balances, migrations.RunPython.noop),
+    ]
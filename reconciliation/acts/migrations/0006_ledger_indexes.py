@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0005_storedailybalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(fields=['store', 'date', 'price'], name='supply_store_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(fields=['date', 'id'], name='supply_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['store', 'date', 'price'], name='transaction_store_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date', 'id'], name='transaction_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0006_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Отпечаток загрузки'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0007_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storebalance',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия леджера'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_summary_lines(apps, schema_editor):
+    Summary = apps.get_model("acts", "Summary")
+    SummaryLine = apps.get_model("acts", "SummaryLine")
+    StoreDailyBalance = apps.get_model("acts", "StoreDailyBalance")
+
+    cent = Decimal("0.01")
+
+    def total(field, day):
+        return Subquery(
+            StoreDailyBalance.objects.filter(store=OuterRef("pk"), date__lte=day)
+            .order_by("-date")
+            .values(field)[:1]
+        )
+
+    def amount(value):
+        return Decimal(str(value or 0)).quantize(cent)
+
+    lines = []
+    for summary in Summary.objects.iterator():
+        before = summary.period_start - timedelta(days=1)
+        rows = summary.stores.annotate(
+            supply_before=total("supply_total", before),
+            transaction_before=total("transaction_total", before),
+            supply_after=total("supply_total", summary.period_end),
+            transaction_after=total("transaction_total", summary.period_end),
+        ).values_list(
+            "pk",
+            "supply_before",
+            "transaction_before",
+            "supply_after",
+            "transaction_after",
+        )
+        for store_id, *totals in rows:
+            supply_before, transaction_before, supply_after, transaction_after = map(
+                amount, totals
+            )
+            opening = supply_before - transaction_before
+            supply_total = supply_after - supply_before
+            transaction_total = transaction_after - transaction_before
+            lines.append(
+                SummaryLine(
+                    summary_id=summary.pk,
+                    store_id=store_id,
+                    opening_balance=opening,
+                    supply_total=supply_total,
+                    transaction_total=transaction_total,
+                    closing_balance=opening + supply_total - transaction_total,
+                )
+            )
+    SummaryLine.objects.bulk_create(lines, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0008_storebalance_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сальдо на начало')),
+                ('supply_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поставок')),
+                ('transaction_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поступлений')),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сальдо на конец')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summary_lines', to='acts.store', verbose_name='Магазин')),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='acts.summary', verbose_name='Сводка')),
+            ],
+            options={
+                'verbose_name': 'строка сводки',
+                'verbose_name_plural': 'Строки сводок',
+                'indexes': [models.Index(fields=['summary', 'closing_balance'], name='summary_line_closing_idx')],
+                'constraints': [models.UniqueConstraint(fields=('summary', 'store'), name='unique_summary_line')],
+            },
+        ),
+        migrations.RunPython(populate_summary_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0009_summaryline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(fields=['store', 'date', 'id'], name='supply_store_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['store', 'date', 'id'], name='transaction_store_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 6.0 on 2026-10-18 09:38
+
+from collections import deque
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def allocate_fifo(supplies, payments):
+    """
+    FIFO-разнесение поступлений магазина по его поставкам, как в
+    ``acts.aging.allocate_fifo`` на момент миграции.
+
+    Возвращает строки ``[pk, date, outstanding, paid_date]`` всех поставок
+    и разнесения ``(supply_pk, transaction_pk, amount)``.
+    """
+    lines = []
+    allocations = []
+    unpaid = deque()
+    advances = deque()
+    supplies = iter(supplies)
+    payments = iter(payments)
+    supply = next(supplies, None)
+    payment = next(payments, None)
+
+    while supply is not None or payment is not None:
+        if payment is None or (supply is not None and supply[1] <= payment[1]):
+            pk, day, price = supply
+            line = [pk, day, price, None]
+            lines.append(line)
+            while line[2] > 0 and advances:
+                advance = advances[0]
+                amount = min(advance[1], line[2])
+                line[2] -= amount
+                advance[1] -= amount
+                allocations.append((pk, advance[0], amount))
+                if not advance[1]:
+                    advances.popleft()
+            if line[2] > 0:
+                unpaid.append(line)
+            else:
+                line[3] = day
+            supply = next(supplies, None)
+        else:
+            transaction_pk, day, remaining = payment
+            while remaining > 0 and unpaid:
+                line = unpaid[0]
+                amount = min(remaining, line[2])
+                line[2] -= amount
+                remaining -= amount
+                allocations.append((line[0], transaction_pk, amount))
+                if not line[2]:
+                    line[3] = day
+                    unpaid.popleft()
+            if remaining > 0:
+                advances.append([transaction_pk, remaining])
+            payment = next(payments, None)
+
+    return lines, allocations
+
+
+def populate_open_items(apps, schema_editor):
+    Store = apps.get_model("acts", "Store")
+    Supply = apps.get_model("acts", "Supply")
+    Transaction = apps.get_model("acts", "Transaction")
+    PaymentAllocation = apps.get_model("acts", "PaymentAllocation")
+
+    for store_id in Store.objects.values_list("pk", flat=True).iterator():
+        lines, allocations = allocate_fifo(
+            Supply.objects.filter(store_id=store_id)
+            .order_by("date", "pk")
+            .values_list("pk", "date", "price"),
+            Transaction.objects.filter(store_id=store_id)
+            .order_by("date", "pk")
+            .values_list("pk", "date", "price"),
+        )
+        Supply.objects.bulk_update(
+            [
+                Supply(pk=pk, outstanding=outstanding, paid_date=paid_date)
+                for pk, _, outstanding, paid_date in lines
+            ],
+            ["outstanding", "paid_date"],
+            batch_size=500,
+        )
+        PaymentAllocation.objects.bulk_create(
+            [
+                PaymentAllocation(
+                    supply_id=supply_id, transaction_id=transaction_id, amount=amount
+                )
+                for supply_id, transaction_id, amount in allocations
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0010_ledger_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'разнесение платежа',
+                'verbose_name_plural': 'Разнесения платежей',
+            },
+        ),
+        migrations.AddField(
+            model_name='supply',
+            name='outstanding',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Остаток к оплате'),
+        ),
+        migrations.AddField(
+            model_name='supply',
+            name='paid_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Дата полной оплаты'),
+        ),
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(condition=models.Q(('outstanding__gt', 0)), fields=['date', 'id'], name='supply_open_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(condition=models.Q(('outstanding__gt', 0)), fields=['store', 'date', 'id'], name='supply_open_store_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supply',
+            index=models.Index(fields=['store', 'paid_date'], name='supply_store_paid_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentallocation',
+            name='supply',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='acts.supply', verbose_name='Поставка'),
+        ),
+        migrations.AddField(
+            model_name='paymentallocation',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='acts.transaction', verbose_name='Платеж'),
+        ),
+        migrations.RunPython(populate_open_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 6.0 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0011_supply_open_items'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentallocation',
+            name='supply',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='acts.supply', verbose_name='Поставка'),
+        ),
+        migrations.AlterField(
+            model_name='paymentallocation',
+            name='transaction',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='acts.transaction', verbose_name='Платеж'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedSupply',
+            fields=[
+                ('id', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='ID поставки')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('paid_date', models.DateField(null=True, verbose_name='Дата полной оплаты')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_supplies', to='acts.store', verbose_name='Магазин получатель поставки')),
+            ],
+            options={
+                'verbose_name': 'архивная поставка',
+                'verbose_name_plural': 'Архив поставок',
+                'indexes': [models.Index(fields=['store', 'date', 'id'], name='archived_supply_store_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID платежа')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('date', models.DateField(verbose_name='Дата транзакции')),
+                ('fingerprint', models.CharField(max_length=64, null=True, verbose_name='Отпечаток загрузки')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='acts.store', verbose_name='Магазин плательщик')),
+            ],
+            options={
+                'verbose_name': 'архивный платеж',
+                'verbose_name_plural': 'Архив платежей',
+                'indexes': [models.Index(fields=['store', 'date', 'id'], name='archived_tx_store_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OpeningBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Период закрыт по')),
+                ('supply_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поставок')),
+                ('transaction_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма поступлений')),
+                ('supply_count', models.PositiveIntegerField(default=0, verbose_name='Количество поставок')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='Количество поступлений')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата закрытия')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_balances', to='acts.store', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'входящее сальдо',
+                'verbose_name_plural': 'Входящие сальдо',
+                'constraints': [models.UniqueConstraint(fields=('store', 'date'), name='unique_store_opening_balance')],
+            },
+        ),
+    ]
@@ -0,0 +1,151 @@
+# Generated by Django 6.0 on 2026-10-18 10:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("acts", "0012_period_close"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("import_ledger", "Импорт леджера"),
+                            ("generate_acts", "Формирование актов"),
+                            ("refresh_summary", "Пересчет сводки"),
+                            ("delete_store", "Удаление магазина"),
+                        ],
+                        max_length=32,
+                        verbose_name="Тип задачи",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Готово"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("params", models.JSONField(default=dict, verbose_name="Параметры")),
+                (
+                    "result",
+                    models.JSONField(blank=True, null=True, verbose_name="Результат"),
+                ),
+                (
+                    "output",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Файл результата"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Ошибка")),
+                (
+                    "progress",
+                    models.PositiveIntegerField(default=0, verbose_name="Выполнено"),
+                ),
+                (
+                    "total",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Всего"
+                    ),
+                ),
+                (
+                    "message",
+                    models.CharField(blank=True, max_length=255, verbose_name="Этап"),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Попыток"),
+                ),
+                (
+                    "max_attempts",
+                    models.PositiveSmallIntegerField(
+                        default=3, verbose_name="Максимум попыток"
+                    ),
+                ),
+                (
+                    "run_after",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Не раньше"
+                    ),
+                ),
+                (
+                    "worker",
+                    models.CharField(blank=True, max_length=64, verbose_name="Воркер"),
+                ),
+                (
+                    "heartbeat",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Последний сигнал воркера"
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "started",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Начата"),
+                ),
+                (
+                    "finished",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Завершена"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="jobs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "фоновая задача",
+                "verbose_name_plural": "Фоновые задачи",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["run_after", "id"],
+                        name="job_pending_idx",
+                    ),
+                    models.Index(
+                        condition=models.Q(("status", "running")),
+                        fields=["heartbeat"],
+                        name="job_running_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("acts", "0013_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="act",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменен"),
+        ),
+        migrations.AddField(
+            model_name="store",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменен"),
+        ),
+        migrations.AddField(
+            model_name="storebalance",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="Последнее изменение леджера"
+            ),
+        ),
+        migrations.AddField(
+            model_name="summary",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменена"),
+        ),
+        migrations.AddField(
+            model_name="supply",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменена"),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменен"),
+        ),
+        migrations.AddIndex(
+            model_name="supply",
+            index=models.Index(
+                fields=["store", "date", "updated_at"], name="supply_store_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["store", "date", "updated_at"], name="transaction_store_upd_idx"
+            ),
+        ),
+    ]
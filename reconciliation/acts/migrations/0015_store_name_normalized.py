@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 10:14
+
+import acts.models
+from django.db import migrations, models
+
+
+def normalize_name(value):
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def populate_name_normalized(apps, schema_editor):
+    Store = apps.get_model("acts", "Store")
+    # Поле здесь еще длиной с name, полное значение заполняет 0018.
+    stores = [
+        Store(pk=pk, name_normalized=normalize_name(name)[:64])
+        for pk, name in Store.objects.values_list("pk", "name").iterator()
+    ]
+    Store.objects.bulk_update(stores, ["name_normalized"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("acts", "0014_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="store",
+            name="name_normalized",
+            field=acts.models.NormalizedNameField(
+                default="",
+                max_length=64,
+                source="name",
+                verbose_name="Название для поиска",
+            ),
+        ),
+        migrations.RunPython(populate_name_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="store",
+            index=models.Index(
+                fields=["name_normalized"],
+                name="store_name_normalized_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
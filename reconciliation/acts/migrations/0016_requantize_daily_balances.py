@@ -0,0 +1,82 @@
+# Generated by Django 6.0 on 2026-10-18 10:40
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Sum
+
+
+def requantize_daily_balances(apps, schema_editor):
+    """
+    Дневные балансы открытого периода заново, с дневными суммами,
+    округленными до копеек. 0005 копил неокругленные суммы SQLite.
+    """
+    OpeningBalance = apps.get_model("acts", "OpeningBalance")
+    StoreDailyBalance = apps.get_model("acts", "StoreDailyBalance")
+    Supply = apps.get_model("acts", "Supply")
+    Transaction = apps.get_model("acts", "Transaction")
+
+    zero = Decimal("0.00")
+    cent = Decimal("0.01")
+
+    def to_decimal(value):
+        if value is None:
+            return zero
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value))
+        return value.quantize(cent)
+
+    openings = {
+        opening.store_id: opening
+        for opening in OpeningBalance.objects.order_by("store", "date")
+    }
+    days = defaultdict(lambda: [zero, zero])
+    for index, model in enumerate((Supply, Transaction)):
+        rows = model.objects.values("store", "date").annotate(total=Sum("price"))
+        for row in rows.order_by():
+            opening = openings.get(row["store"])
+            if opening is None or row["date"] > opening.date:
+                days[row["store"], row["date"]][index] += to_decimal(row["total"])
+
+    running = {}
+    balances = []
+    for store_id, day in sorted(days):
+        if store_id not in running:
+            opening = openings.get(store_id)
+            running[store_id] = (
+                to_decimal(opening and opening.supply_total),
+                to_decimal(opening and opening.transaction_total),
+            )
+        supply_total, transaction_total = running[store_id]
+        supply_day, transaction_day = days[store_id, day]
+        running[store_id] = (
+            supply_total + supply_day,
+            transaction_total + transaction_day,
+        )
+        balances.append(
+            StoreDailyBalance(
+                store_id=store_id,
+                date=day,
+                supply_total=running[store_id][0],
+                transaction_total=running[store_id][1],
+            )
+        )
+
+    # Балансы закрытых дней остаются как есть.
+    StoreDailyBalance.objects.exclude(store_id__in=list(openings)).delete()
+    for store_id, opening in openings.items():
+        rows = StoreDailyBalance.objects.filter(store_id=store_id, date__gt=opening.date)
+        rows.delete()
+    StoreDailyBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0015_store_name_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(requantize_daily_balances, migrations.RunPython.noop),
+    ]
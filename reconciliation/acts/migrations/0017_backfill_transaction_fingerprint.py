@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 10:50
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def fingerprint(store_id, day, price, sequence):
+    raw = f"manual|{store_id}|{day.isoformat()}|{price}|{sequence}"
+    return "manual:" + hashlib.sha256(raw.encode()).hexdigest()[:57]
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Отпечатки платежей, внесенных вручную: с префиксом ``manual:`` и первым
+    свободным номером среди платежей с теми же магазином, датой и суммой.
+    """
+    Transaction = apps.get_model("acts", "Transaction")
+    cent = Decimal("0.01")
+
+    taken = set(
+        Transaction.objects.exclude(fingerprint=None)
+        .values_list("fingerprint", flat=True)
+        .iterator()
+    )
+    # Строки читаются до обновления: курсор SQLite по той же таблице
+    # не должен видеть собственные правки.
+    rows = list(
+        Transaction.objects.filter(fingerprint=None)
+        .order_by("store", "date", "price", "pk")
+        .values_list("pk", "store", "date", "price")
+    )
+    updated = []
+    for pk, store_id, day, price in rows:
+        key = (store_id, day, Decimal(str(price)).quantize(cent))
+        sequence = 0
+        while fingerprint(*key, sequence) in taken:
+            sequence += 1
+        updated.append(Transaction(pk=pk, fingerprint=fingerprint(*key, sequence)))
+        taken.add(updated[-1].fingerprint)
+    Transaction.objects.bulk_update(updated, ["fingerprint"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0016_requantize_daily_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 10:34
+
+import acts.models
+from django.db import migrations
+
+
+def normalize_name(value):
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def populate_name_normalized(apps, schema_editor):
+    # В 0015 длинные названия с «ß» и подобными буквами обрезались.
+    Store = apps.get_model("acts", "Store")
+    stores = [
+        Store(pk=pk, name_normalized=normalize_name(name))
+        for pk, name in Store.objects.values_list("pk", "name").iterator()
+    ]
+    Store.objects.bulk_update(stores, ["name_normalized"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acts', '0017_backfill_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='store',
+            name='name_normalized',
+            field=acts.models.NormalizedNameField(default='', max_length=192, source='name', verbose_name='Название для поиска'),
+        ),
+        migrations.RunPython(populate_name_normalized, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,74 @@
+import hashlib
+from decimal import Decimal
+
 import pytz
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 User = get_user_model()
 
+CENT = Decimal("0.01")
+# Сколько порядковых номеров отпечатка проверяется одним запросом.
+FINGERPRINT_PROBE = 8
+# Префикс отпечатков платежей, внесенных вручную.
+MANUAL_FINGERPRINT = "manual:"
+
+
+def normalize_name(value):
+    """Название для поиска: без регистра, «ё» как «е», одиночные пробелы."""
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def transaction_fingerprint(
+    store_id, day, price, sequence=0, source_id=None, manual=False
+):
+    """
+    Отпечаток строки выписки: ID документа или магазин, дата, сумма и номер
+    среди строк выписки с теми же магазином, датой и суммой.
+
+    Отпечатки ручных платежей (``manual``) помечены префиксом и со строками
+    выписок не совпадают.
+    """
+    if source_id:
+        raw = f"doc|{source_id}"
+    else:
+        raw = f"{store_id}|{day.isoformat()}|{price}|{sequence}"
+    if manual:
+        digest = hashlib.sha256(f"manual|{raw}".encode()).hexdigest()
+        return MANUAL_FINGERPRINT + digest[: 64 - len(MANUAL_FINGERPRINT)]
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class NormalizedNameField(models.CharField):
+    """
+    Нормализованная копия поля ``source``. Заполняется в ``pre_save``,
+    поэтому актуальна и после ``bulk_create``.
+    """
+
+    def __init__(self, *args, source="name", **kwargs):
+        self.source = source
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        kwargs.pop("editable", None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = normalize_name(getattr(model_instance, self.source) or "")
+        setattr(model_instance, self.attname, value)
+        return value
+
 
 class Store(models.Model):
     name = models.CharField(max_length=64, verbose_name="Название")
+    # casefold() превращает символ максимум в три («ß» → «ss»).
+    name_normalized = NormalizedNameField(
+        max_length=192, default="", verbose_name="Название для поиска"
+    )
     address = models.CharField(
         max_length=264, verbose_name="Адрес", null=True, blank=True
     )
@@ -14,19 +76,48 @@ class Store(models.Model):
         verbose_name="Номер телефона", null=True, blank=True
     )
     notes = models.CharField(verbose_name="Заметки", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")
 
     class Meta:
         verbose_name = "магазин"
         verbose_name_plural = "Магазины"
+        indexes = [
+            # В PostgreSQL префиксный LIKE идет по индексу только с
+            # pattern_ops, другие базы класс операторов не учитывают.
+            models.Index(
+                fields=["name_normalized"],
+                opclasses=["varchar_pattern_ops"],
+                name="store_name_normalized_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
     def get_fields(self):
-        return [(field, getattr(self, field.name)) for field in self._meta.fields]
+        # Служебные поля (поисковая копия названия, метка изменения) не
+        # показываются.
+        return [
+            (field, getattr(self, field.name))
+            for field in self._meta.fields
+            if field.editable or field.primary_key
+        ]
+
+
+class LedgerEntry(models.Model):
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            return super().delete(*args, **kwargs)
 
-class Supply(models.Model):
+
+class Supply(LedgerEntry):
     id = models.CharField(
         primary_key=True,
         max_length=64,
@@ -40,10 +131,44 @@ class Supply(models.Model):
         on_delete=models.CASCADE,
         related_name="supply",
     )
+    outstanding = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Остаток к оплате",
+    )
+    paid_date = models.DateField(
+        null=True, blank=True, editable=False, verbose_name="Дата полной оплаты"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменена")
 
     class Meta:
         verbose_name = "поставка"
         verbose_name_plural = "Поставки"
+        indexes = [
+            models.Index(
+                fields=["store", "date", "price"], name="supply_store_date_idx"
+            ),
+            models.Index(fields=["date", "id"], name="supply_date_id_idx"),
+            models.Index(
+                fields=["store", "date", "id"], name="supply_store_date_id_idx"
+            ),
+            models.Index(
+                fields=["date", "id"],
+                condition=models.Q(outstanding__gt=0),
+                name="supply_open_date_id_idx",
+            ),
+            models.Index(
+                fields=["store", "date", "id"],
+                condition=models.Q(outstanding__gt=0),
+                name="supply_open_store_idx",
+            ),
+            models.Index(fields=["store", "paid_date"], name="supply_store_paid_idx"),
+            models.Index(
+                fields=["store", "date", "updated_at"], name="supply_store_updated_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Поставка номер {self.id} от {self.date}"
@@ -52,7 +177,7 @@ class Supply(models.Model):
         return [(field, getattr(self, field.name)) for field in self._meta.fields]
 
 
-class Transaction(models.Model):
+class Transaction(LedgerEntry):
     price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
     date = models.DateField(verbose_name="Дата транзакции")
     store = models.ForeignKey(
@@ -61,18 +186,191 @@ class Transaction(models.Model):
         on_delete=models.CASCADE,
         related_name="transaction",
     )
+    fingerprint = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Отпечаток загрузки",
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")
 
     class Meta:
         verbose_name = "платеж"
         verbose_name_plural = "Платежи"
+        indexes = [
+            models.Index(
+                fields=["store", "date", "price"], name="transaction_store_date_idx"
+            ),
+            models.Index(fields=["date", "id"], name="transaction_date_id_idx"),
+            models.Index(
+                fields=["store", "date", "id"], name="transaction_store_date_id_idx"
+            ),
+            models.Index(
+                fields=["store", "date", "updated_at"],
+                name="transaction_store_upd_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"от {self.date} плательщик {self.store}"
 
+    def save(self, *args, **kwargs):
+        # Отпечаток строки выписки не меняется при правке, отпечаток ручного
+        # платежа следует за его магазином, датой и суммой.
+        if self.fingerprint is None or self.fingerprint.startswith(MANUAL_FINGERPRINT):
+            self.fingerprint = self.free_fingerprint()
+        super().save(*args, **kwargs)
+
+    def free_fingerprint(self):
+        """
+        Отпечаток платежа, внесенного вручную: первый свободный номер среди
+        ручных платежей с теми же магазином, датой и суммой. Строки выписки
+        с такими же реквизитами им не считаются повтором.
+        """
+        opts = self._meta
+        key = (
+            self.store_id,
+            opts.get_field("date").to_python(self.date),
+            opts.get_field("price").to_python(self.price).quantize(CENT),
+        )
+        sequence = 0
+        while True:
+            candidates = [
+                transaction_fingerprint(*key, sequence=number, manual=True)
+                for number in range(sequence, sequence + FINGERPRINT_PROBE)
+            ]
+            taken = set(
+                Transaction.objects.filter(fingerprint__in=candidates)
+                .exclude(pk=self.pk)
+                .values_list("fingerprint", flat=True)
+            )
+            for fingerprint in candidates:
+                if fingerprint not in taken:
+                    return fingerprint
+            sequence += FINGERPRINT_PROBE
+
     def get_fields(self):
         return [(field, getattr(self, field.name)) for field in self._meta.fields]
 
 
+class ArchivedSupply(models.Model):
+    id = models.CharField(primary_key=True, max_length=64, verbose_name="ID поставки")
+    price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+    date = models.DateField(verbose_name="Дата")
+    store = models.ForeignKey(
+        Store,
+        verbose_name="Магазин получатель поставки",
+        on_delete=models.CASCADE,
+        related_name="archived_supplies",
+    )
+    paid_date = models.DateField(null=True, verbose_name="Дата полной оплаты")
+
+    class Meta:
+        verbose_name = "архивная поставка"
+        verbose_name_plural = "Архив поставок"
+        indexes = [
+            models.Index(
+                fields=["store", "date", "id"], name="archived_supply_store_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Поставка номер {self.id} от {self.date}"
+
+
+class ArchivedTransaction(models.Model):
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID платежа")
+    price = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+    date = models.DateField(verbose_name="Дата транзакции")
+    store = models.ForeignKey(
+        Store,
+        verbose_name="Магазин плательщик",
+        on_delete=models.CASCADE,
+        related_name="archived_transactions",
+    )
+    fingerprint = models.CharField(
+        max_length=64, null=True, verbose_name="Отпечаток загрузки"
+    )
+
+    class Meta:
+        verbose_name = "архивный платеж"
+        verbose_name_plural = "Архив платежей"
+        indexes = [
+            models.Index(fields=["store", "date", "id"], name="archived_tx_store_idx"),
+        ]
+
+    def __str__(self):
+        return f"от {self.date} плательщик {self.store}"
+
+
+class OpeningBalance(models.Model):
+    store = models.ForeignKey(
+        Store,
+        verbose_name="Магазин",
+        on_delete=models.CASCADE,
+        related_name="opening_balances",
+    )
+    date = models.DateField(verbose_name="Период закрыт по")
+    supply_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поставок"
+    )
+    transaction_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поступлений"
+    )
+    supply_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество поставок"
+    )
+    transaction_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество поступлений"
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Дата закрытия")
+
+    class Meta:
+        verbose_name = "входящее сальдо"
+        verbose_name_plural = "Входящие сальдо"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "date"], name="unique_store_opening_balance"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.store} на {self.date}"
+
+    @property
+    def debt(self):
+        return self.supply_total - self.transaction_total
+
+
+class PaymentAllocation(models.Model):
+    # Сторона, ушедшая в архив при закрытии периода, обнуляется: сумма
+    # остается в разнесениях открытой стороны.
+    supply = models.ForeignKey(
+        Supply,
+        verbose_name="Поставка",
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="allocations",
+    )
+    transaction = models.ForeignKey(
+        Transaction,
+        verbose_name="Платеж",
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="allocations",
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+
+    class Meta:
+        verbose_name = "разнесение платежа"
+        verbose_name_plural = "Разнесения платежей"
+
+    def __str__(self):
+        return f"{self.transaction} → {self.supply}: {self.amount}"
+
+
 class Summary(models.Model):
     period_start = models.DateField(verbose_name="Дата начала промежутка")
     period_end = models.DateField(verbose_name="Дата конца промежутка")
@@ -82,6 +380,7 @@ class Summary(models.Model):
         related_name="summaries",
         verbose_name="Магазины",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменена")
 
     def __str__(self):
         moscow_tz = pytz.timezone("Europe/Moscow")
@@ -105,6 +404,7 @@ class Act(models.Model):
         on_delete=models.CASCADE,
         related_name="act",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменен")
 
     def __str__(self):
         moscow_tz = pytz.timezone("Europe/Moscow")
@@ -114,3 +414,204 @@ class Act(models.Model):
     class Meta:
         verbose_name = "акт сверки"
         verbose_name_plural = "Акты сверки"
+
+
+class StoreBalance(models.Model):
+    store = models.OneToOneField(
+        Store,
+        verbose_name="Магазин",
+        on_delete=models.CASCADE,
+        related_name="balance",
+    )
+    supply_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поставок"
+    )
+    transaction_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поступлений"
+    )
+    debt = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Долг"
+    )
+    supply_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество поставок"
+    )
+    transaction_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество поступлений"
+    )
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия леджера")
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name="Последнее изменение леджера"
+    )
+
+    class Meta:
+        verbose_name = "баланс магазина"
+        verbose_name_plural = "Балансы магазинов"
+
+    def __str__(self):
+        return f"{self.store}: {self.debt}"
+
+
+class StoreDailyBalance(models.Model):
+    store = models.ForeignKey(
+        Store,
+        verbose_name="Магазин",
+        on_delete=models.CASCADE,
+        related_name="daily_balances",
+    )
+    date = models.DateField(verbose_name="Дата")
+    supply_total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Сумма поставок на конец дня",
+    )
+    transaction_total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Сумма поступлений на конец дня",
+    )
+
+    class Meta:
+        verbose_name = "дневной баланс магазина"
+        verbose_name_plural = "Дневные балансы магазинов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "date"], name="unique_store_daily_balance"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.store} на {self.date}"
+
+    @property
+    def debt(self):
+        return self.supply_total - self.transaction_total
+
+
+class SummaryLine(models.Model):
+    summary = models.ForeignKey(
+        Summary,
+        verbose_name="Сводка",
+        on_delete=models.CASCADE,
+        related_name="lines",
+    )
+    store = models.ForeignKey(
+        Store,
+        verbose_name="Магазин",
+        on_delete=models.CASCADE,
+        related_name="summary_lines",
+    )
+    opening_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сальдо на начало"
+    )
+    supply_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поставок"
+    )
+    transaction_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сумма поступлений"
+    )
+    closing_balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Сальдо на конец"
+    )
+
+    class Meta:
+        verbose_name = "строка сводки"
+        verbose_name_plural = "Строки сводок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["summary", "store"], name="unique_summary_line"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["summary", "closing_balance"], name="summary_line_closing_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.summary}: {self.store}"
+
+
+class Job(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    ]
+    KINDS = [
+        ("import_ledger", "Импорт леджера"),
+        ("generate_acts", "Формирование актов"),
+        ("refresh_summary", "Пересчет сводки"),
+        ("delete_store", "Удаление магазина"),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KINDS, verbose_name="Тип задачи")
+    status = models.CharField(
+        max_length=16, choices=STATUSES, default=PENDING, verbose_name="Статус"
+    )
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    result = models.JSONField(null=True, blank=True, verbose_name="Результат")
+    output = models.CharField(
+        max_length=255, blank=True, verbose_name="Файл результата"
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    progress = models.PositiveIntegerField(default=0, verbose_name="Выполнено")
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name="Всего")
+    message = models.CharField(max_length=255, blank=True, verbose_name="Этап")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name="Максимум попыток"
+    )
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+    worker = models.CharField(max_length=64, blank=True, verbose_name="Воркер")
+    heartbeat = models.DateTimeField(
+        null=True, blank=True, verbose_name="Последний сигнал воркера"
+    )
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="jobs",
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    class Meta:
+        verbose_name = "фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(
+                fields=["run_after", "id"],
+                condition=models.Q(status="pending"),
+                name="job_pending_idx",
+            ),
+            models.Index(
+                fields=["heartbeat"],
+                condition=models.Q(status="running"),
+                name="job_running_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}: {self.get_status_display()}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.total:
+            return None
+        return min(100, self.progress * 100 // self.total)
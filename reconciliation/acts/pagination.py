@@ -0,0 +1,194 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+PAGE_SIZES = (10, 25, 50, 100, 200)
+MAX_PAGE_SIZE = PAGE_SIZES[-1]
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (binascii.Error, UnicodeDecodeError, ValueError, ValidationError):
+        raise Http404("Некорректный курсор страницы")
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _keyset_filter(keyset, values, lookup):
+    first, *rest = keyset
+    if not rest:
+        return Q(**{f"{first}__{lookup}": values[0]})
+    # Условие по первой колонке отдельно от OR, чтобы СУБД шла
+    # по индексу диапазоном, а не перебирала ветки OR.
+    (second,) = rest
+    return Q(**{f"{first}__{lookup}e": values[0]}) & (
+        Q(**{f"{first}__{lookup}": values[0]})
+        | Q(**{f"{second}__{lookup}": values[1]})
+    )
+
+
+def _cursor(obj, keyset):
+    return encode_cursor(getattr(obj, name) for name in keyset)
+
+
+def keyset_page(
+    queryset, keyset, page_size, after=None, before=None, descending=False
+):
+    """
+    Страница ``queryset`` по курсору ``after`` или ``before`` в порядке
+    уникального ключа ``keyset``, по возрастанию или по убыванию.
+    """
+    opts = queryset.model._meta
+    fields = [opts.pk if name == "pk" else opts.get_field(name) for name in keyset]
+    forward, backward = ("lt", "gt") if descending else ("gt", "lt")
+    ascending = [f"-{name}" if descending else name for name in keyset]
+    reverse = [name if descending else f"-{name}" for name in keyset]
+
+    if before:
+        values = decode_cursor(before, fields)
+        queryset = queryset.filter(_keyset_filter(keyset, values, backward))
+        rows = list(queryset.order_by(*reverse)[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=_cursor(rows[-1], keyset) if rows else before,
+            previous_cursor=_cursor(rows[0], keyset) if has_more else None,
+        )
+
+    if after:
+        values = decode_cursor(after, fields)
+        queryset = queryset.filter(_keyset_filter(keyset, values, forward))
+    rows = list(queryset.order_by(*ascending)[: page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=_cursor(rows[-1], keyset) if has_more else None,
+        previous_cursor=_cursor(rows[0], keyset) if after and rows else None,
+    )
+
+
+class KeysetPaginationMixin:
+    """
+    Постраничный вывод по курсору вместо OFFSET и COUNT(*).
+
+    Страница выбирается условием по ключу ``keyset`` от последней строки
+    предыдущей страницы, поэтому любая страница стоит столько же, сколько
+    первая. Ключ должен быть уникальным и совпадать с индексом.
+    """
+
+    keyset = ("pk",)
+    keyset_descending = False
+    paginate_by = 10
+    max_page_size = MAX_PAGE_SIZE
+
+    def get_ordering(self):
+        return list(self.keyset)
+
+    def get_paginate_by(self, queryset):
+        try:
+            size = int(self.request.GET.get("page_size", self.paginate_by))
+        except ValueError:
+            size = self.paginate_by
+        return max(1, min(size, self.max_page_size))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_sizes"] = PAGE_SIZES
+        context["page_size"] = self.get_paginate_by(None)
+        return context
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_page(
+            queryset,
+            self.keyset,
+            page_size,
+            after=self.request.GET.get("after"),
+            before=self.request.GET.get("before"),
+            descending=self.keyset_descending,
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class KeysetCursorPagination(BasePagination):
+    """Курсорная пагинация API поверх ``keyset_page`` по ключу вьюсета."""
+
+    page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            size = int(request.query_params.get("page_size", self.page_size))
+        except ValueError:
+            size = self.page_size
+        size = max(1, min(size, self.max_page_size))
+
+        try:
+            self.page = keyset_page(
+                queryset,
+                getattr(view, "keyset", ("pk",)),
+                size,
+                after=request.query_params.get("after"),
+                before=request.query_params.get("before"),
+            )
+        except Http404 as error:
+            raise NotFound(str(error))
+        self.request = request
+        return self.page.object_list
+
+    def _link(self, name, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "after" if name == "before" else "before")
+        return replace_query_param(url, name, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self._link("after", self.page.next_cursor),
+                "previous": self._link("before", self.page.previous_cursor),
+                "results": data,
+            }
+        )
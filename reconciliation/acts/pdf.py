@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+# Меняется вместе с раскладкой документов, чтобы старый кэш не отдавался.
+LAYOUT_VERSION = 2
+
+
+def document_key(*parts):
+    raw = json.dumps([LAYOUT_VERSION, *parts], default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_pdf(key, render):
+    """
+    Путь к PDF с ключом ``key``; документ рендерится вызовом ``render``
+    только если его еще нет в кэше на диске.
+    """
+    path = Path(settings.PDF_CACHE_DIR) / key[:2] / f"{key}.pdf"
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = render()
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as stream:
+            stream.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+def _money(value):
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",")
+
+
+def _fonts():
+    fonts = {"": settings.PDF_FONT_PATH, "B": settings.PDF_FONT_BOLD_PATH}
+    for path in fonts.values():
+        if not Path(path).is_file():
+            raise ImproperlyConfigured(
+                f"Шрифт для PDF не найден: {path}. Укажите шрифт с кириллицей "
+                "в PDF_FONT_PATH и PDF_FONT_BOLD_PATH"
+            )
+    return fonts
+
+
+def _new_document(title, created):
+    fonts = _fonts()
+    try:
+        from fpdf import FPDF
+    except ImportError:
+        raise ImproperlyConfigured("Для печати в PDF установите пакет fpdf2")
+
+    pdf = FPDF(format="A4")
+    pdf.set_title(title)
+    pdf.set_creation_date(created)
+    for style, path in fonts.items():
+        pdf.add_font("main", style, path)
+    pdf.set_margins(15, 15, 15)
+    pdf.add_page()
+    pdf.set_font("main", size=10)
+    return pdf
+
+
+def _heading(pdf, lines):
+    first, *rest = lines
+    pdf.set_font("main", "B", 14)
+    pdf.cell(0, 8, first, new_x="LMARGIN", new_y="NEXT", align="C")
+    pdf.set_font("main", size=10)
+    for line in rest:
+        pdf.cell(0, 6, line, new_x="LMARGIN", new_y="NEXT", align="C")
+    pdf.ln(4)
+
+
+def render_act_pdf(act, statement):
+    store = act.store
+    pdf = _new_document(f"Акт сверки {store.name}", act.date)
+    _heading(
+        pdf,
+        [
+            "Акт сверки взаиморасчетов",
+            store.name,
+            f"Период: с {act.period_start:%d.%m.%Y} по {act.period_end:%d.%m.%Y}",
+            f"Дата формирования: {timezone.localtime(act.date):%d.%m.%Y %H:%M}",
+        ],
+    )
+
+    with pdf.table(
+        col_widths=(25, 25, 40, 40, 50),
+        text_align=("LEFT", "LEFT", "RIGHT", "RIGHT", "RIGHT"),
+        repeat_headings=1,
+    ) as table:
+        table.row(["Дата", "Тип", "Поставка", "Оплата", "Баланс"])
+        table.row(["", "Баланс на начало", "", "", _money(statement.balance_before)])
+        for line in statement:
+            table.row(
+                [
+                    f"{line.date:%d.%m.%Y}",
+                    "Поставка" if line.type == "supply" else "Оплата",
+                    _money(line.supply_amount) if line.supply_amount else "",
+                    _money(line.transaction_amount) if line.transaction_amount else "",
+                    _money(line.balance),
+                ]
+            )
+        table.row(
+            [
+                "",
+                "ИТОГО за период",
+                _money(statement.total_supply),
+                _money(statement.total_transaction),
+                _money(statement.balance_after),
+            ]
+        )
+
+    pdf.ln(6)
+    pdf.cell(
+        0,
+        6,
+        f"Таким образом, на {act.period_end:%d.%m.%Y}:",
+        new_x="LMARGIN",
+        new_y="NEXT",
+    )
+    if statement.debt > 0:
+        result = (
+            f"Задолженность «{store.name}» составляет: {_money(statement.debt)} руб."
+        )
+    elif statement.overpayment > 0:
+        result = (
+            f"Переплата «{store.name}» составляет: {_money(statement.overpayment)} руб."
+        )
+    else:
+        result = "Расчеты сбалансированы: 0,00 руб."
+    pdf.set_font("main", "B", 10)
+    pdf.multi_cell(0, 6, result)
+    return bytes(pdf.output())
+
+
+def render_summary_pdf(
+    summary,
+    lines,
+    total_opening,
+    total_supply,
+    total_transaction,
+    total_closing,
+):
+    pdf = _new_document(f"Сводка № {summary.pk}", summary.date)
+    _heading(
+        pdf,
+        [
+            "СВОДКА",
+            f"№ {summary.pk} от {timezone.localtime(summary.date):%d.%m.%Y %H:%M}",
+            f"Период: с {summary.period_start:%d.%m.%Y} по {summary.period_end:%d.%m.%Y}",
+        ],
+    )
+
+    with pdf.table(
+        col_widths=(10, 48, 32, 30, 30, 32),
+        text_align=("RIGHT", "LEFT", "RIGHT", "RIGHT", "RIGHT", "RIGHT"),
+        repeat_headings=1,
+    ) as table:
+        table.row(
+            [
+                "№",
+                "Магазин",
+                "Сальдо на начало",
+                "Поставки",
+                "Поступления",
+                "Сальдо на конец",
+            ]
+        )
+        for number, line in enumerate(lines, 1):
+            table.row(
+                [
+                    str(number),
+                    line.store.name,
+                    _money(line.opening_balance),
+                    _money(line.supply_total),
+                    _money(line.transaction_total),
+                    _money(line.closing_balance),
+                ]
+            )
+        table.row(
+            [
+                "",
+                "ИТОГО",
+                _money(total_opening),
+                _money(total_supply),
+                _money(total_transaction),
+                _money(total_closing),
+            ]
+        )
+
+    pdf.ln(20)
+    pdf.cell(90, 6, "Поставщик: _________________")
+    pdf.cell(0, 6, "Покупатель: _________________", new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
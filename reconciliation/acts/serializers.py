@@ -0,0 +1,120 @@
+from rest_framework import serializers
+
+from .models import Act, Store, Summary, SummaryLine, Supply, Transaction
+
+
+class StoreSerializer(serializers.ModelSerializer):
+    supply_total = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    transaction_total = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    debt = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Store
+        fields = [
+            "id",
+            "name",
+            "address",
+            "phone_number",
+            "notes",
+            "supply_total",
+            "transaction_total",
+            "debt",
+        ]
+
+
+class SupplySerializer(serializers.ModelSerializer):
+    store_name = serializers.CharField(source="store.name", read_only=True)
+
+    class Meta:
+        model = Supply
+        fields = [
+            "id",
+            "date",
+            "price",
+            "store",
+            "store_name",
+            "outstanding",
+            "paid_date",
+        ]
+        read_only_fields = ["outstanding", "paid_date"]
+
+
+class TransactionSerializer(serializers.ModelSerializer):
+    store_name = serializers.CharField(source="store.name", read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = ["id", "date", "price", "store", "store_name", "fingerprint"]
+        read_only_fields = ["fingerprint"]
+
+
+class ActSerializer(serializers.ModelSerializer):
+    store_name = serializers.CharField(source="store.name", read_only=True)
+
+    class Meta:
+        model = Act
+        fields = ["id", "period_start", "period_end", "date", "store", "store_name"]
+
+    def validate(self, attrs):
+        start = attrs.get("period_start", getattr(self.instance, "period_start", None))
+        end = attrs.get("period_end", getattr(self.instance, "period_end", None))
+        if start and end and start > end:
+            raise serializers.ValidationError("Дата начала позже даты конца периода")
+        return attrs
+
+
+class SummaryLineSerializer(serializers.ModelSerializer):
+    store_name = serializers.CharField(source="store.name", read_only=True)
+
+    class Meta:
+        model = SummaryLine
+        fields = [
+            "store",
+            "store_name",
+            "opening_balance",
+            "supply_total",
+            "transaction_total",
+            "closing_balance",
+        ]
+
+
+class SummarySerializer(serializers.ModelSerializer):
+    lines = SummaryLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Summary
+        fields = ["id", "period_start", "period_end", "date", "stores", "lines"]
+
+    def validate(self, attrs):
+        start = attrs.get("period_start", getattr(self.instance, "period_start", None))
+        end = attrs.get("period_end", getattr(self.instance, "period_end", None))
+        if start and end and start > end:
+            raise serializers.ValidationError("Дата начала позже даты конца периода")
+        return attrs
+
+
+class ActLineSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    pk = serializers.CharField()
+    date = serializers.DateField()
+    supply_amount = serializers.DecimalField(
+        max_digits=14, decimal_places=2, allow_null=True
+    )
+    transaction_amount = serializers.DecimalField(
+        max_digits=14, decimal_places=2, allow_null=True
+    )
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class ActStatementSerializer(serializers.Serializer):
+    balance_before = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total_supply = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total_transaction = serializers.DecimalField(max_digits=14, decimal_places=2)
+    balance_after = serializers.DecimalField(max_digits=14, decimal_places=2)
+    debt = serializers.DecimalField(max_digits=14, decimal_places=2)
+    overpayment = serializers.DecimalField(max_digits=14, decimal_places=2)
+    lines = ActLineSerializer(source="*", many=True)
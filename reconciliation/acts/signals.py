@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .aging import reallocate_store, release_allocations
+from .balances import apply_ledger_delta
+from .cache import invalidate
+from .closing import check_open_period
+from .db import observe
+from .models import Store, Supply, Transaction
+
+
+def _ledger_row(instance):
+    opts = instance._meta
+    return (
+        instance.store_id,
+        opts.get_field("date").to_python(instance.date),
+        opts.get_field("price").to_python(instance.price),
+    )
+
+
+def _deleted_with_store(origin):
+    return isinstance(origin, Store) or getattr(origin, "model", None) is Store
+
+
+@receiver(pre_save, sender=Supply)
+@receiver(pre_save, sender=Transaction)
+def remember_ledger_row(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._ledger_previous = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("store_id", "date", "price")
+        .first()
+    )
+
+
+@receiver(pre_save, sender=Supply)
+@receiver(pre_save, sender=Transaction)
+def reject_closed_rows(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    check_open_period(
+        getattr(instance, "_ledger_previous", None), _ledger_row(instance)
+    )
+
+
+@receiver(pre_delete, sender=Supply)
+@receiver(pre_delete, sender=Transaction)
+def reject_closed_delete(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_store(origin):
+        check_open_period(_ledger_row(instance))
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=Transaction)
+def update_balance_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = _ledger_row(instance)
+    previous = getattr(instance, "_ledger_previous", None)
+    if previous == current:
+        return
+    if previous is not None:
+        store_id, day, price = previous
+        apply_ledger_delta(sender, store_id, day, -price, -1)
+    store_id, day, price = current
+    apply_ledger_delta(sender, store_id, day, price, 1)
+
+
+@receiver(post_delete, sender=Supply)
+@receiver(post_delete, sender=Transaction)
+def update_balance_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with_store(origin):
+        return
+    store_id, day, price = _ledger_row(instance)
+    apply_ledger_delta(sender, store_id, day, -price, -1)
+
+
+def _reallocation_tails(*rows):
+    tails = {}
+    for row in rows:
+        if row is not None:
+            store_id, day, _ = row
+            tails[store_id] = min(day, tails.get(store_id, day))
+    return tails.items()
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=Transaction)
+def reallocate_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = _ledger_row(instance)
+    previous = getattr(instance, "_ledger_previous", None)
+    if previous == current:
+        return
+    if previous is not None:
+        # Строка могла уйти в другой магазин, и ее старые разнесения не
+        # попадут в хвост ни одного из двух.
+        release_allocations(instance.allocations.all())
+    for store_id, since in _reallocation_tails(previous, current):
+        reallocate_store(store_id, since)
+
+
+@receiver(pre_delete, sender=Supply)
+@receiver(pre_delete, sender=Transaction)
+def release_on_delete(sender, instance, origin=None, **kwargs):
+    # Каскад удалит разнесения без возврата сумм в остатки поставок.
+    if not _deleted_with_store(origin):
+        release_allocations(instance.allocations.all())
+
+
+@receiver(post_delete, sender=Supply)
+@receiver(post_delete, sender=Transaction)
+def reallocate_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with_store(origin):
+        return
+    store_id, day, _ = _ledger_row(instance)
+    reallocate_store(store_id, day)
+
+
+@receiver(post_save, sender=Supply)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Supply)
+@receiver(post_delete, sender=Transaction)
+def invalidate_ledger_cache(sender, instance, origin=None, **kwargs):
+    if _deleted_with_store(origin):
+        return
+    store_ids = [instance.store_id]
+    previous = getattr(instance, "_ledger_previous", None)
+    if previous is not None:
+        store_ids.append(previous[0])
+    invalidate(store_ids)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_cache(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def observe_connection(sender, connection, **kwargs):
+    # У каждого потока свое соединение, обертка ставится в нем один раз,
+    # после настройки соединения, чтобы PRAGMA не шли в счет запросов.
+    if observe not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe)
@@ -1,3 +1,805 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import re
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from .aging import aging_report, allocate_fifo, reallocate_stores
+from .balances import (
+    BALANCE_FIELDS,
+    ZERO,
+    compute_daily_balances,
+    compute_store_balances,
+    recompute_daily_balances,
+    recompute_store_balances,
+    refresh_summary_lines,
+)
+from .batch import generate_acts
+from .bench import VIEW_BUDGETS, view_urls
+from .cache import stats as cache_stats
+from .closing import ClosedPeriodError, close_period
+from .db import run_query
+from .engine import ActStatement
+from .importers import LedgerImporter, read_rows
+from .jobs import claim_job, enqueue, requeue_stale, run_job
+from .middleware import MetricsMiddleware
+from .models import (
+    MANUAL_FINGERPRINT,
+    Act,
+    ArchivedSupply,
+    ArchivedTransaction,
+    Job,
+    PaymentAllocation,
+    Store,
+    StoreBalance,
+    StoreDailyBalance,
+    Summary,
+    Supply,
+    Transaction,
+    transaction_fingerprint,
+)
+from .views import (
+    ActDetailView,
+    ActPrintView,
+    AsyncActDetailView,
+    AsyncActPrintView,
+    AsyncStoreDetailView,
+    StoreDetailView,
+    search_stores,
+)
+
+User = get_user_model()
+
+LEDGER_TABLES = (
+    "acts_supply",
+    "acts_transaction",
+    "acts_archivedsupply",
+    "acts_archivedtransaction",
+    "acts_storedailybalance",
+    "acts_summaryline",
+)
+FULL_SCAN = re.compile(r"^SCAN (?P<table>\w+)(?!\w| USING)")
+
+
+class LedgerDataMixin:
+    """Пять магазинов с годом поставок и платежей, акт и сводка."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner", password="planner")
+        cls.stores = Store.objects.bulk_create(
+            [Store(name=f"Магазин {number}") for number in range(5)]
+        )
+        start = date(2024, 1, 1)
+        Supply.objects.bulk_create(
+            Supply(
+                id=str(number),
+                price=Decimal(number % 97 + 1),
+                date=start + timedelta(days=number % 365),
+                store=cls.stores[number % len(cls.stores)],
+            )
+            for number in range(1500)
+        )
+        Transaction.objects.bulk_create(
+            Transaction(
+                price=Decimal(number % 89 + 1),
+                date=start + timedelta(days=number % 365),
+                store=cls.stores[number % len(cls.stores)],
+            )
+            for number in range(1500)
+        )
+        recompute_store_balances()
+        recompute_daily_balances()
+        reallocate_stores()
+
+        store = cls.stores[0]
+        cls.act = Act.objects.create(
+            store=store, period_start=date(2024, 3, 1), period_end=date(2024, 5, 31)
+        )
+        cls.summary = Summary.objects.create(
+            period_start=date(2024, 3, 1), period_end=date(2024, 5, 31)
+        )
+        cls.summary.stores.set(cls.stores[:3])
+        refresh_summary_lines(cls.summary)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN есть только в SQLite")
+class QueryPlanTests(LedgerDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not any(table in sql for table in LEDGER_TABLES):
+                continue
+            plan = self.explain(sql)
+            for step in plan:
+                match = FULL_SCAN.match(step)
+                self.assertFalse(
+                    match and match["table"] in LEDGER_TABLES,
+                    f"Полный просмотр таблицы в {url}:\n{sql}\n{plan}",
+                )
+                # Оконная функция в SQLite всегда сортирует свой подзапрос,
+                # но это строки одного акта, выбранные по индексу.
+                if "OVER (" not in sql:
+                    self.assertNotIn(
+                        "USE TEMP B-TREE",
+                        step,
+                        f"Сортировка во временном B-дереве в {url}:\n{sql}\n{plan}",
+                    )
+
+    def test_home(self):
+        self.assert_plans_use_indexes(reverse("home"))
+
+    def test_store_detail(self):
+        self.assert_plans_use_indexes(
+            reverse("store_detail", kwargs={"pk": self.stores[0].pk})
+        )
+
+    def deep_page_url(self, name, pages=3, **params):
+        url = reverse(name)
+        query = {"page_size": 50, **params}
+        for _ in range(pages):
+            response = self.client.get(url, query)
+            query["after"] = response.context["page_obj"].next_cursor
+        self.assertIsNotNone(query["after"])
+        return f"{url}?{urlencode(query)}"
+
+    def test_store_history(self):
+        url = reverse(
+            "store_history", kwargs={"pk": self.stores[0].pk, "kind": "supply"}
+        )
+        after = self.client.get(url).context["page"].next_cursor
+        self.assert_plans_use_indexes(f"{url}?{urlencode({'after': after})}")
+
+    def test_supply_list(self):
+        self.assert_plans_use_indexes(self.deep_page_url("supply_list"))
+
+    def test_supply_list_filtered(self):
+        self.assert_plans_use_indexes(
+            self.deep_page_url(
+                "supply_list",
+                pages=1,
+                store=self.stores[1].pk,
+                date_from="2024-02-01",
+                date_to="2024-11-30",
+            )
+        )
+
+    def test_supply_list_unpaid(self):
+        self.assert_plans_use_indexes(
+            self.deep_page_url("supply_list", page_size=10, unpaid="on")
+        )
+        self.assert_plans_use_indexes(
+            self.deep_page_url(
+                "supply_list",
+                pages=1,
+                page_size=10,
+                store=self.stores[1].pk,
+                unpaid="on",
+            )
+        )
+
+    def test_supply_list_previous_page(self):
+        url = self.deep_page_url("supply_list")
+        response = self.client.get(url)
+        previous = response.context["page_obj"].previous_cursor
+        self.assert_plans_use_indexes(
+            f"{reverse('supply_list')}?{urlencode({'before': previous})}"
+        )
+
+    def test_transaction_list(self):
+        self.assert_plans_use_indexes(self.deep_page_url("transaction_list"))
+
+    def test_transaction_list_filtered(self):
+        self.assert_plans_use_indexes(
+            self.deep_page_url(
+                "transaction_list", pages=1, store=self.stores[2].pk
+            )
+        )
+
+    def test_act_detail(self):
+        self.assert_plans_use_indexes(reverse("act_detail", kwargs={"pk": self.act.pk}))
+
+    def test_act_print(self):
+        self.assert_plans_use_indexes(reverse("act_print", kwargs={"pk": self.act.pk}))
+
+    def test_summary_detail(self):
+        self.assert_plans_use_indexes(
+            reverse("summary_detail", kwargs={"pk": self.summary.pk})
+        )
+
+    def test_summary_print(self):
+        self.assert_plans_use_indexes(
+            reverse("summary_print", kwargs={"pk": self.summary.pk})
+        )
+
+    def test_api_supply_list(self):
+        url = reverse("api-supply-list")
+        for _ in range(3):
+            url = self.client.get(url, {"page_size": 50}).json()["next"]
+        self.assert_plans_use_indexes(url)
+
+    def test_api_act_statement(self):
+        self.assert_plans_use_indexes(
+            reverse("api-act-statement", kwargs={"pk": self.act.pk})
+        )
+
+    def test_aging_report(self):
+        self.assert_plans_use_indexes(
+            reverse("aging_report") + "?" + urlencode({"as_of": "2024-06-30"})
+        )
+
+    def test_act_detail_after_close(self):
+        close_period(date(2024, 3, 31))
+        self.assert_plans_use_indexes(reverse("act_detail", kwargs={"pk": self.act.pk}))
+
+    def test_store_search(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("store_search"), {"q": "маг"})
+        sql = next(
+            query["sql"]
+            for query in queries.captured_queries
+            if "name_normalized" in query["sql"]
+        )
+        plan = self.explain(sql)
+        self.assertTrue(any("store_name_normalized_idx" in step for step in plan), plan)
+
+
+class LedgerTests(LedgerDataMixin, TestCase):
+    def test_open_items_follow_ledger(self):
+        store = self.stores[2]
+        Transaction.objects.create(store=store, date=date(2024, 4, 1), price=500)
+        supply = Supply.objects.create(
+            id="100000", store=store, date=date(2024, 2, 1), price=300
+        )
+        supply.store = self.stores[3]
+        supply.save()
+        Transaction.objects.filter(store=store).order_by("date", "pk")[3].delete()
+
+        for store in self.stores[2:4]:
+            expected = allocate_fifo(
+                Supply.objects.filter(store=store)
+                .order_by("date", "pk")
+                .values_list("pk", "date", "price"),
+                Transaction.objects.filter(store=store)
+                .order_by("date", "pk")
+                .values_list("pk", "date", "price"),
+            )
+            self.assertEqual(
+                {
+                    line.pk: (line.outstanding, line.paid_date)
+                    for line in expected.lines
+                },
+                {
+                    pk: (outstanding, paid_date)
+                    for pk, outstanding, paid_date in Supply.objects.filter(
+                        store=store
+                    ).values_list("pk", "outstanding", "paid_date")
+                },
+            )
+            self.assertCountEqual(
+                expected.allocations,
+                PaymentAllocation.objects.filter(supply__store=store).values_list(
+                    "supply", "transaction", "amount"
+                ),
+            )
+
+    def test_period_close(self):
+        def act_lines():
+            statement = ActStatement(
+                self.act.store, date(2024, 1, 1), date(2024, 6, 30)
+            )
+            return [
+                (line.pk, line.date, line.balance) for line in statement
+            ], statement.balance_after
+
+        balances = StoreBalance.objects.order_by("store").values_list(
+            "store", "supply_total", "transaction_total", "debt"
+        )
+        expected = list(balances)
+        lines = act_lines()
+        aging = [row.buckets for row in aging_report(date(2024, 6, 30))]
+
+        close_period(date(2024, 3, 31))
+        self.assertTrue(ArchivedSupply.objects.exists())
+        self.assertTrue(ArchivedTransaction.objects.exists())
+        self.assertFalse(Supply.objects.filter(paid_date__lte=date(2024, 3, 31)))
+        self.assertEqual(act_lines(), lines)
+        self.assertEqual(
+            [row.buckets for row in aging_report(date(2024, 6, 30))], aging
+        )
+        recompute_store_balances()
+        recompute_daily_balances()
+        self.assertEqual(list(balances), expected)
+
+        supply = Supply.objects.filter(date__lte=date(2024, 3, 31)).first()
+        supply.price += 1
+        with self.assertRaises(ClosedPeriodError):
+            supply.save()
+        response = self.client.post(reverse("supply_delete", kwargs={"pk": supply.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Supply.objects.filter(pk=supply.pk).exists())
+
+    def test_balances_follow_ledger(self):
+        def stored():
+            balances = StoreBalance.objects.order_by("store").values_list(
+                "store", *BALANCE_FIELDS
+            )
+            return list(balances), daily(
+                StoreDailyBalance.objects.order_by("store", "date").values_list(
+                    "store", "date", "supply_total", "transaction_total"
+                )
+            )
+
+        def computed():
+            balances = sorted(compute_store_balances(), key=lambda row: row.store_id)
+            return [
+                (row.store_id, *(getattr(row, field) for field in BALANCE_FIELDS))
+                for row in balances
+            ], daily(
+                (row.store_id, row.date, row.supply_total, row.transaction_total)
+                for row in compute_daily_balances()
+            )
+
+        def daily(rows):
+            # Строка дня, из которого удалены все записи, остаётся с сальдо
+            # предыдущего дня (или нулевым); пересчёт такой строки не создаёт.
+            kept, previous = [], {}
+            for store_id, day, *totals in rows:
+                if previous.get(store_id, [ZERO, ZERO]) != totals:
+                    kept.append((store_id, day, *totals))
+                previous[store_id] = totals
+            return kept
+
+        store, other = self.stores[3], self.stores[4]
+        supply = Supply.objects.create(
+            id="100001", store=store, date=date(2023, 12, 31), price=Decimal("12.50")
+        )
+        payment = Transaction.objects.create(
+            store=store, date=date(2025, 2, 1), price=Decimal("7.25")
+        )
+        self.assertEqual(stored(), computed())
+
+        supply.store = other
+        supply.date = date(2024, 7, 15)
+        supply.price = Decimal("13.75")
+        supply.save()
+        payment.date = date(2024, 1, 1)
+        payment.save()
+        self.assertEqual(stored(), computed())
+
+        supply.delete()
+        Transaction.objects.filter(store=store, date=date(2024, 1, 1)).delete()
+        self.assertEqual(stored(), computed())
+
+        deleted = self.stores[1].pk
+        self.stores[1].delete()
+        self.assertFalse(StoreBalance.objects.filter(store_id=deleted).exists())
+        self.assertEqual(stored(), computed())
+
+    def test_closed_payment_edit(self):
+        close_period(date(2024, 3, 31))
+        payment = Transaction.objects.filter(date__lte=date(2024, 3, 31)).first()
+        response = self.client.post(
+            reverse("transaction_update", kwargs={"pk": payment.pk}),
+            {"date": "2024-04-15", "price": payment.price, "store": payment.store_id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context["form"],
+            None,
+            f"Период по 31.03.2024 закрыт, строки за {payment.date:%d.%m.%Y} "
+            "не изменяются",
+        )
+        self.assertEqual(Transaction.objects.get(pk=payment.pk).date, payment.date)
+
+    def test_aging_matches_balances(self):
+        as_of = date(2025, 1, 1)
+        debts = dict(StoreBalance.objects.values_list("store_id", "debt"))
+        for row in aging_report(as_of):
+            self.assertEqual(row.total - row.credit, debts[row.store_id])
+
+
+class PageTests(LedgerDataMixin, TestCase):
+    def test_act_conditional_get(self):
+        url = reverse("act_detail", kwargs={"pk": self.act.pk})
+        self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        acts_queries = [
+            query for query in queries.captured_queries if "acts_" in query["sql"]
+        ]
+        self.assertEqual(len(acts_queries), 1)
+
+        store = self.act.store
+        Supply.objects.create(
+            id="90001", store=store, date=date(2024, 6, 15), price=Decimal(10)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        supply = Supply.objects.filter(store=store, date__lt=date(2024, 3, 1)).first()
+        supply.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_store_page_after_close(self):
+        store = Store.objects.create(name="Закрываемый")
+        supply = Supply.objects.create(
+            id="90002", store=store, date=date(2024, 1, 10), price=Decimal(10)
+        )
+        Transaction.objects.create(store=store, date=date(2024, 1, 20), price=10)
+        url = reverse("store_detail", kwargs={"pk": store.pk})
+        link = reverse("supply_detail", kwargs={"pk": supply.pk})
+        self.assertContains(self.client.get(url), link)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            close_period(date(2024, 1, 31), [store.pk])
+        self.assertFalse(Supply.objects.filter(pk=supply.pk).exists())
+        self.assertNotContains(self.client.get(url), link)
+
+    def test_query_budgets(self):
+        urls = view_urls(self.stores[0].pk, self.act.pk, self.summary.pk)
+        for name, url in urls.items():
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(queries), VIEW_BUDGETS[name])
+
+    def test_pdf_missing_font(self):
+        url = reverse("act_print", kwargs={"pk": self.act.pk})
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+            PDF_CACHE_DIR=Path(cache_dir), PDF_FONT_PATH=f"{cache_dir}/missing.ttf"
+        ):
+            with self.assertRaisesMessage(ImproperlyConfigured, "missing.ttf"):
+                self.client.get(url, {"format": "pdf"})
+            self.assertFalse(any(Path(cache_dir).rglob("*.pdf")))
+
+    @override_settings(SQL_INSTRUMENTATION=True, SQL_SLOW_REQUEST_MS=0)
+    def test_sql_instrumentation(self):
+        # Middleware включается при загрузке цепочки, нужен новый клиент.
+        client = self.client_class()
+        client.force_login(self.user)
+        url = reverse("act_detail", kwargs={"pk": self.act.pk})
+        with self.assertLogs("acts.sql", "WARNING") as logs:
+            response = client.get(url)
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="SQL: \d+"')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["path"], url)
+        self.assertTrue(record["slowest"])
+
+
+class LedgerExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("exporter", password="exporter")
+        cls.stores = Store.objects.bulk_create(
+            [Store(name=f"Магазин {number}") for number in range(3)]
+        )
+        for number in range(30):
+            Supply.objects.create(
+                id=str(number + 1),
+                store=cls.stores[number % 3],
+                date=date(2024, 1, 1) + timedelta(days=number),
+                price=Decimal("10.50") * (number + 1),
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_supply_export_imports_back(self):
+        rows = Supply.objects.order_by("pk").values_list("pk", "store", "date", "price")
+        expected = list(rows)
+        for extension in ("csv", "xlsx"):
+            with self.subTest(extension):
+                response = self.client.get(
+                    reverse("supply_export"), {"format": extension}
+                )
+                self.assertTrue(response.streaming)
+                content = b"".join(response.streaming_content)
+
+                report = LedgerImporter("supply").run(
+                    read_rows(io.BytesIO(content), f"supplies.{extension}")
+                )
+                self.assertEqual(report.errors, [])
+                self.assertEqual((report.rows, report.imported), (30, 30))
+                self.assertEqual(list(rows), expected)
+
+
+class LedgerImportTests(TestCase):
+    def test_statement_overlapping_manual_payments(self):
+        store = Store.objects.create(name="Магазин")
+        # Форма, админка и API сохраняют платеж через save().
+        for price in (100, Decimal("100.00")):
+            Transaction.objects.create(store=store, date=date(2024, 1, 10), price=price)
+        statement = "\n".join(
+            [
+                "date;price;store",
+                "10.01.2024;100,00;Магазин",
+                "10.01.2024;100;Магазин",
+                "10.01.2024;100;Магазин",
+                "11.01.2024;50;Магазин",
+            ]
+        ).encode()
+
+        def load():
+            return LedgerImporter("transaction").run(
+                read_rows(io.BytesIO(statement), "statement.csv")
+            )
+
+        # Ручные платежи не считаются строками выписки.
+        self.assertEqual(load().imported, 4)
+        report = load()
+        self.assertEqual((report.imported, report.skipped), (0, 4))
+        self.assertEqual(Transaction.objects.count(), 6)
+        self.assertFalse(Transaction.objects.filter(fingerprint=None).exists())
+
+    def test_manual_fingerprint_follows_edits(self):
+        store = Store.objects.create(name="Магазин")
+        first, second = [
+            Transaction.objects.create(store=store, date=date(2024, 1, 10), price=100)
+            for _ in range(2)
+        ]
+        self.assertTrue(first.fingerprint.startswith(MANUAL_FINGERPRINT))
+
+        first.date = date(2024, 1, 11)
+        first.save()
+        self.assertEqual(
+            first.fingerprint,
+            transaction_fingerprint(
+                store.pk, date(2024, 1, 11), Decimal("100.00"), manual=True
+            ),
+        )
+        third = Transaction.objects.create(
+            store=store, date=date(2024, 1, 10), price=100
+        )
+        self.assertNotEqual(third.fingerprint, second.fingerprint)
+
+        statement = "date;price;store\n12.01.2024;50;Магазин".encode()
+        LedgerImporter("transaction").run(
+            read_rows(io.BytesIO(statement), "statement.csv")
+        )
+        imported = Transaction.objects.get(date=date(2024, 1, 12))
+        fingerprint = imported.fingerprint
+        imported.price = 55
+        imported.save()
+        self.assertEqual(imported.fingerprint, fingerprint)
+
+
+class StoreSearchTests(LedgerDataMixin, TestCase):
+    def test_store_search(self):
+        url = reverse("store_search")
+        response = self.client.get(url, {"q": " МАГАЗИН  3"})
+        self.assertEqual(
+            response.json()["results"], [{"id": self.stores[3].pk, "text": "Магазин 3"}]
+        )
+
+        response = self.client.get(reverse("act_create"), {"store": self.stores[1].pk})
+        self.assertContains(response, "<option", count=2)
+        self.assertContains(response, "Магазин 1")
+
+    def test_edit_forms_autocomplete(self):
+        # Список магазинов не выводится целиком, только выбранные.
+        payment = Transaction.objects.filter(store=self.stores[4]).first()
+        response = self.client.get(
+            reverse("transaction_update", kwargs={"pk": payment.pk})
+        )
+        self.assertContains(response, "data-autocomplete")
+        self.assertContains(response, "<option", count=2)
+
+        response = self.client.get(
+            reverse("summary_update", kwargs={"pk": self.summary.pk})
+        )
+        self.assertContains(response, "data-autocomplete")
+        self.assertContains(response, "<option", count=3)
+        self.assertNotContains(response, "Магазин 4")
+
+    def test_full_length_name_expands(self):
+        # 64 символа названия, 74 после casefold().
+        store = Store.objects.create(name="Straße " * 9 + "ß")
+        store.refresh_from_db()
+        self.assertEqual(store.name_normalized, "strasse " * 9 + "ss")
+        self.assertEqual(
+            [found["pk"] for found in search_stores("STRASSE STRASSE")], [store.pk]
+        )
+
+
+class JobTests(LedgerDataMixin, TestCase):
+    def test_summary_refresh_job(self):
+        self.summary.lines.all().delete()
+        response = self.client.post(
+            reverse("summary_refresh", kwargs={"pk": self.summary.pk})
+        )
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse("job_detail", kwargs={"pk": job.pk}))
+        self.assertContains(
+            self.client.get(reverse("job_status", kwargs={"pk": job.pk})),
+            "data-job-poll",
+        )
+
+        claimed = claim_job("test")
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(claim_job("other"))
+        with self.assertLogs("acts.jobs", "INFO"):
+            self.assertTrue(run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {"lines": 3})
+        self.assertEqual(self.summary.lines.count(), 3)
+        self.assertNotContains(
+            self.client.get(reverse("job_status", kwargs={"pk": job.pk})),
+            "data-job-poll",
+        )
+
+    def test_generate_acts_archive(self):
+        output = io.BytesIO()
+        start, end = date(2024, 3, 1), date(2024, 3, 31)
+        store_ids = [store.pk for store in self.stores[:2]]
+        report = generate_acts(start, end, output, store_ids=store_ids, workers=1)
+        self.assertEqual(report.acts, 2)
+        with zipfile.ZipFile(output) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 2)
+            for name in names:
+                store = Store.objects.get(pk=name.split("_")[2])
+                with self.subTest(store.name):
+                    html = archive.read(name).decode()
+                    rows = html.split("<tbody>")[1].split("</tbody>")[0]
+                    lines = list(ActStatement(store, start, end))
+                    self.assertTrue(lines)
+                    self.assertEqual(rows.count("<tr>"), len(lines))
+                    self.assertIn("Баланс на конец:", html)
+
+    def test_result_needs_ownership(self):
+        summary = Summary.objects.create(
+            period_start=date(2024, 1, 1), period_end=date(2024, 1, 31)
+        )
+        job = enqueue("refresh_summary", {"summary_id": summary.pk})
+        lost = claim_job("first")
+        # Первый воркер пропал, задачу вернули в очередь и отдали второму.
+        Job.objects.filter(pk=job.pk).update(
+            heartbeat=timezone.now() - timedelta(hours=1)
+        )
+        requeue_stale()
+        claimed = claim_job("second")
+        self.assertEqual(claimed.pk, job.pk)
+
+        with self.assertLogs("acts.jobs", "WARNING"):
+            self.assertFalse(run_job(lost))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.RUNNING, "second"))
+
+        with self.assertLogs("acts.jobs", "INFO"):
+            self.assertTrue(run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+
+class AsyncPageTests(TransactionTestCase):
+    """
+    Страницы под ASYNC_VIEWS: запросы идут в отдельных соединениях,
+    поэтому данные теста закоммичены.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("async", password="async")
+        self.store = Store.objects.create(name="Магазин")
+        Supply.objects.create(
+            id="1", store=self.store, date=date(2024, 1, 10), price=Decimal(100)
+        )
+        Transaction.objects.create(
+            store=self.store, date=date(2024, 1, 20), price=Decimal(40)
+        )
+        self.act = Act.objects.create(
+            store=self.store,
+            period_start=date(2024, 1, 1),
+            period_end=date(2024, 1, 31),
+        )
+
+    async def auser(self):
+        return self.user
+
+    def get(self, view, pk, etag=None):
+        headers = {"if-none-match": etag} if etag else {}
+        if iscoroutinefunction(view.get):
+            request = AsyncRequestFactory().get("/", headers=headers)
+            request.auser = self.auser
+            response = async_to_sync(view.as_view())(request, pk=pk)
+        else:
+            request = RequestFactory().get("/", headers=headers)
+            request.user = self.user
+            response = view.as_view()(request, pk=pk)
+        if response.status_code == 200:
+            response.render()
+        return response
+
+    def test_conditional_get(self):
+        pages = (
+            (StoreDetailView, AsyncStoreDetailView, self.store.pk),
+            (ActDetailView, AsyncActDetailView, self.act.pk),
+            (ActPrintView, AsyncActPrintView, self.act.pk),
+        )
+        etags = {}
+        for view, async_view, pk in pages:
+            with self.subTest(view=async_view.__name__):
+                page = self.get(view, pk)
+                hits = cache_stats()["page"]["hits"]
+                async_page = self.get(async_view, pk)
+                self.assertEqual(async_page.status_code, 200)
+                # Фрагмент, отрисованный синхронной страницей, взят из кэша.
+                self.assertEqual(cache_stats()["page"]["hits"], hits + 1)
+                for header in ("ETag", "Last-Modified"):
+                    self.assertEqual(async_page[header], page[header])
+                for current in (view, async_view):
+                    response = self.get(current, pk, page["ETag"])
+                    self.assertEqual(response.status_code, 304)
+                etags[async_view] = page["ETag"]
+
+        Supply.objects.create(
+            id="2", store=self.store, date=date(2024, 1, 15), price=Decimal(10)
+        )
+        for view, async_view, pk in pages:
+            with self.subTest(view=async_view.__name__, changed=True):
+                async_page = self.get(async_view, pk, etags[async_view])
+                self.assertEqual(async_page.status_code, 200)
+                self.assertEqual(async_page["ETag"], self.get(view, pk)["ETag"])
+
+    async def test_metrics_count_thread_queries(self):
+        async def view(request):
+            await asyncio.gather(
+                run_query(Store.objects.count), run_query(Act.objects.count)
+            )
+            await Supply.objects.acount()
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        labels = {"view": "unresolved"}
+        before = REGISTRY.get_sample_value("acts_request_queries_sum", labels) or 0
+        await middleware(AsyncRequestFactory().get("/"))
+        after = REGISTRY.get_sample_value("acts_request_queries_sum", labels)
+        self.assertEqual(after - before, 3)
@@ -1,48 +1,92 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
+    AsyncActDetailView,
+    AsyncActPrintView,
+    AsyncHomePage,
+    AsyncStoreDetailView,
     ActCreateView,
     ActDeleteView,
     ActDetailView,
+    ActExportView,
     ActListView,
     ActPrintView,
     ActUpdateView,
+    AgingPrintView,
+    AgingReportView,
     HomePage,
+    JobDetailView,
+    JobListView,
+    JobOutputView,
+    JobStatusView,
+    LedgerImportView,
+    MetricsView,
     StoreCreateView,
     StoreDeleteView,
     StoreDetailView,
+    StoreHistoryView,
     StoreListView,
+    StoreSearchView,
     StoreUpdateView,
     SummaryCreateView,
     SummaryDeleteView,
     SummaryDetailView,
+    SummaryExportView,
     SummaryListView,
     SummaryPrintView,
+    SummaryRefreshView,
     SummaryUpdateView,
     SupplyCreateView,
     SupplyDeleteView,
     SupplyDetailView,
+    SupplyExportView,
     SupplyListView,
     SupplyUpdateView,
     TransactionCreateView,
     TransactionDeleteView,
     TransactionDetailView,
+    TransactionExportView,
     TransactionListView,
     TransactionUpdateView,
 )
 
+# С ASYNC_VIEWS страницы с независимыми агрегатами отдают async-представления,
+# которые выполняют эти запросы одновременно.
+
 urlpatterns = [
-    path("", HomePage.as_view(), name="home"),
+    path(
+        "", (AsyncHomePage if settings.ASYNC_VIEWS else HomePage).as_view(), name="home"
+    ),
     path("act_list", ActListView.as_view(), name="act_list"),
-    path("act_detail/<int:pk>/", ActDetailView.as_view(), name="act_detail"),
+    path(
+        "act_detail/<int:pk>/",
+        (AsyncActDetailView if settings.ASYNC_VIEWS else ActDetailView).as_view(),
+        name="act_detail",
+    ),
     path("act_update/<int:pk>/", ActUpdateView.as_view(), name="act_update"),
     path("act_delete/<int:pk>/", ActDeleteView.as_view(), name="act_delete"),
     path("act_create", ActCreateView.as_view(), name="act_create"),
-    path("act_print/<int:pk>/", ActPrintView.as_view(), name="act_print"),
+    path(
+        "act_print/<int:pk>/",
+        (AsyncActPrintView if settings.ASYNC_VIEWS else ActPrintView).as_view(),
+        name="act_print",
+    ),
+    path("act_export/<int:pk>/", ActExportView.as_view(), name="act_export"),
     path("stores", StoreListView.as_view(), name="stores"),
+    path("stores/search", StoreSearchView.as_view(), name="store_search"),
     path("store_create", StoreCreateView.as_view(), name="store_create"),
     path("store_update/<int:pk>/", StoreUpdateView.as_view(), name="store_update"),
-    path("store/<int:pk>/", StoreDetailView.as_view(), name="store_detail"),
+    path(
+        "store/<int:pk>/",
+        (AsyncStoreDetailView if settings.ASYNC_VIEWS else StoreDetailView).as_view(),
+        name="store_detail",
+    ),
+    path(
+        "store/<int:pk>/history/<slug:kind>/",
+        StoreHistoryView.as_view(),
+        name="store_history",
+    ),
     path("store_delete/<int:pk>/", StoreDeleteView.as_view(), name="store_delete"),
     path("summary_create", SummaryCreateView.as_view(), name="summary_create"),
     path("summary/<int:pk>/", SummaryDetailView.as_view(), name="summary_detail"),
@@ -54,11 +98,20 @@ urlpatterns = [
     ),
     path("summary_list", SummaryListView.as_view(), name="summary_list"),
     path("summary/<int:pk>/print/", SummaryPrintView.as_view(), name="summary_print"),
+    path(
+        "summary/<int:pk>/export/", SummaryExportView.as_view(), name="summary_export"
+    ),
+    path(
+        "summary/<int:pk>/refresh/",
+        SummaryRefreshView.as_view(),
+        name="summary_refresh",
+    ),
     path("supplies", SupplyListView.as_view(), name="supply_list"),
     path("supply_detail/<int:pk>/", SupplyDetailView.as_view(), name="supply_detail"),
     path("supply_delete/<int:pk>/", SupplyDeleteView.as_view(), name="supply_delete"),
     path("supply_update/<int:pk>/", SupplyUpdateView.as_view(), name="supply_update"),
     path("supply_create", SupplyCreateView.as_view(), name="supply_create"),
+    path("supply_export", SupplyExportView.as_view(), name="supply_export"),
     path("transaction_list", TransactionListView.as_view(), name="transaction_list"),
     path(
         "transaction_detail/<int:pk>/",
@@ -78,4 +131,15 @@ urlpatterns = [
     path(
         "transaction_create", TransactionCreateView.as_view(), name="transaction_create"
     ),
+    path(
+        "transaction_export", TransactionExportView.as_view(), name="transaction_export"
+    ),
+    path("ledger_import", LedgerImportView.as_view(), name="ledger_import"),
+    path("jobs", JobListView.as_view(), name="job_list"),
+    path("job/<int:pk>/", JobDetailView.as_view(), name="job_detail"),
+    path("job/<int:pk>/status/", JobStatusView.as_view(), name="job_status"),
+    path("job/<int:pk>/output/", JobOutputView.as_view(), name="job_output"),
+    path("aging", AgingReportView.as_view(), name="aging_report"),
+    path("aging/print/", AgingPrintView.as_view(), name="aging_print"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
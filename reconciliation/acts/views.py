@@ -1,46 +1,270 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import DecimalField, F, Sum, Value
-from django.db.models.functions import Coalesce
+from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.views.decorators.http import condition
 from django.views.generic import (
     CreateView,
     DeleteView,
     DetailView,
+    FormView,
     ListView,
     TemplateView,
     UpdateView,
+    View,
 )
-
-from .forms import ActForm, StoreForm, SummaryForm, SupplyForm, TransactionForm
-from .models import Act, Store, Summary, Supply, Transaction
+from django.views.generic.base import TemplateResponseMixin
+from django.views.generic.detail import SingleObjectMixin
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from .aging import AGING_BUCKETS, aging_report
+from .balances import (
+    ZERO,
+    balance_annotations,
+    ledger_state,
+    ledger_version,
+    refresh_summary_lines,
+)
+from .cache import acached, acached_html, cached, cached_html
+from .closing import ClosedPeriodError
+from .db import run_query
+from .engine import ActStatement
+from .exports import (
+    ACT_HEADER,
+    ITERATOR_CHUNK_SIZE,
+    SUMMARY_HEADER,
+    SUPPLY_HEADER,
+    TRANSACTION_HEADER,
+    act_rows,
+    export_response,
+    ledger_rows,
+    summary_rows,
+)
+from .forms import (
+    ActForm,
+    AgingReportForm,
+    LedgerFilterForm,
+    LedgerImportForm,
+    StoreForm,
+    SummaryForm,
+    SupplyFilterForm,
+    SupplyForm,
+    TransactionForm,
+)
+from .jobs import enqueue, job_file, save_upload
+from .metrics import render_metrics
+from .models import (
+    Act,
+    Job,
+    Store,
+    StoreBalance,
+    Summary,
+    SummaryLine,
+    Supply,
+    Transaction,
+    normalize_name,
+)
+from .pagination import KeysetPaginationMixin, keyset_page
+from .pdf import cached_pdf, document_key, render_act_pdf, render_summary_pdf
 
 User = get_user_model()
 
+STORE_HISTORY_PAGE_SIZE = 20
+STORE_SEARCH_LIMIT = 20
+# Больше любого символа, который может идти в названии после префикса.
+PREFIX_END = "\U0010ffff"
+STORE_HISTORY = {
+    "supply": (Supply, ("date", "pk")),
+    "transaction": (Transaction, ("date", "pk")),
+    "act": (Act, ("pk",)),
+}
+STORE_HISTORY_TITLES = (
+    ("supply", "Поставки"),
+    ("transaction", "Поступления средств"),
+    ("act", "Акты сверки"),
+)
+
+
+def store_history_page(store_id, kind, after=None):
+    model, keyset = STORE_HISTORY[kind]
+    return keyset_page(
+        model.objects.filter(store_id=store_id),
+        keyset,
+        STORE_HISTORY_PAGE_SIZE,
+        after=after,
+        descending=True,
+    )
+
+
+class LedgerFilterMixin:
+    filter_form_class = LedgerFilterForm
+
+    def filter_ledger(self, queryset):
+        form = self.filter_form_class(self.request.GET)
+        if not form.is_valid():
+            return queryset
+        return form.filter(queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filter_form"] = self.filter_form_class(self.request.GET)
+        return context
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """
+    ``LoginRequiredMixin`` для async-представлений: пользователь читается
+    через ``request.auser()``, а не синхронным ``request.user``.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(
+                request.get_full_path(),
+                self.get_login_url(),
+                self.get_redirect_field_name(),
+            )
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def latest(*moments):
+    return max((moment for moment in moments if moment is not None), default=None)
+
+
+class ConditionalPageMixin:
+    """
+    Условный GET страницы объекта.
+
+    Объект выбирается одним запросом вместе с отпечатком данных страницы,
+    ``get_validator`` возвращает из него версию и время изменения. По ним
+    ``condition`` отвечает 304 без рендера. Часть страницы из
+    ``fragment_template_name`` не зависит от пользователя и хранится в
+    кэше готовым HTML под той же версией, в шаблон она попадает как
+    ``fragment``.
+    """
+
+    fragment_template_name = None
+
+    def get_validator(self):
+        raise NotImplementedError
+
+    def get_fragment_context(self):
+        return {}
+
+    def get_etag(self, request, *args, **kwargs):
+        # В странице имя пользователя и CSRF-токен его сессии.
+        return document_key(
+            self.page_key, request.user.pk, request.META.get("CSRF_COOKIE")
+        )
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return self.last_modified
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return self.conditional(self.render_page)(request, *args, **kwargs)
+
+    def conditional(self, render_page):
+        version, self.last_modified = self.get_validator()
+        self.page_key = document_key(self.fragment_template_name, *version)
+        return condition(
+            etag_func=self.get_etag, last_modified_func=self.get_last_modified
+        )(render_page)
+
+    def render_page(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["fragment"] = cached_html(
+            self.page_key,
+            lambda: render_to_string(
+                self.fragment_template_name, self.get_fragment_context()
+            ),
+        )
+        return context
+
+
+class AsyncConditionalPageMixin(ConditionalPageMixin):
+    """
+    ``ConditionalPageMixin`` для async-представлений: тот же валидатор,
+    ETag и кэш фрагмента, а данные фрагмента собираются корутиной
+    ``get_fragment_context``.
+    """
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_page_context(self, fragment):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(self.get_queryset(), pk=kwargs["pk"])
+        return await self.conditional(self.render_page)(request, *args, **kwargs)
+
+    async def render_page(self, request, *args, **kwargs):
+        fragment = await acached_html(self.page_key, self.render_fragment)
+        return self.render_to_response(self.get_page_context(fragment))
+
+    async def render_fragment(self):
+        return render_to_string(
+            self.fragment_template_name, await self.get_fragment_context()
+        )
+
+
+def dashboard_stores():
+    return list(
+        Store.objects.annotate(**balance_annotations()).values("pk", "name", "debt")
+    )
+
+
+def dashboard_total_debt():
+    return StoreBalance.objects.aggregate(total=Sum("debt"))["total"]
+
+
+def dashboard_context(stores, total_debt):
+    return {"stores": stores, "store_count": len(stores), "total_debt": total_debt}
+
 
 class HomePage(LoginRequiredMixin, TemplateView):
     template_name = "pages/index.html"
     login_url = "/accounts/login/"
 
+    def get_dashboard(self):
+        return dashboard_context(dashboard_stores(), dashboard_total_debt())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        qs = Store.objects.annotate(
-            supply_total=Coalesce(
-                Sum("supply__price"), Value(0, output_field=DecimalField())
-            ),
-            transaction_total=Coalesce(
-                Sum("transaction__price"), Value(0, output_field=DecimalField())
-            ),
-        ).annotate(debt=F("supply_total") - F("transaction_total"))
-        total_debt = qs.aggregate(
-            total=Sum(F("supply_total") - F("transaction_total"))
-        )["total"]
-        context["stores"] = qs
-        context["store_count"] = len(context["stores"])
-        context["total_debt"] = total_debt
+        context.update(cached("home", self.get_dashboard))
         return context
 
 
+class AsyncHomePage(AsyncLoginRequiredMixin, TemplateResponseMixin, View):
+    template_name = "pages/index.html"
+    login_url = "/accounts/login/"
+
+    async def get_dashboard(self):
+        stores, total_debt = await asyncio.gather(
+            run_query(dashboard_stores), run_query(dashboard_total_debt)
+        )
+        return dashboard_context(stores, total_debt)
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(await acached("home", self.get_dashboard))
+
+
 class StoreCreateView(LoginRequiredMixin, CreateView):
     model = Store
     form_class = StoreForm
@@ -53,6 +277,13 @@ class StoreDeleteView(LoginRequiredMixin, DeleteView):
     model = Store
     success_url = reverse_lazy("stores")
 
+    def form_valid(self, form):
+        # Каскад по всему леджеру магазина выполняется в фоновой задаче.
+        job = enqueue(
+            "delete_store", {"store_id": self.object.pk}, user=self.request.user
+        )
+        return redirect("job_detail", pk=job.pk)
+
 
 class StoreUpdateView(LoginRequiredMixin, UpdateView):
     model = Store
@@ -63,52 +294,163 @@ class StoreUpdateView(LoginRequiredMixin, UpdateView):
         return reverse_lazy("store_detail", kwargs={"pk": self.object.pk})
 
 
-class StoreDetailView(LoginRequiredMixin, DetailView):
+def store_balance(store_id):
+    balance = StoreBalance.objects.filter(store_id=store_id).first()
+    return {
+        "debt": balance.debt if balance else 0,
+        "supply_total": balance.supply_total if balance else 0,
+        "transaction_total": balance.transaction_total if balance else 0,
+    }
+
+
+def store_page_state():
+    acts = Act.objects.filter(store=OuterRef("pk")).order_by().values("store")
+    return {
+        "ledger_version": F("balance__version"),
+        "ledger_updated": F("balance__updated_at"),
+        "act_count": Subquery(acts.annotate(value=Count("pk")).values("value")),
+        "act_updated": Subquery(acts.annotate(value=Max("updated_at")).values("value")),
+    }
+
+
+class StorePageMixin(ConditionalPageMixin):
     model = Store
+    fragment_template_name = "partials/store_ledger.html"
+
+    def get_queryset(self):
+        return Store.objects.annotate(**store_page_state())
+
+    def get_validator(self):
+        store = self.object
+        version = (
+            store.pk,
+            store.updated_at,
+            store.ledger_version,
+            store.act_count,
+            store.act_updated,
+        )
+        return version, latest(
+            store.updated_at, store.ledger_updated, store.act_updated
+        )
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
 
-        store_with_stats = (
-            Store.objects.filter(pk=self.object.pk)
-            .annotate(
-                supply_total=Coalesce(
-                    Sum("supply__price"), Value(0, output_field=DecimalField())
-                ),
-                transaction_total=Coalesce(
-                    Sum("transaction__price"), Value(0, output_field=DecimalField())
-                ),
-            )
-            .annotate(debt=F("supply_total") - F("transaction_total"))
-            .first()
+class StoreDetailView(StorePageMixin, LoginRequiredMixin, DetailView):
+    def get_balance(self):
+        return store_balance(self.object.pk)
+
+    def get_fragment_context(self):
+        return {
+            "store": self.object,
+            **cached("store", self.get_balance, store_id=self.object.pk),
+            "history": [
+                (kind, title, store_history_page(self.object.pk, kind))
+                for kind, title in STORE_HISTORY_TITLES
+            ],
+        }
+
+
+class AsyncStoreDetailView(
+    StorePageMixin,
+    AsyncConditionalPageMixin,
+    AsyncLoginRequiredMixin,
+    TemplateResponseMixin,
+    View,
+):
+    template_name = "acts/store_detail.html"
+
+    async def get_balance(self, store_id):
+        return await run_query(store_balance, store_id)
+
+    async def get_fragment_context(self):
+        store = self.object
+        balance, *pages = await asyncio.gather(
+            acached("store", partial(self.get_balance, store.pk), store_id=store.pk),
+            *(
+                run_query(store_history_page, store.pk, kind)
+                for kind, _ in STORE_HISTORY_TITLES
+            ),
+        )
+        return {
+            "store": store,
+            **balance,
+            "history": [
+                (kind, title, page)
+                for (kind, title), page in zip(STORE_HISTORY_TITLES, pages)
+            ],
+        }
+
+    def get_page_context(self, fragment):
+        return {"object": self.object, "store": self.object, "fragment": fragment}
+
+
+class StoreHistoryView(LoginRequiredMixin, View):
+    def get(self, request, pk, kind):
+        if kind not in STORE_HISTORY:
+            raise Http404("Неизвестный раздел истории")
+        page = store_history_page(pk, kind, after=request.GET.get("after"))
+        return render(
+            request,
+            "partials/store_history.html",
+            {"store_id": pk, "kind": kind, "page": page},
         )
 
-        context.update(
+
+def search_stores(term, limit=STORE_SEARCH_LIMIT):
+    """
+    Первые ``limit`` магазинов, нормализованное название которых начинается
+    с ``term``; для числа первым идет магазин с таким ID.
+
+    SQLite не берет индекс для LIKE без NOCASE, поэтому префикс задается
+    там диапазоном строк. PostgreSQL ищет LIKE по индексу с pattern_ops.
+    """
+    prefix = normalize_name(term)
+    if not prefix:
+        return []
+    if connection.vendor == "sqlite":
+        match = Q(name_normalized__gte=prefix, name_normalized__lt=prefix + PREFIX_END)
+    else:
+        match = Q(name_normalized__startswith=prefix)
+    stores = list(
+        Store.objects.filter(match)
+        .order_by("name_normalized", "pk")
+        .values("pk", "name")[:limit]
+    )
+    if prefix.isdigit():
+        exact = Store.objects.filter(pk=int(prefix)).values("pk", "name").first()
+        if exact is not None and exact not in stores:
+            stores = [exact, *stores[: limit - 1]]
+    return stores
+
+
+class StoreSearchView(LoginRequiredMixin, View):
+    """Поиск магазинов для полей выбора магазина."""
+
+    def get(self, request):
+        stores = search_stores(request.GET.get("q", ""))
+        return JsonResponse(
             {
-                "debt": store_with_stats.debt,
-                "supply_total": store_with_stats.supply_total
-                if store_with_stats
-                else 0,
-                "transaction_total": store_with_stats.transaction_total
-                if store_with_stats
-                else 0,
+                "results": [
+                    {"id": store["pk"], "text": store["name"]} for store in stores
+                ]
             }
         )
-        return context
 
 
-class StoreListView(LoginRequiredMixin, ListView):
+class StoreListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Store
     context_object_name = "stores"
-    ordering = "id"
-    paginate_by = 10
 
 
-class SupplyListView(LoginRequiredMixin, ListView):
+class SupplyListView(
+    LoginRequiredMixin, LedgerFilterMixin, KeysetPaginationMixin, ListView
+):
     model = Supply
-    ordering = "date"
+    keyset = ("date", "pk")
     context_object_name = "supplies"
-    paginate_by = 10
+    filter_form_class = SupplyFilterForm
+
+    def get_queryset(self):
+        return self.filter_ledger(super().get_queryset())
 
 
 class SupplyDetailView(LoginRequiredMixin, DetailView):
@@ -147,16 +489,30 @@ class SupplyCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy("supply_detail", kwargs={"pk": self.object.id})
 
 
-class SupplyDeleteView(LoginRequiredMixin, DeleteView):
+class LedgerDeleteView(LoginRequiredMixin, DeleteView):
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ClosedPeriodError as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
+
+
+class SupplyDeleteView(LedgerDeleteView):
     model = Supply
     success_url = reverse_lazy("supply_list")
 
 
-class TransactionListView(LoginRequiredMixin, ListView):
+class TransactionListView(
+    LoginRequiredMixin, LedgerFilterMixin, KeysetPaginationMixin, ListView
+):
     model = Transaction
-    ordering = "date"
+    queryset = Transaction.objects.select_related("store")
+    keyset = ("date", "pk")
     context_object_name = "transactions"
-    paginate_by = 10
+
+    def get_queryset(self):
+        return self.filter_ledger(super().get_queryset())
 
 
 class TransactionDetailView(LoginRequiredMixin, DetailView):
@@ -166,7 +522,7 @@ class TransactionDetailView(LoginRequiredMixin, DetailView):
 
 class TransactionUpdateView(LoginRequiredMixin, UpdateView):
     model = Transaction
-    fields = "__all__"
+    form_class = TransactionForm
 
     success_url = reverse_lazy("transaction_list")
 
@@ -195,13 +551,21 @@ class TransactionCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy("transaction_detail", kwargs={"pk": self.object.pk})
 
 
-class TransactionDeleteView(LoginRequiredMixin, DeleteView):
+class TransactionDeleteView(LedgerDeleteView):
     model = Transaction
     success_url = reverse_lazy("transaction_list")
     template_name = "acts/transaction_confirm_delete.html"
 
 
-class SummaryCreateView(LoginRequiredMixin, CreateView):
+class SummaryLinesMixin:
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            refresh_summary_lines(self.object)
+        return response
+
+
+class SummaryCreateView(LoginRequiredMixin, SummaryLinesMixin, CreateView):
     model = Summary
     form_class = SummaryForm
     template_name = "acts/summary_form.html"
@@ -210,71 +574,108 @@ class SummaryCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy("summary_detail", kwargs={"pk": self.object.pk})
 
 
-class SummaryUpdateView(LoginRequiredMixin, UpdateView):
+class SummaryUpdateView(LoginRequiredMixin, SummaryLinesMixin, UpdateView):
     model = Summary
-    fields = "__all__"
+    form_class = SummaryForm
     success_url = reverse_lazy("summary_list")
 
     def get_success_url(self):
         return reverse_lazy("summary_detail", kwargs={"pk": self.object.pk})
 
 
+class SummaryRefreshView(LoginRequiredMixin, SingleObjectMixin, View):
+    model = Summary
+
+    def post(self, request, *args, **kwargs):
+        summary = self.get_object()
+        job = enqueue("refresh_summary", {"summary_id": summary.pk}, user=request.user)
+        return redirect("job_detail", pk=job.pk)
+
+
 class SummaryDeleteView(LoginRequiredMixin, DeleteView):
     model = Summary
     success_url = reverse_lazy("summary_list")
 
 
-class SummaryListView(LoginRequiredMixin, ListView):
+class SummaryListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Summary
     context_object_name = "summaries"
-    ordering = "id"
-    paginate_by = 10
 
 
-class SummaryViewMixin:
-    context_object_name = "summary"
+class PdfPrintMixin:
+    """
+    Печатная форма в PDF по ``?format=pdf``.
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    Документ берется из дискового кэша по ключу из входных данных и версии
+    леджера, поэтому повторная печать не выполняет запросов к леджеру.
+    """
 
-        stores_list = list(
-            Store.objects.annotate(
-                supply_total=Coalesce(
-                    Sum("supply__price"), Value(0, output_field=DecimalField())
-                ),
-                transaction_total=Coalesce(
-                    Sum("transaction__price"), Value(0, output_field=DecimalField())
-                ),
-            )
-            .annotate(debt=F("supply_total") - F("transaction_total"))
-            .values("id", "name", "supply_total", "transaction_total", "debt")
-            .order_by("-debt")
-        )
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("format") != "pdf":
+            return super().get(request, *args, **kwargs)
+        self.object = self.get_object()
+        path = cached_pdf(self.get_pdf_key(), self.render_pdf)
+        return FileResponse(path.open("rb"), filename=self.get_pdf_filename())
 
-        total_supply = sum(store["supply_total"] for store in stores_list)
-        total_transaction = sum(store["transaction_total"] for store in stores_list)
-        total_debt = sum(store["debt"] for store in stores_list)
 
-        context.update(
-            {
-                "stores": stores_list,
-                "total_supply": total_supply,
-                "total_transaction": total_transaction,
-                "total_debt": total_debt,
-            }
-        )
-        return context
+class SummaryViewMixin:
+    context_object_name = "summary"
+
+    def get_lines(self):
+        return self.object.lines.select_related("store").order_by("-closing_balance")
+
+    def get_summary_data(self):
+        lines = list(self.get_lines())
+        return {
+            "lines": lines,
+            "total_opening": sum(line.opening_balance for line in lines),
+            "total_supply": sum(line.supply_total for line in lines),
+            "total_transaction": sum(line.transaction_total for line in lines),
+            "total_closing": sum(line.closing_balance for line in lines),
+        }
 
 
 class SummaryDetailView(
+    ConditionalPageMixin,
     SummaryViewMixin,
     LoginRequiredMixin,
     DetailView,
 ):
     model = Summary
+    fragment_template_name = "partials/summary_lines.html"
+
+    def get_queryset(self):
+        lines = SummaryLine.objects.filter(summary=OuterRef("pk")).order_by()
+        stores = Store.objects.filter(summaries=OuterRef("pk")).order_by()
+        return Summary.objects.annotate(
+            line_count=Subquery(
+                lines.values("summary").annotate(value=Count("pk")).values("value")
+            ),
+            stores_updated=Subquery(
+                stores.values("summaries")
+                .annotate(value=Max("updated_at"))
+                .values("value")
+            ),
+        )
+
+    def get_validator(self):
+        summary = self.object
+        version = (
+            summary.pk,
+            summary.period_start,
+            summary.period_end,
+            summary.updated_at,
+            summary.line_count,
+            summary.stores_updated,
+        )
+        return version, latest(summary.updated_at, summary.stores_updated)
+
+    def get_fragment_context(self):
+        return self.get_summary_data()
 
 
 class SummaryPrintView(
+    PdfPrintMixin,
     SummaryViewMixin,
     LoginRequiredMixin,
     DetailView,
@@ -282,6 +683,36 @@ class SummaryPrintView(
     model = Summary
     template_name = "acts/summary_print.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_summary_data())
+        return context
+
+    def get_pdf_key(self):
+        summary = self.object
+        lines = self.get_lines().values_list(
+            "store_id",
+            "store__name",
+            "opening_balance",
+            "supply_total",
+            "transaction_total",
+            "closing_balance",
+        )
+        return document_key(
+            "summary",
+            summary.pk,
+            summary.date,
+            summary.period_start,
+            summary.period_end,
+            list(lines),
+        )
+
+    def get_pdf_filename(self):
+        return f"summary_{self.object.pk}.pdf"
+
+    def render_pdf(self):
+        return render_summary_pdf(self.object, **self.get_summary_data())
+
 
 class ActCreateView(LoginRequiredMixin, CreateView):
     model = Act
@@ -319,127 +750,263 @@ class ActDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy("act_list")
 
 
-class ActListView(LoginRequiredMixin, ListView):
+class ActListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Act
     context_object_name = "acts"
-    ordering = "id"
-    paginate_by = 10
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        store = self.request.GET.get("store")
+        if store and store.isdigit():
+            queryset = queryset.filter(store_id=store)
+        return queryset
+
+
+def act_statement_context(act, statement):
+    return {
+        "events": statement,
+        "total_supply": statement.total_supply,
+        "total_transaction": statement.total_transaction,
+        "balance_before": statement.balance_before,
+        "balance_after": statement.balance_after,
+        "debt": statement.debt,
+        "overpayment": statement.overpayment,
+        "store": act.store,
+    }
 
 
-class ActViewMixin:
+class ActViewMixin(ConditionalPageMixin):
     model = Act
+    queryset = Act.objects.select_related("store").annotate(**ledger_state())
     template_name = "act_detail.html"
     context_object_name = "act"
 
+    def get_validator(self):
+        act = self.object
+        version = (
+            act.pk,
+            act.updated_at,
+            act.store.updated_at,
+            act.supply_count,
+            act.supply_updated,
+            act.transaction_count,
+            act.transaction_updated,
+            act.closed_through,
+        )
+        modified = latest(
+            act.updated_at,
+            act.store.updated_at,
+            act.supply_updated,
+            act.transaction_updated,
+        )
+        return version, modified
+
+    def get_fragment_context(self):
+        act = self.object
+        statement = ActStatement(act.store, act.period_start, act.period_end)
+        return {"act": act, **act_statement_context(act, statement)}
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        act = self.get_object()
-
-        supplies = Supply.objects.filter(
-            store=act.store, date__gte=act.period_start, date__lte=act.period_end
-        ).order_by("date")
-
-        transactions = Transaction.objects.filter(
-            store=act.store, date__gte=act.period_start, date__lte=act.period_end
-        ).order_by("date")
-
-        events = []
-
-        for supply in supplies:
-            events.append(
-                {
-                    "type": "supply",
-                    "date": supply.date,
-                    "supply_amount": supply.price,
-                    "transaction_amount": None,
-                    "supply": supply,
-                    "transaction": None,
-                    "balance": None,
-                }
-            )
+        context["store"] = self.object.store
+        return context
 
-        for transaction in transactions:
-            events.append(
-                {
-                    "type": "transaction",
-                    "date": transaction.date,
-                    "supply_amount": None,
-                    "transaction_amount": transaction.price,
-                    "supply": None,
-                    "transaction": transaction,
-                    "balance": None,
-                }
-            )
 
-        events.sort(key=lambda x: x["date"])
-
-        balance = 0
-        for event in events:
-            if event["type"] == "supply":
-                balance += event["supply_amount"]
-            else:
-                balance -= event["transaction_amount"]
-            event["balance"] = balance
-
-        total_supply = (
-            supplies.aggregate(
-                total=Coalesce(Sum("price"), 0, output_field=DecimalField())
-            )["total"]
-            or 0
+class AsyncActViewMixin(
+    ActViewMixin,
+    AsyncConditionalPageMixin,
+    AsyncLoginRequiredMixin,
+    TemplateResponseMixin,
+):
+    async def get_fragment_context(self):
+        act = self.object
+        statement = await ActStatement.aload(
+            act.store, act.period_start, act.period_end
         )
+        return {"act": act, **act_statement_context(act, statement)}
+
+    def get_page_context(self, fragment):
+        act = self.object
+        return {"object": act, "act": act, "store": act.store, "fragment": fragment}
+
+
+class ActDetailView(ActViewMixin, LoginRequiredMixin, DetailView):
+    model = Act
+    template_name = "acts/act_detail.html"
+    fragment_template_name = "partials/act_statement.html"
+
+
+class AsyncActDetailView(AsyncActViewMixin, View):
+    template_name = "acts/act_detail.html"
+    fragment_template_name = "partials/act_statement.html"
 
-        total_transaction = (
-            transactions.aggregate(
-                total=Coalesce(Sum("price"), 0, output_field=DecimalField())
-            )["total"]
-            or 0
-        )
 
-        supply_before = (
-            Supply.objects.filter(store=act.store, date__lt=act.period_start).aggregate(
-                total=Coalesce(Sum("price"), 0, output_field=DecimalField())
-            )["total"]
-            or 0
+class ActPrintView(PdfPrintMixin, ActViewMixin, LoginRequiredMixin, DetailView):
+    model = Act
+    template_name = "acts/act_print.html"
+    fragment_template_name = "partials/act_print_statement.html"
+
+    def get_pdf_key(self):
+        act = self.object
+        return document_key(
+            "act",
+            act.store_id,
+            act.store.name,
+            act.date,
+            act.period_start,
+            act.period_end,
+            ledger_version(act.store_id),
         )
 
-        transaction_before = (
-            Transaction.objects.filter(
-                store=act.store, date__lt=act.period_start
-            ).aggregate(total=Coalesce(Sum("price"), 0, output_field=DecimalField()))[
-                "total"
-            ]
-            or 0
+    def get_pdf_filename(self):
+        return f"act_{self.object.pk}.pdf"
+
+    def render_pdf(self):
+        act = self.object
+        return render_act_pdf(
+            act, ActStatement(act.store, act.period_start, act.period_end)
         )
 
-        balance_before = supply_before - transaction_before
 
-        balance_after = balance_before + total_supply - total_transaction
+class AsyncActPrintView(AsyncActViewMixin, View):
+    template_name = "acts/act_print.html"
+    fragment_template_name = "partials/act_print_statement.html"
 
-        debt = max(balance_after, 0)
+    async def get(self, request, pk):
+        if request.GET.get("format") == "pdf":
+            # PDF берется из дискового кэша, его выдает синхронное представление.
+            return await sync_to_async(ActPrintView.as_view())(request, pk=pk)
+        return await super().get(request, pk=pk)
 
-        overpayment = abs(min(balance_after, 0))
 
+class AgingReportMixin:
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = AgingReportForm(self.request.GET)
+        as_of = form.cleaned_data["as_of"] if form.is_valid() else None
+        as_of = as_of or timezone.localdate()
+        rows = aging_report(as_of)
         context.update(
             {
-                "events": events,
-                "total_supply": total_supply,
-                "total_transaction": total_transaction,
-                "balance_before": balance_before,
-                "balance_after": balance_after,
-                "debt": debt,
-                "overpayment": overpayment,
-                "store": act.store,
+                "form": form,
+                "as_of": as_of,
+                "rows": rows,
+                "bucket_titles": [title for title, _ in AGING_BUCKETS],
+                "bucket_totals": [
+                    sum((row.buckets[index] for row in rows), ZERO)
+                    for index in range(len(AGING_BUCKETS))
+                ],
+                "total": sum((row.total for row in rows), ZERO),
+                "total_credit": sum((row.credit for row in rows), ZERO),
             }
         )
-
         return context
 
 
-class ActDetailView(ActViewMixin, LoginRequiredMixin, DetailView):
-    model = Act
-    template_name = "acts/act_detail.html"
+class AgingReportView(LoginRequiredMixin, AgingReportMixin, TemplateView):
+    template_name = "acts/aging_report.html"
 
 
-class ActPrintView(ActViewMixin, LoginRequiredMixin, DetailView):
-    model = Act
-    template_name = "acts/act_print.html"
+class AgingPrintView(LoginRequiredMixin, AgingReportMixin, TemplateView):
+    template_name = "acts/aging_print.html"
+
+
+class LedgerImportView(LoginRequiredMixin, FormView):
+    form_class = LedgerImportForm
+    template_name = "acts/ledger_import.html"
+
+    def form_valid(self, form):
+        upload = form.cleaned_data["file"]
+        job = enqueue(
+            "import_ledger",
+            {
+                "kind": form.cleaned_data["kind"],
+                "path": save_upload(upload),
+                "filename": upload.name,
+            },
+            user=self.request.user,
+        )
+        return redirect("job_detail", pk=job.pk)
+
+
+class JobListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    model = Job
+    context_object_name = "jobs"
+    keyset_descending = True
+
+    def get_queryset(self):
+        return Job.objects.defer("params", "result", "error")
+
+
+class JobDetailView(LoginRequiredMixin, DetailView):
+    model = Job
+
+
+class JobStatusView(LoginRequiredMixin, DetailView):
+    """Карточка состояния задачи, которую страница задачи опрашивает."""
+
+    model = Job
+    template_name = "partials/job_status.html"
+
+
+class JobOutputView(LoginRequiredMixin, SingleObjectMixin, View):
+    model = Job
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != Job.DONE or not job.output:
+            raise Http404("У задачи нет файла результата")
+        try:
+            stream = open(job_file(job), "rb")
+        except FileNotFoundError:
+            raise Http404("Файл результата удален")
+        return FileResponse(stream, as_attachment=True, filename=job.output)
+
+
+class ActExportView(LoginRequiredMixin, SingleObjectMixin, View):
+    queryset = Act.objects.select_related("store")
+
+    def get(self, request, *args, **kwargs):
+        act = self.get_object()
+        statement = ActStatement(act.store, act.period_start, act.period_end)
+        return export_response(
+            request, f"act_{act.pk}", ACT_HEADER, act_rows(statement)
+        )
+
+
+class SummaryExportView(LoginRequiredMixin, SingleObjectMixin, View):
+    model = Summary
+
+    def get(self, request, *args, **kwargs):
+        summary = self.get_object()
+        lines = (
+            summary.lines.select_related("store")
+            .order_by("-closing_balance")
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        return export_response(
+            request, f"summary_{summary.pk}", SUMMARY_HEADER, summary_rows(lines)
+        )
+
+
+class SupplyExportView(LoginRequiredMixin, LedgerFilterMixin, View):
+    filter_form_class = SupplyFilterForm
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_ledger(Supply.objects.all())
+        return export_response(
+            request, "supplies", SUPPLY_HEADER, ledger_rows(queryset)
+        )
+
+
+class TransactionExportView(LoginRequiredMixin, LedgerFilterMixin, View):
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_ledger(Transaction.objects.all())
+        return export_response(
+            request, "transactions", TRANSACTION_HEADER, ledger_rows(queryset)
+        )
+
+
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
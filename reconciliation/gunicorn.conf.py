@@ -0,0 +1,20 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+# Метрики воркеров пишутся в файлы PROMETHEUS_MULTIPROC_DIR и суммируются
+# при опросе /metrics любым воркером.
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Файлы прошлого запуска исказили бы счетчики.
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -38,10 +40,13 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "rest_framework",
     "acts.apps.ActsConfig",
 ]
 
 MIDDLEWARE = [
+    "acts.middleware.MetricsMiddleware",
+    "acts.middleware.SQLInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -71,16 +76,152 @@ TEMPLATES = [
 WSGI_APPLICATION = "reconciliation.wsgi.application"
 
 
+# Async-представления для главной, магазина и актов. Включается при запуске
+# под ASGI-сервером (uvicorn), под WSGI каждый такой запрос поднимал бы
+# собственный цикл событий.
+
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "0") == "1"
+
+
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# Профиль выбирается переменной DB_PROFILE:
+# sqlite — SQLite в режиме WAL, под WSGI с постоянными соединениями,
+# sqlite-plain — SQLite без настроек, для сравнения в bench_concurrency,
+# postgres — PostgreSQL, с пулом соединений при DB_POOL_MAX_SIZE > 0.
+# Под ASGI постоянные соединения не используются: sync-код там выполняется
+# в потоках, и соединения, открытые вне цикла запроса, не закрывались бы.
+
+DB_PROFILE = os.getenv("DB_PROFILE", "sqlite")
+DB_CONN_MAX_AGE = 0 if ASYNC_VIEWS else int(os.getenv("DB_CONN_MAX_AGE", 600))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 0))
+
+if DB_PROFILE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "reconciliation"),
+            "USER": os.getenv("DB_USER", "postgres"),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            # Пул сам держит соединения, вместе с ним CONN_MAX_AGE должен быть 0.
+            "CONN_MAX_AGE": 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": (
+                {
+                    "pool": {
+                        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+                        "max_size": DB_POOL_MAX_SIZE,
+                    }
+                }
+                if DB_POOL_MAX_SIZE
+                else {}
+            ),
+        }
+    }
+elif DB_PROFILE == "sqlite-plain":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DB_NAME", BASE_DIR / "db.sqlite3"),
+        }
+    }
+elif DB_PROFILE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            # Транзакция сразу берет блокировку записи и ждет ее по busy_timeout,
+            # а не падает с "database is locked" при повышении чтения до записи.
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Неизвестный DB_PROFILE: {DB_PROFILE}")
+
+# Применяются к каждому новому соединению SQLite в acts.signals.
+SQLITE_PRAGMAS = (
+    {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 20000)),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024)),
+    }
+    if DB_PROFILE == "sqlite"
+    else {}
+)
+
+
+# Cache
+# locmem хранит кэш в памяти процесса, file разделяет его между воркерами gunicorn
+# и воркерами фоновых задач: run_workers с locmem не запускается.
+
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+}
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": CACHE_BACKENDS[os.getenv("CACHE_BACKEND", "locmem")],
+        "LOCATION": os.getenv("CACHE_LOCATION", str(BASE_DIR / "cache")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 10000))},
     }
 }
 
+ACTS_CACHE_TIMEOUT = int(os.getenv("ACTS_CACHE_TIMEOUT", 3600))
+
+
+# API
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+    ],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    "DEFAULT_PAGINATION_CLASS": "acts.pagination.KeysetCursorPagination",
+}
+
+API_BULK_MAX_ROWS = int(os.getenv("API_BULK_MAX_ROWS", 20000))
+
+
+# Замеры SQL и рендеринга каждого запроса: заголовок Server-Timing и лог
+# acts.sql. Запросы дольше SQL_SLOW_REQUEST_MS пишутся вместе с текстом
+# SQL_SLOWEST_COUNT самых медленных запросов.
+
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "0") == "1"
+SQL_SLOW_REQUEST_MS = float(os.getenv("SQL_SLOW_REQUEST_MS", 500))
+SQL_SLOWEST_COUNT = int(os.getenv("SQL_SLOWEST_COUNT", 5))
+
+# Метрики Prometheus на /metrics. Под gunicorn с несколькими воркерами
+# задайте PROMETHEUS_MULTIPROC_DIR, его очищает gunicorn.conf.py.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "acts.sql": {
+            "handlers": ["console"],
+            "level": os.getenv("SQL_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+        "acts.jobs": {
+            "handlers": ["console"],
+            "level": os.getenv("JOB_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -121,3 +262,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, "backend_static")
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
+
+# Печать актов и сводок в PDF
+# Шрифт должен содержать кириллицу, в Docker-образе это пакет fonts-dejavu-core.
+# Вне образа укажите пути к своим файлам шрифта через переменные окружения.
+
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", BASE_DIR / "pdf_cache"))
+PDF_FONT_PATH = os.getenv(
+    "PDF_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+PDF_FONT_BOLD_PATH = os.getenv(
+    "PDF_FONT_BOLD_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+)
+
+# Фоновые задачи: очередь в таблице acts_job, воркеры запускает
+# "manage.py run_workers". Файлы загрузок и результатов лежат в JOBS_DIR.
+# Пока задача выполняется, воркер отмечается в ней раз в JOB_HEARTBEAT_SECONDS.
+# Задача без отметки дольше JOB_STALE_SECONDS считается брошенной
+# и возвращается в очередь; повтор после ошибки — через JOB_RETRY_DELAY
+# секунд, удваиваясь с каждой попыткой.
+
+JOBS_DIR = Path(os.getenv("JOBS_DIR", BASE_DIR / "jobs"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", 60))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", 30))